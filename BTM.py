@@ -1,22 +1,155 @@
 # Interpreter for the version of the Binary Turing Machine!? programming language used by
 # the Chessoteric programming language
 # Created by Jamie Large in 2022
+import argparse
+import mmap
+import os
+import re
 import sys
-from Machine import Machine
+from contextlib import nullcontext
+from functools import partial
+from analyzer import analyze_machine, optimize
+from checkpoint import CHECKPOINT_INTERVAL, load_checkpoint, open_output, run_with_checkpoints
+from Machine import BudgetExceeded, Machine, ENGINES
+from machine_io import MachineIO
+from stats import Stats, write_stats
 
-def process_code(code):
+# A line of a program that is a plain command, as bytes, with its payload and annotation (see
+# Machine.COMMAND)
+COMMAND_LINE = re.compile(rb"1*0*1?([01]*)(!!|\?\?|!|\?)\r?(?:\n|\Z)")
+
+# With a Stats, these functions record the time spent in each phase and what the machine did
+# (see stats.py)
+
+def process_code(code, engine="compiled", io=None, stats=None):
+	m = load_code(code, stats)
+	m.run_machine(engine, io, stats=stats)
+	return m
+
+# Load the machine of a program given as its lines
+def load_code(code, stats=None):
 	m = Machine()
+	process_command = m.process_command
+	if stats is not None:
+		process_command = partial(stats.timed, "process_command", m.process_command)
 	for line in code:
-		m.process_command(line)
+		process_command(line)
+	process_command("FLUSH")
+	return m
+
+# Load the commands in data, the bytes of a program, into the Machine m. Each line is matched
+# where it starts, and its payload added to m directly. Lines that are not plain commands (such as
+# FLUSH, or a line that is not a command at all) are given to process_command.
+def load_bytes(m, data):
+	match_line = COMMAND_LINE.match
+	add_payload = m.add_payload
+	position = 0
+	end = len(data)
+	while position < end:
+		match = match_line(data, position)
+		if match is not None:
+			add_payload(match.group(1).decode(), match.group(2).decode())
+			position = match.end()
+			continue
+		line_end = data.find(b"\n", position)
+		if line_end < 0:
+			line_end = end
+		m.process_command(data[position:line_end].rstrip(b"\r").decode())
+		position = line_end + 1
+
+# Load the machine of the program in the file at path, which is mapped into memory and scanned
+# in a single pass
+def load_file(path, stats=None):
+	m = Machine()
+	with open(path, "rb") as f:
+		# An empty file cannot be mapped
+		if os.fstat(f.fileno()).st_size == 0:
+			data = b""
+		elif stats is None:
+			data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		else:
+			with stats.phase("parse"):
+				data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		# The map is closed once nothing refers to it (the matches of a failed load may still)
+		if stats is None:
+			load_bytes(m, data)
+		else:
+			stats.timed("process_command", load_bytes, m, data)
 	m.process_command("FLUSH")
+	return m
 
-	m.run_machine()
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Interpreter for Binary Turing Machine!? programs")
+	parser.add_argument("file", nargs="?", help="program to run (read from stdin if omitted)")
+	parser.add_argument("--engine", choices=ENGINES, default="compiled",
+	                    help="run the machine compiled into Python code, compiled with macro steps for "
+	                         "repeated cycles of rules, looked up in tables of interned states and symbols, "
+	                         "or interpreted as a reference")
+	parser.add_argument("--input", metavar="FILE",
+	                    help="read the input state's lines from FILE instead of stdin")
+	parser.add_argument("--binary", action="store_true",
+	                    help="write output symbols as raw bytes, and read input lines as bytes")
+	parser.add_argument("--analyze", action="store_true",
+	                    help="print an analysis of the machine's rules to stderr and exit without running it")
+	parser.add_argument("--optimize", action="store_true",
+	                    help="drop the rules the machine can never apply and merge equivalent states before "
+	                         "running it, warning of states in which it may never halt")
+	parser.add_argument("--tape-memory", action="store_true",
+	                    help="print the memory used by the tape to stderr after the program halts")
+	parser.add_argument("--stats", action="store_true",
+	                    help="print timings of each phase and statistics on the machine's run to stderr")
+	parser.add_argument("--stats-json", metavar="FILE",
+	                    help="write the timings and statistics to FILE as JSON")
+	parser.add_argument("--output", metavar="FILE",
+	                    help="write the output to FILE instead of stdout")
+	parser.add_argument("--max-steps", type=int, metavar="N",
+	                    help="stop the machine after N steps")
+	parser.add_argument("--time-limit", type=float, metavar="SECONDS",
+	                    help="stop the machine after it has run for SECONDS")
+	parser.add_argument("--checkpoint", metavar="FILE",
+	                    help="save the machine's state, tape and place in its input and output to FILE "
+	                         "while it runs and when it is stopped")
+	parser.add_argument("--checkpoint-interval", type=float, default=CHECKPOINT_INTERVAL, metavar="SECONDS",
+	                    help="seconds between checkpoints (default: %(default)g)")
+	parser.add_argument("--resume", action="store_true",
+	                    help="continue the run saved in the checkpoint, if there is one")
+	args = parser.parse_args()
+	if args.resume and args.checkpoint is None:
+		parser.error("--resume needs --checkpoint")
+	stats = Stats() if args.stats or args.stats_json else None
+	resumed = load_checkpoint(args.checkpoint) if args.resume else None
+	checkpoint = None
+	output = None
+	machine = None
 
-if len(sys.argv) > 1:
-	with open(sys.argv[1], "r") as f:
-		process_code([line[:-1] for line in f.readlines()])
-else:
-	str_buf = []
-	for line in sys.stdin:
-		str_buf.append(line)
-	process_code(str_buf)
\ No newline at end of file
+	try:
+		if resumed is not None:
+			machine, checkpoint = resumed
+		elif args.file is not None:
+			machine = load_file(args.file, stats)
+		else:
+			machine = load_code([line.rstrip("\n") for line in sys.stdin], stats)
+		if args.analyze:
+			print("\n".join(analyze_machine(machine).report()), file=sys.stderr)
+			sys.exit()
+		# A resumed machine was optimized before it started, if it was going to be
+		if args.optimize and resumed is None:
+			with stats.phase("optimize") if stats is not None else nullcontext():
+				analysis = optimize(machine)
+			for warning in analysis.warnings():
+				print(warning, file=sys.stderr)
+		if args.output is not None:
+			output = open_output(args.output, args.binary, checkpoint)
+		io = MachineIO(open(args.input, "rb") if args.input else None, output, binary=args.binary)
+		run_with_checkpoints(machine, args.engine, io, stats, args.max_steps, args.time_limit,
+		                     args.checkpoint, args.checkpoint_interval, checkpoint)
+	except BudgetExceeded as e:
+		sys.exit(str(e))
+	finally:
+		if output is not None:
+			output.close()
+		if stats is not None:
+			write_stats(stats, args.stats, args.stats_json)
+		# Runs stopped by their budget are reported too, as their tapes may be the largest
+		if args.tape_memory and machine is not None:
+			print(f"Tape memory: {machine.tape.memory_usage()} bytes in {len(machine.tape.pages)} pages", file=sys.stderr)
@@ -1,53 +1,214 @@
 # Interpreter for the chessoteric programming language
 # Created by Jamie Large in 2022
+import argparse
 import sys
+from contextlib import nullcontext
+from functools import partial
+from io import BytesIO, StringIO
 from chess_game import *
-from Machine import Machine
-
-def play_game(code):
-	words = code.split()
-	for i in range(len(words)):
-		if i % 3 == 0 and i != len(words) - 1:
-			if not words[i][:-1].isnumeric() or words[i][-1] != '.' or int(words[i][:-1]) != i / 3 + 1:
-				raise SyntaxError(f"Incorrect number: {words[i]}")
-	if words[-1] not in ('1-0', '0-1', '1/2-1/2'):
-		raise SyntaxError(f"Invalid ending: {words[-1]}")
-
-	moves = [words[i] for i in range(len(words)) if i % 3 != 0]
-	if moves[-1] in ('1-0', '0-1', '1/2-1/2'):
-		moves = moves[:-1]
-
-	Board, pieces, turn = initialize_game()
+from pgn import PGNDatabase, game_words, read_game, read_words, read_moves
+from cache import ProgramCache, CACHE_DIRECTORY
+from analyzer import analyze_machine, optimize
+from checkpoint import CHECKPOINT_INTERVAL, load_checkpoint, open_output, run_with_checkpoints
+from Machine import BudgetExceeded, Machine, ENGINES
+from machine_io import MachineIO
+from stats import Stats, write_stats
+
+# The functions that play games and run programs take an optional Stats, which they fill in
+# with the time spent in each phase and what the machine did (see stats.py)
+
+def play_game(code, engine="compiled", io=None, stats=None):
+	return play_stream(StringIO(code), engine, io, stats)
+
+# Play the game read from stream, then run the program it encodes
+def play_stream(stream, engine="compiled", io=None, stats=None):
+	mach = load_game(read_words(stream), stats)
+	mach.run_machine(engine, io, stats=stats)
+	return mach
+
+# Play the game in the file at path, then run the program it encodes
+def play_file(path, engine="compiled", io=None, cache=None, stats=None):
+	mach = load_file(path, cache, stats)
+	mach.run_machine(engine, io, stats=stats)
+	return mach
+
+# Load the machine encoded by the game in the file at path. With a ProgramCache, a program
+# that has been loaded before is taken from the cache without simulating its game.
+def load_file(path, cache=None, stats=None):
+	if cache is None:
+		with open(path, "r") as f:
+			return load_game(read_words(f), stats)
+	with open(path, "rb") as f:
+		key = cache.key(f) if stats is None else stats.timed("cache", cache.key, f)
+	mach = cache.load(key) if stats is None else stats.timed("cache", cache.load, key)
+	if mach is None:
+		with open(path, "r") as f:
+			mach = load_game(read_words(f), stats)
+		if stats is None:
+			cache.store(key, mach)
+		else:
+			stats.timed("cache", cache.store, key, mach)
+	return mach
+
+# Load the machine encoded by the game in source, the bytes of a program, using a ProgramCache as
+# load_file does
+def load_source(source, cache=None):
+	if cache is None:
+		return load_game(read_words(StringIO(source.decode("utf-8"))))
+	key = cache.key(BytesIO(source))
+	mach = cache.load(key)
+	if mach is None:
+		mach = load_game(read_words(StringIO(source.decode("utf-8"))))
+		cache.store(key, mach)
+	return mach
+
+# Load the machine encoded by the game between the byte offsets start and end of the PGN database
+# at path (see pgn.py), using a ProgramCache as load_file does
+def load_database_game(path, start, end, cache=None, stats=None):
+	source = read_game(path, start, end)
+	if cache is None:
+		return load_game(game_words(source.decode("utf-8", "replace")), stats)
+	# Games of a database are read differently from programs, so they are cached apart from them
+	stream = BytesIO(b"pgn\n" + source)
+	key = cache.key(stream) if stats is None else stats.timed("cache", cache.key, stream)
+	mach = cache.load(key) if stats is None else stats.timed("cache", cache.load, key)
+	if mach is None:
+		mach = load_game(game_words(source.decode("utf-8", "replace")), stats)
+		if stats is None:
+			cache.store(key, mach)
+		else:
+			stats.timed("cache", cache.store, key, mach)
+	return mach
+
+# Load the machine encoded by a game, simulating each move as its words arrive
+def load_game(words, stats=None):
+	position = Position()
 	# turn_number = 0.5
 
 	mach = Machine()
+	moves = read_moves(words)
+	move_maker = position.play
+	process_bits = mach.process_bits
+	if stats is not None:
+		moves = stats.timed_iterator("parse", moves)
+		move_maker = partial(stats.timed, "make_move", position.play)
+		process_bits = partial(stats.timed, "process_command", mach.process_bits)
+		hits, misses = POSITION_CACHE.hits, POSITION_CACHE.misses
 
 	for move in moves:
 		# turn_number += 0.5
-		Board, end_symbol, mate = make_move(move, Board, pieces, turn)
+		end_symbol, mate = move_maker(move)
+		# The moves of a program are never taken back
+		position.undo.clear()
 		if end_symbol != "":
-			mach.process_command(board_to_string(Board) + end_symbol)
-			
-		turn = 'w' if turn == 'b' else 'b'
-		# print_board(Board, turn, int(turn_number))
+			bits, length = position.Board.color_bits()
+			process_bits(bits, length, end_symbol)
+		# print_board(position.Board, position.turn, int(turn_number))
 
 	mach.process_command("FLUSH")
-	mach.run_machine()
+	if stats is not None:
+		stats.add_positions(POSITION_CACHE.hits - hits, POSITION_CACHE.misses - misses)
+	return mach
 
+# The string of a board sent to the Machine as a text command: for each piece, from a1 to h8, 1 if
+# it is white or 0 if it is black (see BitBoard.color_bits). Looked up for boards that have come
+# up recently.
 def board_to_string(Board):
-	output = ""
-	for i in range(8):
-		for j in range(8):
-			if Board[i][j] is not None:
-				output += '1' if Board[i][j].name[0] == 'w' else '0'
-	return output
-
-
-if len(sys.argv) > 1:
-	with open(sys.argv[1], "r") as f:
-		play_game(f.read())
-else:
-	str_buf = []
-	for line in sys.stdin:
-		str_buf.append(line)
-	play_game(''.join(str_buf))
\ No newline at end of file
+	position = POSITION_CACHE.get(Board)
+	if position.board_string is None:
+		white = Board.colors['w']
+		position.board_string = ''.join('1' if (white >> square) & 1 else '0' for square in squares(Board.occupied))
+	return position.board_string
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Interpreter for the chessoteric programming language")
+	parser.add_argument("file", nargs="?", help="program to run (read from stdin if omitted)")
+	parser.add_argument("--game", type=int, metavar="N",
+	                    help="run the Nth game (counting from 1) of the file, read as a database of games in "
+	                         "standard PGN with tag pairs and comments")
+	parser.add_argument("--engine", choices=ENGINES, default="compiled",
+	                    help="run the machine compiled into Python code, compiled with macro steps for "
+	                         "repeated cycles of rules, looked up in tables of interned states and symbols, "
+	                         "or interpreted as a reference")
+	parser.add_argument("--input", metavar="FILE",
+	                    help="read the input state's lines from FILE instead of stdin")
+	parser.add_argument("--binary", action="store_true",
+	                    help="write output symbols as raw bytes, and read input lines as bytes")
+	parser.add_argument("--no-cache", action="store_true",
+	                    help="always simulate the game instead of using the cache of loaded programs")
+	parser.add_argument("--cache-dir", default=CACHE_DIRECTORY, metavar="DIR",
+	                    help="directory of the cache of loaded programs")
+	parser.add_argument("--analyze", action="store_true",
+	                    help="print an analysis of the machine's rules to stderr and exit without running it")
+	parser.add_argument("--optimize", action="store_true",
+	                    help="drop the rules the machine can never apply and merge equivalent states before "
+	                         "running it, warning of states in which it may never halt")
+	parser.add_argument("--tape-memory", action="store_true",
+	                    help="print the memory used by the tape to stderr after the program halts")
+	parser.add_argument("--stats", action="store_true",
+	                    help="print timings of each phase and statistics on the machine's run to stderr")
+	parser.add_argument("--stats-json", metavar="FILE",
+	                    help="write the timings and statistics to FILE as JSON")
+	parser.add_argument("--output", metavar="FILE",
+	                    help="write the output to FILE instead of stdout")
+	parser.add_argument("--max-steps", type=int, metavar="N",
+	                    help="stop the machine after N steps")
+	parser.add_argument("--time-limit", type=float, metavar="SECONDS",
+	                    help="stop the machine after it has run for SECONDS")
+	parser.add_argument("--checkpoint", metavar="FILE",
+	                    help="save the machine's state, tape and place in its input and output to FILE "
+	                         "while it runs and when it is stopped")
+	parser.add_argument("--checkpoint-interval", type=float, default=CHECKPOINT_INTERVAL, metavar="SECONDS",
+	                    help="seconds between checkpoints (default: %(default)g)")
+	parser.add_argument("--resume", action="store_true",
+	                    help="continue the run saved in the checkpoint, if there is one")
+	args = parser.parse_args()
+	if args.resume and args.checkpoint is None:
+		parser.error("--resume needs --checkpoint")
+	if args.game is not None and args.file is None:
+		parser.error("--game needs a file")
+	stats = Stats() if args.stats or args.stats_json else None
+	resumed = load_checkpoint(args.checkpoint) if args.resume else None
+	checkpoint = None
+	output = None
+	machine = None
+
+	try:
+		if resumed is not None:
+			machine, checkpoint = resumed
+		elif args.game is not None:
+			games = PGNDatabase(args.file).games
+			if not 1 <= args.game <= len(games):
+				sys.exit(f"No game {args.game} in {args.file}, which has {len(games)} games")
+			cache = None if args.no_cache else ProgramCache(args.cache_dir)
+			machine = load_database_game(args.file, *games[args.game - 1], cache, stats)
+		elif args.file is not None:
+			cache = None if args.no_cache else ProgramCache(args.cache_dir)
+			machine = load_file(args.file, cache, stats)
+		else:
+			machine = load_game(read_words(sys.stdin), stats)
+		if args.analyze:
+			print("\n".join(analyze_machine(machine).report()), file=sys.stderr)
+			sys.exit()
+		# A resumed machine was optimized before it started, if it was going to be
+		if args.optimize and resumed is None:
+			with stats.phase("optimize") if stats is not None else nullcontext():
+				analysis = optimize(machine)
+			for warning in analysis.warnings():
+				print(warning, file=sys.stderr)
+		if args.output is not None:
+			output = open_output(args.output, args.binary, checkpoint)
+		io = MachineIO(open(args.input, "rb") if args.input else None, output, binary=args.binary)
+		run_with_checkpoints(machine, args.engine, io, stats, args.max_steps, args.time_limit,
+		                     args.checkpoint, args.checkpoint_interval, checkpoint)
+	except BudgetExceeded as e:
+		sys.exit(str(e))
+	finally:
+		if output is not None:
+			output.close()
+		if stats is not None:
+			write_stats(stats, args.stats, args.stats_json)
+		# Runs stopped by their budget are reported too, as their tapes may be the largest
+		if args.tape_memory and machine is not None:
+			print(f"Tape memory: {machine.tape.memory_usage()} bytes in {len(machine.tape.pages)} pages", file=sys.stderr)
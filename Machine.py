@@ -1,127 +1,318 @@
 # Machine for the chessoteric programming language
 # Created by Jamie Large in 2022
-BLANK = 0
+import re
+import time
+from machine_io import MachineIO
+from stats import RUN_BUCKETS
+from tape import BLANK, Tape
+
 INITIAL_STATE = 0
 INPUT_STATE = 1
 OUTPUT_STATE = 2
+# Ways to run the machine: compiled into Python code, compiled with repeated cycles of rules
+# applied as macro steps, looked up in flat tables of interned states and symbols, or interpreted
+# rule by rule as a reference
+ENGINES = ("compiled", "accelerated", "table", "interpreted")
+# Number of steps between checks of the time limit of a Budget
+CHECK_INTERVAL = 1 << 16
+
+# Raised when a machine runs out of its Budget before halting
+class BudgetExceeded(Exception):
+	def __init__(self, message, steps):
+		super().__init__(message)
+		self.steps = steps
+
+class StepLimitExceeded(BudgetExceeded):
+	pass
+
+class TimeLimitExceeded(BudgetExceeded):
+	pass
+
+# Limits on the number of steps and the time (in seconds) a machine may run for. A step is one rule
+# applied, or one symbol read or written by the input or output state. With a Checkpointer (see
+# checkpoint.py), the run is also saved whenever a checkpoint is due when the Budget is checked,
+# and before the run is stopped for going over the Budget.
+class Budget:
+	def __init__(self, max_steps=None, time_limit=None, interval=CHECK_INTERVAL, checkpointer=None):
+		self.max_steps = max_steps
+		self.time_limit = time_limit
+		self.interval = interval
+		self.checkpointer = checkpointer
+		self.deadline = None
+
+	# Start the clock for a run that has already taken steps steps, returning the number of steps
+	# after which to call check
+	def start(self, steps=0):
+		if self.time_limit is not None:
+			self.deadline = time.monotonic() + self.time_limit
+		return steps
+
+	# Raise if the machine, having taken steps steps and not halted, is out of budget, or else
+	# return the number of steps after which to call check again. The machine is in state with its
+	# head at index head of the tape.
+	def check(self, steps, state=None, head=None):
+		exceeded = None
+		if self.max_steps is not None and steps >= self.max_steps:
+			exceeded = StepLimitExceeded(f"Step limit of {self.max_steps} reached", steps)
+		elif self.deadline is not None and time.monotonic() >= self.deadline:
+			exceeded = TimeLimitExceeded(f"Time limit of {self.time_limit} seconds reached", steps)
+		if self.checkpointer is not None and (exceeded is not None or self.checkpointer.due()):
+			self.checkpointer.save(state, head, steps)
+		if exceeded is not None:
+			raise exceeded
+		if self.max_steps is not None:
+			return min(steps + self.interval, self.max_steps)
+		return steps + self.interval
+
+# A command: the colors of the pieces, then an annotation. Its payload follows the leading 1s, the
+# 0s after them and the first 1 after those.
+COMMAND = re.compile(r"1*0*1?([01]*)(!!|\?\?|!|\?)")
+# A command annotated ?! or !? is a new part of a rule or a new input (by its last symbol) whose
+# payload ends with the other symbol, so that it is not a number
+MIXED_COMMAND = re.compile(r"1*0*1?([01]*[?!])([?!])")
+# The annotations of commands, and those of mixed commands
+ANNOTATIONS = ("!", "?", "!!", "??")
+MIXED_ANNOTATIONS = ("!?", "?!")
+
+# The number whose binary digits are those of parts, in order. Parts are strings of digits (from
+# commands given as text), or (value, number of digits) pairs (from commands given as bits), which
+# are joined in pairs so that a long number is not shifted once for each part.
+def _join_payload(parts):
+	if len(parts) == 1:
+		part = parts[0]
+		return part[0] if type(part) is tuple else int(part, 2)
+	if parts and all(type(part) is tuple for part in parts):
+		while len(parts) > 1:
+			joined = [((high << low_length) | low, high_length + low_length)
+			          for (high, high_length), (low, low_length) in zip(parts[0::2], parts[1::2])]
+			parts = joined + parts[-1:] if len(parts) % 2 else joined
+		return parts[0][0]
+	if all(type(part) is str for part in parts):
+		return int(''.join(parts), 2)
+	return int(''.join(part if type(part) is str else format(part[0], f"0{part[1]}b") for part in parts), 2)
 
 class Machine:
 	def __init__(self):
-		self.tape = []
+		self.tape = Tape()
 		self.rules = {}
+		# The parts of the rule being read, and the input being read. The part and the input still
+		# being read are lists of their payloads, joined and converted once they are complete, so
+		# that continuing them takes time in proportion to the payload.
 		self.current_rule = []
 		self.current_input = None
+		self.compiled = {}
+		# The RuleTable of a run of the table engine, whose tape holds interned symbols meanwhile
+		self.table = None
 
 	def process_command(self, command):
 		if command == "FLUSH":
 			# flush rule if it is complete
 			if len(self.current_rule) == 5:
-				self.current_rule[-1] = int(self.current_rule[-1], 2)
+				self.current_rule[-1] = _join_payload(self.current_rule[-1])
 				self.rules[(self.current_rule[0], self.current_rule[1])] = (self.current_rule[2], self.current_rule[3], self.current_rule[4])
 				self.current_rule = []
+				self.compiled = {}
 			# flush input if it exists
 			if self.current_input:
-				input_value = int(self.current_input, 2)
+				input_value = _join_payload(self.current_input)
 				self.tape.append(input_value)
 			return
 
-		if len(command) < 1 or command[-1] not in ("?", "!") or (len(command) >= 2 and command[-2] not in ("0", "1", "?", "!")) \
-		   or not all(c == "0" or c == "1" for c in command[:-2]):
+		match = COMMAND.fullmatch(command) or MIXED_COMMAND.fullmatch(command)
+		if match is None:
 			raise SyntaxError("Invalid command: " + command);
+		self.add_payload(match.group(1), match.group(2))
 
-		i = 0
-		# Skip over leading 1s then leading 0s
-		while (command[i] == "1"):
-			i += 1
-		while (command[i] == "0"):
-			i += 1
-		# Skip over first 1
-		if (command[i] == "1"):
-			i += 1
-
-		if command[-1] == "!":
+	# Process the command whose pieces' colors are the length binary digits of bits (the first
+	# piece is the highest digit) and whose annotation is kind, as process_command does for the
+	# string of those digits followed by kind, without making that string
+	def process_bits(self, bits, length, kind):
+		# Skip the leading 1s, the 0s after them and the first 1 after those
+		length = (~bits & ((1 << length) - 1)).bit_length()
+		bits &= (1 << length) - 1
+		length = max(bits.bit_length() - 1, 0)
+		bits &= (1 << length) - 1
+		if kind in ANNOTATIONS:
+			self.add_payload((bits, length) if length else "", kind)
+		elif kind in MIXED_ANNOTATIONS:
+			# The payload of a mixed command is not a number, so it is kept as text
+			self.add_payload((format(bits, f"0{length}b") if length else "") + kind[0], kind[1])
+		else:
+			raise SyntaxError(f"Invalid command annotation: {kind}")
+
+	# Add the payload of a command with the annotation end_symbol: a string of binary digits, or a
+	# (value, number of digits) pair
+	def add_payload(self, payload, end_symbol):
+		if end_symbol[0] == "!":
 			# Continue rule
-			if len(command) >= 2 and command[-2] == "!":
-				command = command[:-2]
+			if len(end_symbol) == 2:
 				# make sure there is a part of rule to continue
 				if len(self.current_rule) == 0:
 					raise SyntaxError("No part of rule to continue")
-				self.current_rule[-1] += command[i:]
-				
+				if payload:
+					self.current_rule[-1].append(payload)
+
 			# New part of rule
-			else: 
-				command = command[:-1]
+			else:
 				# convert previous part of rule to an int
 				if len(self.current_rule) > 0:
-					self.current_rule[-1] = int(self.current_rule[-1], 2)
+					self.current_rule[-1] = _join_payload(self.current_rule[-1])
 				# if the previous rule is now complete, add it to the rules
 				if len(self.current_rule) == 5:
 					self.rules[(self.current_rule[0], self.current_rule[1])] = (self.current_rule[2], self.current_rule[3], self.current_rule[4])
 					self.current_rule = []
+					self.compiled = {}
 				# Add this to the rule
-				self.current_rule.append(command[i:])
-		
-		elif command[-1] == "?":
+				self.current_rule.append([payload] if payload else [])
+
+		else:
 			# Continue input
-			if len(command) >= 2 and command[-2] == "?":
-				command = command[:-2]
+			if len(end_symbol) == 2:
 				# make sure there is input to continue
 				if not self.current_input:
 					raise SyntaxError("No input to continue")
-				self.current_input += command[i:]
+				if payload:
+					self.current_input.append(payload)
 
 			# New input
 			else:
-				command = command[:-1]
 				# flush input if it exists
 				if self.current_input:
-					input_value = int(self.current_input, 2)
+					input_value = _join_payload(self.current_input)
 					self.tape.append(input_value)
 				# Set the current input
-				self.current_input = command[i:]
-				
-		
-	# Run the Turing Machine on the specified input
-	def run_machine(self):
-		index = 0
-		state = INITIAL_STATE
-		if len(self.tape) == 0:
-			self.tape.append(BLANK)
+				self.current_input = [payload] if payload else []
+
+	# Compile the rules into a Python function, reusing it until the rules change. A budgeted
+	# function counts its steps and takes a Budget, and a profiled one also records them in a Stats.
+	def compile(self, accelerate=False, budgeted=False, profiled=False):
+		key = (accelerate, budgeted, profiled)
+		if key not in self.compiled:
+			from compiler import compile_rules
+			self.compiled[key] = compile_rules(self.rules, accelerate, budgeted, profiled)
+		return self.compiled[key]
+
+	# The rules as a RuleTable (see rule_table.py), reusing it until the rules change
+	def rule_table(self):
+		if "table" not in self.compiled:
+			from rule_table import RuleTable
+			self.compiled["table"] = RuleTable(self.rules)
+		return self.compiled["table"]
+
+	# Run the Turing Machine on the specified input, reading and writing through io
+	# (standard input and output by default). With a Budget, raises StepLimitExceeded or
+	# TimeLimitExceeded if the machine runs out of it. With a Stats, records how long compiling
+	# and running the machine take and what the machine does. A run that was stopped is resumed
+	# from its state, the index of its head and the steps it had taken. Returns the number of steps
+	# taken, or None if the engine did not count them.
+	def run_machine(self, engine="compiled", io=None, budget=None, stats=None, state=INITIAL_STATE, head=0, steps=0):
+		if engine not in ENGINES:
+			raise ValueError(f"Unknown engine: {engine}")
+		if io is None:
+			io = MachineIO()
+		try:
+			if stats is not None:
+				return self._run_profiled(engine, io, budget or Budget(), stats, state, head, steps)
+			if engine == "interpreted":
+				return self.interpret(io, budget, None, state, head, steps)
+			if engine == "table":
+				return self._run_table(self.rule_table(), io, budget, None, state, head, steps)
+			run = self.compile(engine == "accelerated", budget is not None)
+			if budget is None:
+				return run(self.tape, io, state, head)
+			return run(self.tape, io, budget, state, head, steps)
+		finally:
+			io.flush()
+			if stats is not None:
+				stats.add_io(io.reader.bytes_read, io.writer.bytes_written)
+				stats.tape_extent = max(stats.tape_extent, self.tape.last())
+
+	def _run_profiled(self, engine, io, budget, stats, state, head, steps):
+		if engine == "interpreted":
+			with stats.phase("run_machine"):
+				return self.interpret(io, budget, stats, state, head, steps)
+		if engine == "table":
+			with stats.phase("compile"):
+				table = self.rule_table()
+			with stats.phase("run_machine"):
+				return self._run_table(table, io, budget, stats, state, head, steps)
+		with stats.phase("compile"):
+			run = self.compile(engine == "accelerated", True, True)
+		with stats.phase("run_machine"):
+			return run(self.tape, io, budget, stats, state, head, steps)
+
+	# Run the Turing Machine with a copy of table (see RuleTable.copy), on a copy of the tape with its
+	# symbols interned which replaces the tape until the run ends
+	def _run_table(self, table, io, budget, stats, state, head, steps):
+		table = table.copy()
+		self.tape = table.intern_tape(self.tape)
+		self.table = table
+		try:
+			return table.run(self.tape, io, budget, stats, state, head, steps)
+		finally:
+			self.tape = table.restore_tape(self.tape)
+			self.table = None
+
+	# Run the Turing Machine one rule at a time from state with the head at index head, returning
+	# the number of steps taken, counting on from steps
+	def interpret(self, io, budget=None, stats=None, state=INITIAL_STATE, head=0, steps=0):
+		index = head
 		c_symbol = self.tape[index]
-		while (state, c_symbol) in self.rules or state in (INPUT_STATE, OUTPUT_STATE):
-			# INPUT STATE
-			if state == INPUT_STATE:
-				user_input = input()
-				try:
-					int_input = int(user_input)
-					self.tape[index] = int_input
-				except:
-					int_input = 0
-					for c in user_input:
-						int_input += ord(c)
-					self.tape[index] = int_input
-				state = INITIAL_STATE
-				index += 1
-
-			# OUTPUT STATE
-			elif state == OUTPUT_STATE:
-				if c_symbol != BLANK:
-					try:
-						p_symbol = chr(c_symbol)
-						print(p_symbol, end='')
-					except:
-						print(c_symbol, end='')
-					index += 1
-				else:
+		resumed = steps
+		check = budget.start(steps) if budget is not None else -1
+		# How the head has moved, for stats (see compiler.py)
+		rule_hits = {}
+		runs = [0] * RUN_BUCKETS
+		moves = {-1: 0, 0: 0, 1: 0}
+		heading = run = blocked = 0
+		farthest = head
+		try:
+			while (state, c_symbol) in self.rules or state in (INPUT_STATE, OUTPUT_STATE):
+				if steps == check:
+					check = budget.check(steps, state, index)
+				steps += 1
+
+				if stats is not None:
+					moving = 1
+					if state not in (INPUT_STATE, OUTPUT_STATE):
+						rule_hits[(state, c_symbol)] = rule_hits.get((state, c_symbol), 0) + 1
+						if self.rules[(state, c_symbol)][2] % 2 != 0:
+							moving = -1
+							blocked += index == 0
+					if moving != heading:
+						moves[heading] += run
+						runs[run.bit_length()] += 1
+						farthest = max(farthest, index)
+						heading = moving
+						run = 0
+					run += 1
+
+				# INPUT STATE
+				if state == INPUT_STATE:
+					self.tape[index] = io.read_symbol()
 					state = INITIAL_STATE
 					index += 1
-					
-			# OTHER STATE
-			else:
-				state, n_symbol, direction = self.rules[(state, c_symbol)]
-				self.tape[index] = n_symbol
-				index = max(index + (1 if direction % 2 == 0 else -1), 0)
 
-			if index == len(self.tape):
-				self.tape.append(0)
-			c_symbol = self.tape[index]
+				# OUTPUT STATE
+				elif state == OUTPUT_STATE:
+					if c_symbol != BLANK:
+						io.write_symbol(c_symbol)
+						index += 1
+					else:
+						state = INITIAL_STATE
+						index += 1
+						
+				# OTHER STATE
+				else:
+					state, n_symbol, direction = self.rules[(state, c_symbol)]
+					self.tape[index] = n_symbol
+					index = max(index + (1 if direction % 2 == 0 else -1), 0)
+
+				c_symbol = self.tape[index]
+
+			return steps
+		finally:
+			if stats is not None:
+				moves[heading] += run
+				runs[run.bit_length()] += 1
+				stats.add_run(steps - resumed, rule_hits, runs, moves, max(farthest, index), blocked)
@@ -0,0 +1,112 @@
+# Macro steps for the Turing Machine of the chessoteric programming language
+from array import array
+from Machine import BLANK, INPUT_STATE, OUTPUT_STATE
+
+# Longest cycle of states that is applied as a single macro step
+MAX_CYCLE_LENGTH = 4
+# Most cycles looked for from a single (state, symbol) pair
+MAX_CYCLES = 16
+
+# Find the short cycles that start with the rule for (state, symbol) and return to state while
+# moving the head the same way every step. Each cycle is (moves_right, read, written), with
+# read and written listed from the lowest tape index up.
+def find_cycles(states, state, symbol):
+	next_state, next_symbol, direction = states[state][symbol]
+	right = direction % 2 == 0
+	cycles = []
+
+	def follow(current, read, written):
+		if len(cycles) == MAX_CYCLES:
+			return
+		if current == state:
+			if right:
+				cycles.append((True, read, written))
+			else:
+				cycles.append((False, read[::-1], written[::-1]))
+			return
+		if len(read) == MAX_CYCLE_LENGTH or current not in states:
+			return
+		for c_symbol, (n_state, n_symbol, n_direction) in states[current].items():
+			if (n_direction % 2 == 0) == right and (n_state == state or n_state not in read_states):
+				read_states.add(n_state)
+				follow(n_state, read + [c_symbol], written + [n_symbol])
+				read_states.discard(n_state)
+
+	read_states = {next_state}
+	if next_state not in (INPUT_STATE, OUTPUT_STATE):
+		follow(next_state, [symbol], [next_symbol])
+	return cycles
+
+# Find every state's cycles, keyed by the (state, symbol) pair they start with
+def find_all_cycles(states):
+	all_cycles = {}
+	for state in states:
+		for symbol in states[state]:
+			cycles = find_cycles(states, state, symbol)
+			if cycles:
+				all_cycles[(state, symbol)] = cycles
+	return all_cycles
+
+# Largest number of repeats, up to limit, for which matches(first, count) holds for every
+# repeat from the first, found by galloping and then halving the unchecked remainder
+def _count_repeats(matches, limit):
+	repeats = 1
+	while repeats * 2 <= limit and matches(repeats, repeats):
+		repeats *= 2
+	remaining = min(repeats, limit - repeats)
+	while remaining > 0:
+		half = (remaining + 1) // 2
+		if matches(repeats, half):
+			repeats += half
+			remaining -= half
+		else:
+			remaining = half - 1
+	return repeats
+
+# Pattern repeated count times, as the same kind of sequence as page
+def _repeat(page, pattern, count):
+	if isinstance(page, array):
+		return array(page.typecode, pattern) * count
+	return pattern * count
+
+# Apply as many repeats of one of the cycles as fit in the page (and in max_steps steps),
+# returning the new offset (which is the page size if the head moved off the end of the page),
+# or -1 if no cycle matches the page at offset. The repeats of each cycle are added to its
+# entry in counts, if given.
+def skip_cycles(page, offset, cycles, max_steps=None, counts=None):
+	for i, (right, read, written) in enumerate(cycles):
+		length = len(read)
+		if right:
+			limit = (len(page) - offset) // length
+			matches = lambda first, count: \
+				page[offset + first * length:offset + (first + count) * length] == _repeat(page, read, count)
+		else:
+			# The head must not leave the page, or reach the start of the tape where it would stop moving
+			limit = offset // length
+			matches = lambda first, count: \
+				page[offset - (first + count) * length + 1:offset - first * length + 1] == _repeat(page, read, count)
+		if max_steps is not None:
+			limit = min(limit, max_steps // length)
+		if limit == 0 or not matches(0, 1):
+			continue
+
+		repeats = _count_repeats(matches, limit)
+		if counts is not None:
+			counts[i] += repeats
+		if right:
+			page[offset:offset + repeats * length] = _repeat(page, written, repeats)
+			return offset + repeats * length
+		page[offset - repeats * length + 1:offset + 1] = _repeat(page, written, repeats)
+		return offset - repeats * length
+	return -1
+
+# Output every symbol from offset up to the next blank in the page (or the first max_count of
+# them), returning the offset after the last one output (which is the page size at the end)
+def write_run(page, offset, write_symbols, max_count=None):
+	stop = len(page) if max_count is None else min(len(page), offset + max_count)
+	try:
+		end = page.index(BLANK, offset, stop)
+	except ValueError:
+		end = stop
+	write_symbols(page[offset:end])
+	return end
@@ -0,0 +1,220 @@
+# Static analysis of the rules of a Turing Machine before it runs: which states and rules can ever
+# be used, which states halt or can never halt, and which states are equivalent
+# For use with the chessoteric programming language
+from Machine import BLANK, INITIAL_STATE, INPUT_STATE, OUTPUT_STATE
+
+# The input and output states never consult the rules, and both go back to the initial state
+SPECIAL_STATES = (INPUT_STATE, OUTPUT_STATE)
+# Most states listed in each line of a report
+REPORT_STATES = 16
+
+# What is known about a set of rules (a dict from (state, symbol) to (next state, next symbol,
+# direction), as in a Machine) and the tape they start on:
+# - states: the states that can be reached from the initial state
+# - symbols: the symbols that can ever be on the tape, or None if the machine reads input (which
+#   may be any symbol)
+# - live: the rules that may be applied, which are those of states that can be reached for symbols
+#   that can be on the tape. The other rules are dead.
+# - halting: states that can be reached and have no live rules, so the machine halts in them
+# - closed: states from which the machine can never halt, as it has a rule for every symbol that
+#   may be on the tape and every rule leads to another of these states. It never reads or writes
+#   again once it enters one.
+# - runaway: states on a cycle of rules that read blanks and move right, so that the machine runs
+#   right forever if it enters one of them with only blanks to the right of its head
+# - merged: states that behave like another state, mapped to the state that stands for them
+# - rules: the live rules with merged states replaced by the states that stand for them
+class Analysis:
+	def __init__(self, rules):
+		self.rule_count = len(rules)
+		self.states = set()
+		self.symbols = set()
+		self.live = {}
+		self.halting = set()
+		self.closed = set()
+		self.runaway = set()
+		self.merged = {}
+		self.rules = {}
+
+	def dead_count(self):
+		return self.rule_count - len(self.live)
+
+	# Lines of a report on the analysis, with warnings for states that may never halt
+	def report(self):
+		lines = [f"States: {len(self.states)} reachable from the initial state",
+		         "Symbols: any (the machine reads input)" if self.symbols is None else
+		         f"Symbols: {len(self.symbols)} may be on the tape",
+		         f"Rules: {len(self.live)} live of {self.rule_count} ({self.dead_count()} dead)"]
+		if self.halting:
+			lines.append(f"Halting states (no live rules): {_list(self.halting)}")
+		if self.merged:
+			representatives = {}
+			for state, representative in self.merged.items():
+				representatives.setdefault(representative, []).append(state)
+			lines.append(f"Equivalent states: {len(self.merged)} merged into {len(representatives)} others")
+			for representative, states in sorted(representatives.items())[:REPORT_STATES]:
+				lines.append(f"  {_list(states)} -> {representative}")
+		lines.append(f"Optimized rules: {len(self.rules)}")
+		return lines + self.warnings()
+
+	# Lines warning of states in which the machine may never halt
+	def warnings(self):
+		lines = []
+		if INITIAL_STATE in self.closed:
+			lines.append("Warning: the machine never halts, reads or writes")
+		elif self.closed:
+			lines.append(f"Warning: the machine never halts, reads or writes once it enters {_states(self.closed)}")
+		if self.runaway:
+			lines.append(f"Warning: the machine runs right forever if it enters {_states(self.runaway)} "
+			             "past the end of the tape")
+		return lines
+
+def _states(states):
+	return f"{'state' if len(states) == 1 else 'states'} {_list(states)}"
+
+def _list(states):
+	states = sorted(states)
+	listed = ", ".join(str(state) for state in states[:REPORT_STATES])
+	return listed + (f" and {len(states) - REPORT_STATES} more" if len(states) > REPORT_STATES else "")
+
+# Find the states that can be reached, the symbols that can be on the tape and the live rules,
+# starting from the initial state and the symbols on the tape. A rule becomes live once its state
+# can be reached and its symbol can be on the tape, and its next state and symbol then can be too.
+def _find_live(analysis, rules, tape_symbols):
+	rules_of = {}
+	for key in rules:
+		if key[0] not in SPECIAL_STATES:
+			rules_of.setdefault(key[0], []).append(key)
+	symbols = analysis.symbols
+	symbols.update(tape_symbols)
+	symbols.add(BLANK)
+	# Rules of states that can be reached, by the symbols they wait for
+	waiting = {}
+	live = analysis.live
+	reached = []
+	new_states = [INITIAL_STATE]
+	while new_states:
+		state = new_states.pop()
+		if state in analysis.states:
+			continue
+		analysis.states.add(state)
+		if state == INPUT_STATE and symbols is not None:
+			# Input may be any symbol, so every rule of a state that can be reached is live
+			for keys in waiting.values():
+				reached += keys
+			symbols = analysis.symbols = None
+			waiting = {}
+		for key in rules_of.get(state, ()):
+			if symbols is None or key[1] in symbols:
+				reached.append(key)
+			else:
+				waiting.setdefault(key[1], []).append(key)
+		while reached:
+			key = reached.pop()
+			live[key] = rules[key]
+			next_state, next_symbol, direction = rules[key]
+			new_states.append(next_state)
+			if symbols is not None and next_symbol not in symbols:
+				symbols.add(next_symbol)
+				reached += waiting.pop(next_symbol, ())
+	analysis.states.difference_update(SPECIAL_STATES)
+	analysis.halting = analysis.states - {state for state, symbol in live}
+
+# States from which every symbol that may be on the tape leads to another such state
+def _find_closed(analysis):
+	if analysis.symbols is None:
+		return set()
+	symbols = analysis.symbols
+	closed = {state for state in analysis.states
+	          if all((state, symbol) in analysis.live for symbol in symbols)}
+	changed = True
+	while changed:
+		changed = False
+		for state in list(closed):
+			if any(analysis.live[(state, symbol)][0] not in closed for symbol in symbols):
+				closed.discard(state)
+				changed = True
+	return closed
+
+# States on a cycle of live rules that read blanks and move right
+def _find_runaway(analysis):
+	successor = {state: analysis.live[(state, BLANK)][0] for state in analysis.states
+	             if (state, BLANK) in analysis.live and analysis.live[(state, BLANK)][2] % 2 == 0}
+	runaway = set()
+	# Each state has at most one successor, so following them from any state ends in a cycle or
+	# a state without one
+	finished = set()
+	for start in successor:
+		path = []
+		on_path = set()
+		state = start
+		while state in successor and state not in finished and state not in on_path:
+			path.append(state)
+			on_path.add(state)
+			state = successor[state]
+		if state in on_path:
+			runaway.update(path[path.index(state):])
+		finished.update(path)
+	return runaway
+
+# Merge states that behave the same: those that apply the same rules (writing the same symbols
+# and moving the same way) for the same symbols, and go on to states that behave the same. States
+# are split by what their rules do until every state's rules lead to the same groups as the other
+# states of its group. The initial state stands for its group, and otherwise the smallest state.
+def _merge_states(analysis):
+	rules_of = {state: [] for state in analysis.states}
+	for (state, symbol), (next_state, next_symbol, direction) in analysis.live.items():
+		rules_of[state].append((symbol, next_symbol, direction % 2, next_state))
+	# The input and output states are groups of their own
+	group = {INPUT_STATE: -1, OUTPUT_STATE: -2}
+	signatures = {state: sorted((symbol, next_symbol, moving) for symbol, next_symbol, moving, next_state in state_rules)
+	              for state, state_rules in rules_of.items()}
+	numbers = {}
+	for state, signature in signatures.items():
+		group[state] = numbers.setdefault(tuple(signature), len(numbers))
+	count = len(numbers)
+	while True:
+		numbers = {}
+		refined = {INPUT_STATE: -1, OUTPUT_STATE: -2}
+		for state, state_rules in rules_of.items():
+			signature = (group[state], tuple(sorted((symbol, group[next_state]) for symbol, next_symbol, moving, next_state
+			                                        in state_rules)))
+			refined[state] = numbers.setdefault(signature, len(numbers))
+		group = refined
+		if len(numbers) == count:
+			break
+		count = len(numbers)
+
+	members = {}
+	for state in analysis.states:
+		members.setdefault(group[state], []).append(state)
+	representative = {INPUT_STATE: INPUT_STATE, OUTPUT_STATE: OUTPUT_STATE}
+	for states in members.values():
+		chosen = INITIAL_STATE if INITIAL_STATE in states else min(states)
+		for state in states:
+			representative[state] = chosen
+			if state != chosen:
+				analysis.merged[state] = chosen
+	analysis.rules = {(state, symbol): (representative[next_state], next_symbol, direction)
+	                  for (state, symbol), (next_state, next_symbol, direction) in analysis.live.items()
+	                  if representative[state] == state}
+
+# Analyze the rules of a machine that starts on a tape holding tape_symbols (any iterable of them)
+def analyze(rules, tape_symbols=()):
+	analysis = Analysis(rules)
+	_find_live(analysis, rules, tape_symbols)
+	analysis.closed = _find_closed(analysis)
+	analysis.runaway = _find_runaway(analysis)
+	_merge_states(analysis)
+	return analysis
+
+def analyze_machine(mach):
+	return analyze(mach.rules, {symbol for page in mach.tape.pages.values() for symbol in page})
+
+# Replace the rules of mach with the smaller set found by analyzing them, which the machine
+# applies in the same way, and return the Analysis
+def optimize(mach):
+	analysis = analyze_machine(mach)
+	if analysis.rules != mach.rules:
+		mach.rules = analysis.rules
+		mach.compiled = {}
+	return analysis
@@ -0,0 +1,274 @@
+# Runs many chessoteric and Binary Turing Machine!? programs at once, or every game of a PGN
+# database, each in a worker process, and writes a report of how each one went
+import argparse
+import json
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import sys
+import time
+from collections import deque
+from functools import partial
+from io import BytesIO, StringIO
+import BTM
+import Chessoteric
+from cache import ProgramCache, CACHE_DIRECTORY
+from Machine import Budget, ENGINES, StepLimitExceeded, TimeLimitExceeded
+from machine_io import BUFFER_SIZE, MachineIO
+from pgn import PGNDatabase
+
+# Default limit on the seconds each program may run for, including the simulation of its game
+TIME_LIMIT = 60.0
+# Seconds past its time limit after which a program whose worker has not answered is given up on
+GRACE_PERIOD = 5.0
+# Seconds between checks on the programs that are still running
+POLL_INTERVAL = 0.05
+# In a directory of programs, the input of the program at path is read from path + INPUT_SUFFIX
+INPUT_SUFFIX = ".in"
+# A file of programs ending in DATABASE_SUFFIX is a database of games in standard PGN
+DATABASE_SUFFIX = ".pgn"
+
+# A program to run: its path, the path of its input (or None for no input), and its language
+def make_job(program, input_path=None, kind=None):
+	if kind is None:
+		kind = "btm" if program.endswith(".btm") else "chessoteric"
+	if kind not in ("chessoteric", "btm"):
+		raise ValueError(f"Unknown kind of program: {kind}")
+	return {"program": program, "input": input_path, "kind": kind}
+
+# The jobs for every program in directory, each with the input file next to it if there is one
+def find_jobs(directory):
+	jobs = []
+	for name in sorted(os.listdir(directory)):
+		path = os.path.join(directory, name)
+		if name.startswith(".") or name.endswith(INPUT_SUFFIX) or not os.path.isfile(path):
+			continue
+		input_path = path + INPUT_SUFFIX
+		jobs.append(make_job(path, input_path if os.path.isfile(input_path) else None))
+	return jobs
+
+# The jobs listed in a manifest, one JSON object per line with a "program", and optionally an
+# "input" and a "kind" ("chessoteric" or "btm"). Paths are relative to the manifest.
+def read_manifest(path):
+	directory = os.path.dirname(path)
+	jobs = []
+	with open(path, "r") as f:
+		for number, line in enumerate(f, 1):
+			if not line.strip():
+				continue
+			try:
+				entry = json.loads(line)
+				program = os.path.join(directory, entry["program"])
+			except (ValueError, KeyError, TypeError) as e:
+				raise SyntaxError(f"Invalid manifest entry on line {number}: {line.strip()}") from e
+			input_path = entry.get("input")
+			if input_path is not None:
+				input_path = os.path.join(directory, input_path)
+			jobs.append(make_job(program, input_path, entry.get("kind")))
+	return jobs
+
+# A job for each game of the PGN database at path, all with the input at input_path (if any). A
+# job knows its game by its number (counting from 1), its byte offsets and its tag pairs (or None
+# if they cannot be read), which are found as the database is indexed.
+def database_jobs(path, input_path=None):
+	database = PGNDatabase(path)
+	jobs = []
+	for number, (start, end) in enumerate(database.games):
+		try:
+			tags = database.tags(number)
+		except SyntaxError:
+			tags = None
+		jobs.append({"program": path, "input": input_path, "kind": "pgn", "game": number + 1,
+		             "offsets": [start, end], "tags": tags})
+	return jobs
+
+# Load a machine with load() and run it on the input that open_input() opens, writing to output,
+# and fill in the status, steps, error and time of result. Everything that goes wrong is caught
+# and reported in result. The time limit counts from start, so it includes loading the program.
+# With load_only, the program is only loaded (checking that its game is legal), and not run.
+def run_guarded(result, start, load, open_input, output, engine="compiled", max_steps=None, time_limit=TIME_LIMIT,
+                binary=False, load_only=False, buffer_size=BUFFER_SIZE):
+	try:
+		mach = load()
+		if not load_only:
+			if time_limit is not None:
+				remaining = time_limit - (time.perf_counter() - start)
+				if remaining <= 0:
+					raise TimeLimitExceeded("Time limit reached while loading the program", 0)
+			else:
+				remaining = None
+			with open_input() as input_stream:
+				io = MachineIO(input_stream, output, binary, buffer_size)
+				result["steps"] = mach.run_machine(engine, io, Budget(max_steps, remaining))
+	except StepLimitExceeded as e:
+		result["status"] = "step_limit"
+		result["steps"] = e.steps
+		result["error"] = str(e)
+	except TimeLimitExceeded as e:
+		result["status"] = "time_limit"
+		result["steps"] = e.steps
+		result["error"] = f"Time limit of {time_limit:g} seconds reached"
+	except Exception as e:
+		result["status"] = "error"
+		result["error"] = f"{type(e).__name__}: {e}"
+	result["time"] = time.perf_counter() - start
+	return result
+
+def _load_job(job, cache_directory):
+	cache = ProgramCache(cache_directory) if cache_directory is not None else None
+	if job["kind"] == "btm":
+		return BTM.load_file(job["program"])
+	if job["kind"] == "pgn":
+		return Chessoteric.load_database_game(job["program"], *job["offsets"], cache)
+	return Chessoteric.load_file(job["program"], cache)
+
+def _open_input(path):
+	return open(path, "rb") if path is not None else BytesIO()
+
+# Run one job and return its entry in the report (see run_guarded)
+def run_program(job, engine="compiled", max_steps=None, time_limit=TIME_LIMIT, binary=False, cache_directory=None,
+                load_only=False):
+	start = time.perf_counter()
+	result = dict(job, status="ok", steps=None, error=None)
+	output = BytesIO() if binary else StringIO()
+	run_guarded(result, start, partial(_load_job, job, cache_directory), partial(_open_input, job["input"]), output,
+	            engine, max_steps, time_limit, binary, load_only)
+	# Binary output is kept byte for byte as the characters 0-255
+	result["output"] = output.getvalue().decode("latin-1") if binary else output.getvalue()
+	return result
+
+# The loop of a worker process: run each job sent through conn with run_program (given the rest of
+# its arguments in options), sending back its report, until the batch closes the connection
+def _work(conn, options):
+	# The batch stops its workers itself
+	signal.signal(signal.SIGINT, signal.SIG_IGN)
+	while True:
+		try:
+			job = conn.recv()
+		except EOFError:
+			return
+		conn.send(run_program(job, *options))
+
+# A worker process, with the job it is running (if any) and the time (of time.monotonic) past
+# which it is given up on (None without a time limit)
+class Worker:
+	def __init__(self, options):
+		self.conn, child = multiprocessing.Pipe()
+		self.process = multiprocessing.Process(target=_work, args=(child, options), daemon=True)
+		self.process.start()
+		child.close()
+		self.job = None
+		self.deadline = None
+
+	def start(self, job, time_limit):
+		self.conn.send(job)
+		self.job = job
+		self.deadline = time.monotonic() + time_limit + GRACE_PERIOD if time_limit is not None else None
+
+	# The report of the job, once the worker has sent it or is lost, or else None
+	def report(self):
+		if self.conn.poll():
+			try:
+				return self.conn.recv()
+			except (EOFError, OSError):
+				return _lost(self.job, "The worker running the program died")
+		if not self.process.is_alive():
+			return _lost(self.job, "The worker running the program died")
+		if self.deadline is not None and time.monotonic() > self.deadline:
+			return _lost(self.job, "The worker running the program stopped answering")
+		return None
+
+	def stop(self):
+		self.process.kill()
+		self.process.join()
+		self.conn.close()
+
+# Report for a job whose worker never answered (because it died, or hung past its time limit)
+def _lost(job, error):
+	return dict(job, status="lost", steps=None, error=error, time=None, output="")
+
+# Run the jobs in worker processes (one per CPU by default), each running one job at a time, and
+# yield each one's report as it finishes. A program that fails, or even takes its worker process
+# down with it, only affects its own report: a worker that dies, or is still running its program
+# (loading it included) GRACE_PERIOD seconds past its time limit, is stopped and replaced.
+def run_batch(jobs, processes=None, engine="compiled", max_steps=None, time_limit=TIME_LIMIT,
+              binary=False, cache_directory=None, load_only=False):
+	options = (engine, max_steps, time_limit, binary, cache_directory, load_only)
+	waiting = deque(jobs)
+	workers = []
+	try:
+		for i in range(min(processes or os.cpu_count() or 1, len(waiting))):
+			worker = Worker(options)
+			workers.append(worker)
+			worker.start(waiting.popleft(), time_limit)
+		busy = list(workers)
+		while busy:
+			multiprocessing.connection.wait([worker.conn for worker in busy] +
+			                                [worker.process.sentinel for worker in busy], POLL_INTERVAL)
+			for worker in busy:
+				result = worker.report()
+				if result is None:
+					continue
+				worker.job = None
+				if result["status"] == "lost":
+					worker.stop()
+					workers.remove(worker)
+					if waiting:
+						worker = Worker(options)
+						workers.append(worker)
+				if waiting:
+					worker.start(waiting.popleft(), time_limit)
+				yield result
+			busy = [worker for worker in workers if worker.job is not None]
+	finally:
+		for worker in workers:
+			worker.stop()
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Run many chessoteric and Binary Turing Machine!? programs at once")
+	parser.add_argument("programs",
+	                    help="directory of programs (files ending in .btm are Binary Turing Machine!? programs, "
+	                         f"and the input of a program is read from the file named after it plus {INPUT_SUFFIX}), "
+	                         "a manifest listing one JSON object per line with a program, and optionally an input "
+	                         "and a kind (chessoteric or btm), or a database of games in standard PGN (ending in "
+	                         f"{DATABASE_SUFFIX}), each of which is run as a program")
+	parser.add_argument("--input", metavar="FILE",
+	                    help="read the input of every game of a PGN database from FILE")
+	parser.add_argument("--report", metavar="FILE",
+	                    help="write the report, one JSON object per program, to FILE instead of stdout")
+	parser.add_argument("--jobs", type=int, metavar="N", help="number of worker processes (one per CPU by default)")
+	parser.add_argument("--engine", choices=ENGINES, default="compiled",
+	                    help="run the machines compiled into Python code, compiled with macro steps for "
+	                         "repeated cycles of rules, looked up in tables of interned states and symbols, "
+	                         "or interpreted as a reference")
+	parser.add_argument("--max-steps", type=int, metavar="N", help="stop each program after N steps of its machine")
+	parser.add_argument("--time-limit", type=float, default=TIME_LIMIT, metavar="SECONDS",
+	                    help=f"stop each program after SECONDS seconds (default {TIME_LIMIT:g}, 0 for no limit)")
+	parser.add_argument("--binary", action="store_true",
+	                    help="capture output symbols as raw bytes, and read input lines as bytes")
+	parser.add_argument("--load-only", action="store_true",
+	                    help="only load each program, checking that its game is legal, without running its machine")
+	parser.add_argument("--no-cache", action="store_true",
+	                    help="always simulate the games instead of using the cache of loaded programs")
+	parser.add_argument("--cache-dir", default=CACHE_DIRECTORY, metavar="DIR",
+	                    help="directory of the cache of loaded programs")
+	args = parser.parse_args()
+
+	if args.input is not None and not args.programs.endswith(DATABASE_SUFFIX):
+		parser.error("--input is only for PGN databases")
+	if os.path.isdir(args.programs):
+		jobs = find_jobs(args.programs)
+	elif args.programs.endswith(DATABASE_SUFFIX):
+		jobs = database_jobs(args.programs, args.input)
+	else:
+		jobs = read_manifest(args.programs)
+	report = open(args.report, "w") if args.report else sys.stdout
+	statuses = {}
+	with report:
+		for result in run_batch(jobs, args.jobs, args.engine, args.max_steps, args.time_limit or None, args.binary,
+		                        None if args.no_cache else args.cache_dir, args.load_only):
+			report.write(json.dumps(result) + "\n")
+			report.flush()
+			statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+	print(", ".join(f"{count} {status}" for status, count in sorted(statuses.items())), file=sys.stderr)
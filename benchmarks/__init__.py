@@ -0,0 +1,2 @@
+# Benchmarks of the chess simulation and the Turing Machine of the chessoteric programming
+# language. Run them with python -m benchmarks from the root of the repository.
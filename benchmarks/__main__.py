@@ -0,0 +1,41 @@
+# Runs the benchmarks, printing their results as JSON and comparing them with a baseline
+import argparse
+import json
+import sys
+from benchmarks.suite import TOLERANCE, build_benchmarks, compare, report, run_benchmarks
+
+parser = argparse.ArgumentParser(prog="python -m benchmarks",
+                                 description="Benchmarks of the chess simulation and the Turing Machine")
+parser.add_argument("--quick", action="store_true", help="run smaller workloads")
+parser.add_argument("--repeat", type=int, default=3, metavar="N", help="keep the fastest of N runs of each benchmark")
+parser.add_argument("--only", action="append", metavar="NAME",
+                    help="only run the benchmarks whose names contain NAME (may be given more than once)")
+parser.add_argument("--output", metavar="FILE", help="write the results to FILE instead of stdout")
+parser.add_argument("--baseline", metavar="FILE",
+                    help="compare the results with those saved in FILE, exiting with status 1 if any rate has fallen")
+parser.add_argument("--tolerance", type=float, default=TOLERANCE, metavar="FRACTION",
+                    help=f"largest fall in a rate that is not a regression (default {TOLERANCE:g})")
+args = parser.parse_args()
+
+benchmarks = build_benchmarks(args.quick, args.only)
+results = run_benchmarks(benchmarks, args.repeat, lambda name: print(name, file=sys.stderr))
+text = json.dumps(report(results, args.quick), indent=2, sort_keys=True) + "\n"
+if args.output:
+	with open(args.output, "w") as f:
+		f.write(text)
+else:
+	sys.stdout.write(text)
+
+if args.baseline:
+	with open(args.baseline, "r") as f:
+		baseline = json.load(f)
+	if baseline.get("quick") != args.quick:
+		print("Warning: the baseline was run with different workload sizes", file=sys.stderr)
+	regressions = 0
+	for name, before, after, change in compare(results, baseline):
+		regressed = change < -args.tolerance
+		regressions += regressed
+		print(f"{name:40} {before:>14.1f} {after:>14.1f} {change:>+8.1%}{'  REGRESSION' if regressed else ''}",
+		      file=sys.stderr)
+	if regressions:
+		sys.exit(1)
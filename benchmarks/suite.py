@@ -0,0 +1,183 @@
+# The benchmarks, which time the chess simulation and the Machine on the synthetic workloads,
+# and the comparison of their results with a baseline
+import platform
+import time
+from io import BytesIO, StringIO
+from chess_game import Position, read_fen
+from Chessoteric import load_game
+from Machine import Machine, ENGINES
+from machine_io import MachineIO
+from pgn import read_words
+from tape import Tape
+import perft
+from benchmarks import workloads
+
+# Version of the format of the results
+VERSION = 1
+# Number of games and half-moves per game of the chess workloads
+GAMES = {"annotated": (4, 300), "promotion": (6, 200), "castling": (24, 30)}
+# The Turing Machine workloads, with their sizes for the compiled engines and for the interpreter
+MACHINES = {"scan": (workloads.scan_machine, 2000000, 125000),
+            "bounce": (workloads.bounce_machine, 1500, 375),
+            "output": (workloads.output_machine, 1000000, 62500),
+            "rotation": (workloads.rotation_machine, 2000000, 125000)}
+# Number of times the commands of the annotated games are timed, since there are few of them
+PGN_COMMAND_REPEATS = 50
+# Number of values on the tape of the program whose commands are timed
+BTM_TAPE_SIZE = 200000
+# There are this many times fewer games, and this much smaller machines, with quick
+QUICK_SCALE = 10
+# Most positions counted for each reference position of perft.py, which sets the depth it is
+# counted to
+PERFT_NODES = 100000
+# Largest fall in a rate, as a fraction of the baseline, that is not reported as a regression
+TOLERANCE = 0.1
+
+def _time_make_move(games):
+	count = 0
+	seconds = 0.0
+	for moves in games:
+		position = Position()
+		start = time.perf_counter()
+		for move in moves:
+			position.play(move)
+		seconds += time.perf_counter() - start
+		count += len(moves)
+	return count, seconds
+
+def _time_load_game(texts, count):
+	start = time.perf_counter()
+	for text in texts:
+		load_game(read_words(StringIO(text)))
+	return count, time.perf_counter() - start
+
+# Feed the commands to repeats new machines
+def _time_process_command(commands, repeats=1):
+	start = time.perf_counter()
+	for i in range(repeats):
+		mach = Machine()
+		for command in commands:
+			mach.process_command(command)
+		mach.process_command("FLUSH")
+	return len(commands) * repeats, time.perf_counter() - start
+
+def _time_process_bits(commands, repeats=1):
+	start = time.perf_counter()
+	for i in range(repeats):
+		mach = Machine()
+		for bits, length, kind in commands:
+			mach.process_bits(bits, length, kind)
+		mach.process_command("FLUSH")
+	return len(commands) * repeats, time.perf_counter() - start
+
+def _time_perft(fen, depth, expected):
+	position = Position(*read_fen(fen))
+	start = time.perf_counter()
+	nodes = perft.perft(position, depth)
+	seconds = time.perf_counter() - start
+	if nodes != expected:
+		raise RuntimeError(f"Perft counted {nodes} positions instead of {expected}")
+	return nodes, seconds
+
+def _time_run_machine(rules, tape, steps, engine):
+	mach = Machine()
+	mach.rules = dict(rules)
+	mach.tape = Tape(tape)
+	if engine == "table":
+		mach.rule_table()
+	elif engine != "interpreted":
+		mach.compile(engine == "accelerated")
+	io = MachineIO(BytesIO(), StringIO())
+	start = time.perf_counter()
+	taken = mach.run_machine(engine, io)
+	seconds = time.perf_counter() - start
+	# Only the table engine and the interpreter count their steps when they have no budget
+	if taken is not None and taken != steps:
+		raise RuntimeError(f"Machine took {taken} steps instead of {steps}")
+	return steps, seconds
+
+# The benchmarks as (name, unit, run), where run() times one run of the benchmark and returns
+# the number of things it did and the seconds it took. Names containing none of the strings in
+# only (if given) are left out, without generating their workloads.
+def build_benchmarks(quick=False, only=None):
+	scale = QUICK_SCALE if quick else 1
+	wanted = lambda name: only is None or any(part in name for part in only)
+	benchmarks = []
+
+	games = {}
+	for kind, (count, plies) in GAMES.items():
+		loaded = kind == "annotated" and any(wanted(name) for name in ("load_game", "process_command/pgn", "process_bits/pgn"))
+		if wanted(f"make_move/{kind}") or loaded:
+			generate = getattr(workloads, f"{kind}_games")
+			games[kind] = generate(max(count // scale, 1), plies)
+		if wanted(f"make_move/{kind}"):
+			benchmarks.append((f"make_move/{kind}", "half-moves/s", lambda games=games[kind]: _time_make_move(games)))
+
+	if wanted("load_game/annotated"):
+		texts = [workloads.to_pgn(moves) for moves in games["annotated"]]
+		count = sum(len(moves) for moves in games["annotated"])
+		benchmarks.append(("load_game/annotated", "half-moves/s",
+		                   lambda texts=texts, count=count: _time_load_game(texts, count)))
+	if wanted("process_command/pgn"):
+		commands = [command for moves in games["annotated"] for command in workloads.game_commands(moves)]
+		benchmarks.append(("process_command/pgn", "commands/s",
+		                   lambda commands=commands: _time_process_command(commands, PGN_COMMAND_REPEATS)))
+
+	if wanted("process_bits/pgn"):
+		commands = [command for moves in games["annotated"] for command in workloads.game_command_bits(moves)]
+		benchmarks.append(("process_bits/pgn", "commands/s",
+		                   lambda commands=commands: _time_process_bits(commands, PGN_COMMAND_REPEATS)))
+
+	if wanted("process_command/btm"):
+		rules, tape, steps = workloads.rotation_machine(BTM_TAPE_SIZE // scale)
+		commands = workloads.btm_source(rules, tape)
+		benchmarks.append(("process_command/btm", "commands/s",
+		                   lambda commands=commands: _time_process_command(commands)))
+
+	for name, fen, counts in perft.REFERENCE:
+		if wanted(f"perft/{name}"):
+			depth = perft.reference_depth(counts, PERFT_NODES // scale)
+			benchmarks.append((f"perft/{name}", "nodes/s", lambda fen=fen, depth=depth, expected=counts[depth - 1]:
+			                                               _time_perft(fen, depth, expected)))
+
+	for kind, (generate, size, interpreted_size) in MACHINES.items():
+		for engine in ENGINES:
+			name = f"run_machine/{kind}/{engine}"
+			if wanted(name):
+				rules, tape, steps = generate(max((interpreted_size if engine == "interpreted" else size) // scale, 1))
+				benchmarks.append((name, "steps/s", lambda rules=rules, tape=tape, steps=steps, engine=engine:
+				                                    _time_run_machine(rules, tape, steps, engine)))
+	return benchmarks
+
+# Run each benchmark repeat times, keeping its fastest run. Calls progress(name) before each one.
+def run_benchmarks(benchmarks, repeat=3, progress=None):
+	results = {}
+	for name, unit, run in benchmarks:
+		if progress is not None:
+			progress(name)
+		best = None
+		for i in range(repeat):
+			count, seconds = run()
+			if best is None or seconds < best[1]:
+				best = (count, seconds)
+		count, seconds = best
+		results[name] = {"unit": unit, "count": count, "seconds": round(seconds, 6),
+		                 "rate": round(count / seconds, 1) if seconds > 0 else None}
+	return results
+
+# The results with what they were measured on, in the form they are saved in
+def report(results, quick=False):
+	return {"version": VERSION, "quick": quick, "python": platform.python_version(),
+	        "implementation": platform.python_implementation(), "results": results}
+
+# Compare the rates in results with those in a baseline report, returning (name, baseline rate,
+# rate, change) for each benchmark in both, where change is the fraction the rate has grown by
+def compare(results, baseline):
+	changes = []
+	for name in sorted(results):
+		if name in baseline["results"]:
+			before = baseline["results"][name]["rate"]
+			after = results[name]["rate"]
+			if before and after:
+				changes.append((name, before, after, after / before - 1))
+	return changes
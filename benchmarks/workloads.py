@@ -0,0 +1,192 @@
+# Synthetic workloads for the benchmarks: random legal games, and Turing Machines whose
+# number of steps is known in advance
+import random
+from bitboard import PIECE_TYPES, squares
+from chess_game import FILES, Position, move_san
+from Chessoteric import board_to_string
+from Machine import Machine
+
+# Annotations that make a move a command for the Machine
+END_SYMBOLS = ('!', '?', '!!', '??')
+# Symbol the output workload writes
+OUTPUT_SYMBOL = ord('A')
+# Number of states the rotation workload cycles through, too many for the accelerated engine
+ROTATION_STATES = 16
+# Openings in which both sides castle, which the castling workload continues at random
+CASTLING_OPENINGS = (
+	('e4', 'e5', 'Nf3', 'Nc6', 'Bc4', 'Bc5', 'O-O', 'Nf6', 'd3', 'O-O'),
+	('d4', 'd5', 'Nc3', 'Nc6', 'Bf4', 'Bf5', 'Qd2', 'Qd7', 'O-O-O', 'O-O-O'),
+	('Nf3', 'Nf6', 'g3', 'g6', 'Bg2', 'Bg7', 'O-O', 'O-O'),
+	('e4', 'e5', 'Nc3', 'Nc6', 'd3', 'd6', 'Be3', 'Be6', 'Qd2', 'Qd7', 'O-O-O', 'O-O-O'),
+)
+
+# The moves that the side to move may try, written as the game would write them (before any
+# check or checkmate symbol)
+def candidate_moves(Board, turn):
+	moves = ['O-O', 'O-O-O']
+	for destination in range(64):
+		for piece_type in PIECE_TYPES:
+			for origin in squares(Board.movers(turn + piece_type, destination)):
+				if piece_type == 'P' and destination // 8 in (0, 7):
+					moves += [move_san(Board, origin, destination, piece) for piece in ('Q', 'R', 'B', 'N')]
+				else:
+					moves.append(move_san(Board, origin, destination))
+	return moves
+
+# Play move on position, adding whichever check or checkmate symbol it needs. Returns the move as
+# written and whether it checkmates, or None if the move is not legal.
+def try_move(move, position):
+	for suffix in ('', '+', '#'):
+		try:
+			end_symbol, mate = position.play(move + suffix)
+		except SyntaxError:
+			continue
+		return move + suffix, mate
+	return None
+
+# An annotation for a move that leaves the board as board_string, which mach accepts as a
+# command, or "" if there is none. Parts of rules are never left empty, so that the program
+# always flushes cleanly at the end of the game.
+def choose_end_symbol(rng, mach, board_string):
+	for end_symbol in rng.sample(END_SYMBOLS, len(END_SYMBOLS)):
+		trial = Machine()
+		# The part and input still being read are lists that the trial must not add to
+		trial.current_rule = [part[:] if isinstance(part, list) else part for part in mach.current_rule]
+		trial.current_input = None if mach.current_input is None else mach.current_input[:]
+		try:
+			trial.process_command(board_string + end_symbol)
+		except (SyntaxError, ValueError):
+			continue
+		if trial.current_rule and not trial.current_rule[-1]:
+			continue
+		mach.process_command(board_string + end_symbol)
+		return end_symbol
+	return ""
+
+# A random legal game of up to plies half-moves, as a list of moves, starting with the moves of
+# opening. Each move is tried with probability proportional to weight(move), and annotated with
+# probability annotation_rate. Checkmate is avoided while there is any other move, so that games
+# run their full length.
+def random_game(seed, plies, weight=lambda move: 1, annotation_rate=0.0, opening=()):
+	rng = random.Random(seed)
+	position = Position()
+	mach = Machine()
+	moves = []
+	for ply in range(plies):
+		if ply < len(opening):
+			candidates = [opening[ply]]
+		else:
+			candidates = candidate_moves(position.Board, position.turn)
+			candidates.sort(key=lambda move: rng.random() ** (1 / weight(move)), reverse=True)
+		played = None
+		for candidate in candidates:
+			attempt = try_move(candidate, position)
+			if attempt is not None:
+				if not attempt[1]:
+					played = attempt
+					break
+				# Checkmate is taken back, and only played if no other move is found
+				position.unmake()
+				played = played or attempt
+		if played is None:
+			if ply < len(opening):
+				raise SyntaxError(f"Invalid opening move: {opening[ply]}")
+			break
+		move, mate = played
+		if mate:
+			position.play(move)
+		if rng.random() < annotation_rate:
+			move += choose_end_symbol(rng, mach, board_to_string(position.Board))
+		moves.append(move)
+		if mate:
+			break
+	return moves
+
+# The text of a game in PGN
+def to_pgn(moves):
+	words = []
+	for i, move in enumerate(moves):
+		if i % 2 == 0:
+			words.append(f"{i // 2 + 1}.")
+		words.append(move)
+	words.append("1/2-1/2")
+	return ' '.join(words) + '\n'
+
+def promotion_weight(move):
+	if '=' in move:
+		return 1000
+	# Pawn moves have no piece letter
+	return 20 if move[0] in FILES else 1
+
+def castling_weight(move):
+	if move.startswith('O-O'):
+		return 1000
+	# Clear the way for castling, without giving up the right to castle
+	return {'N': 10, 'B': 20, 'Q': 3, 'R': 0.05, 'K': 0.05}.get(move[0], 5)
+
+# Long games with many annotated moves
+def annotated_games(count, plies):
+	return [random_game(seed, plies, annotation_rate=0.5) for seed in range(count)]
+
+def promotion_games(count, plies):
+	return [random_game(seed, plies, promotion_weight) for seed in range(count)]
+
+# Short games in which both sides castle
+def castling_games(count, plies):
+	return [random_game(seed, plies, castling_weight, opening=CASTLING_OPENINGS[seed % len(CASTLING_OPENINGS)])
+	        for seed in range(count)]
+
+# The commands a game sends to the Machine
+def game_commands(moves):
+	position = Position()
+	commands = []
+	for move in moves:
+		end_symbol, mate = position.play(move)
+		if end_symbol != "":
+			commands.append(board_to_string(position.Board) + end_symbol)
+	return commands
+
+# The commands a game sends to the Machine as bits, as (bits, length, annotation)
+def game_command_bits(moves):
+	position = Position()
+	commands = []
+	for move in moves:
+		end_symbol, mate = position.play(move)
+		if end_symbol != "":
+			commands.append(position.Board.color_bits() + (end_symbol,))
+	return commands
+
+# The Turing Machine workloads are (rules, tape, steps), with steps the number of steps the
+# machine takes before it halts
+
+# Scan right across n cells
+def scan_machine(n):
+	return {(0, 1): (0, 1, 0)}, [1] * n, n
+
+# Erase n cells one at a time from the right end, walking back to the left end after each
+def bounce_machine(n):
+	rules = {(0, 2): (3, 2, 0), (3, 1): (3, 1, 0), (3, 0): (4, 0, 1),
+	         (4, 1): (5, 0, 1), (5, 1): (5, 1, 1), (5, 2): (3, 2, 0)}
+	return rules, [2] + [1] * n, n * n + 3 * n + 2
+
+# Output n symbols
+def output_machine(n):
+	return {(0, 3): (2, 3, 0)}, [3] + [OUTPUT_SYMBOL] * n, n + 2
+
+# Scan right across n cells, changing state every step
+def rotation_machine(n):
+	first = 3
+	rules = {(0, 1): (first, 1, 0)}
+	for i in range(ROTATION_STATES):
+		rules[(first + i, 1)] = (first + (i + 1) % ROTATION_STATES, 1, 0)
+	return rules, [1] * n, n
+
+# The lines of a Binary Turing Machine!? program with the rules and tape
+def btm_source(rules, tape):
+	lines = []
+	for (state, symbol), transition in rules.items():
+		for value in (state, symbol) + transition:
+			lines.append(f"01{value:b}!")
+	for value in tape:
+		lines.append(f"01{value:b}?")
+	return lines
@@ -0,0 +1,285 @@
+# Bitboard representation of the chess board
+# For use with the chessoteric programming language
+import random
+
+# Squares are numbered row * 8 + column, so a1 is bit 0 and h8 is bit 63
+COLORS = ('w', 'b')
+PIECE_TYPES = ('P', 'N', 'B', 'R', 'Q', 'K')
+PIECE_NAMES = tuple(color + piece_type for color in COLORS for piece_type in PIECE_TYPES)
+
+# Ray directions as (row, column) steps. The first four increase the square number.
+NORTH, EAST, NORTH_EAST, NORTH_WEST, SOUTH, WEST, SOUTH_WEST, SOUTH_EAST = range(8)
+DIRECTIONS = ((1, 0), (0, 1), (1, 1), (1, -1), (-1, 0), (0, -1), (-1, -1), (-1, 1))
+ROOK_DIRECTIONS = (NORTH, EAST, SOUTH, WEST)
+BISHOP_DIRECTIONS = (NORTH_EAST, NORTH_WEST, SOUTH_WEST, SOUTH_EAST)
+
+# Castling rights, as the bits of BitBoard.castling: castling on the king's side (short) and on
+# the queen's side (long) for each color
+CASTLING_RIGHTS = {('w', False): 1, ('w', True): 2, ('b', False): 4, ('b', True): 8}
+# The castling rights lost when a piece leaves or lands on each square, which are those of the
+# king and rooks that start there
+CASTLING_LOST = tuple({4: 3, 0: 2, 7: 1, 60: 12, 56: 8, 63: 4}.get(square, 0) for square in range(64))
+
+def square_of(row, column):
+	return row * 8 + column
+
+# Iterate over the squares set in a bitboard, lowest first
+def squares(bitboard):
+	while bitboard:
+		low = bitboard & -bitboard
+		yield low.bit_length() - 1
+		bitboard ^= low
+
+def _step_table(steps):
+	table = []
+	for square in range(64):
+		row, column = divmod(square, 8)
+		mask = 0
+		for row_step, column_step in steps:
+			if 0 <= row + row_step < 8 and 0 <= column + column_step < 8:
+				mask |= 1 << square_of(row + row_step, column + column_step)
+		table.append(mask)
+	return tuple(table)
+
+def _ray_table(row_step, column_step):
+	table = []
+	for square in range(64):
+		row, column = divmod(square, 8)
+		mask = 0
+		row += row_step
+		column += column_step
+		while 0 <= row < 8 and 0 <= column < 8:
+			mask |= 1 << square_of(row, column)
+			row += row_step
+			column += column_step
+		table.append(mask)
+	return tuple(table)
+
+KNIGHT_ATTACKS = _step_table(((1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2)))
+KING_ATTACKS = _step_table(((1, 1), (1, 0), (1, -1), (0, 1), (0, -1), (-1, 1), (-1, 0), (-1, -1)))
+PAWN_ATTACKS = {'w': _step_table(((1, 1), (1, -1))), 'b': _step_table(((-1, 1), (-1, -1)))}
+RAYS = tuple(_ray_table(row_step, column_step) for row_step, column_step in DIRECTIONS)
+# Every square a rook or a bishop on a square could reach on an empty board
+ROOK_RAYS = tuple(RAYS[NORTH][square] | RAYS[EAST][square] | RAYS[SOUTH][square] | RAYS[WEST][square]
+                  for square in range(64))
+BISHOP_RAYS = tuple(RAYS[NORTH_EAST][square] | RAYS[NORTH_WEST][square] | RAYS[SOUTH_WEST][square] |
+                    RAYS[SOUTH_EAST][square] for square in range(64))
+
+def _between_table():
+	table = [[0] * 64 for square in range(64)]
+	for square in range(64):
+		for direction in range(8):
+			for other in squares(RAYS[direction][square]):
+				table[square][other] = RAYS[direction][square] & ~RAYS[direction][other] & ~(1 << other)
+	return tuple(tuple(row) for row in table)
+
+# BETWEEN[a][b] is the squares strictly between a and b if they share a row, column or diagonal
+BETWEEN = _between_table()
+
+def _rank_tables():
+	counts = tuple(bin(rank).count('1') for rank in range(256))
+	colors = [0] * (256 * 256)
+	for rank in range(256):
+		files = [column for column in range(8) if (rank >> column) & 1]
+		for pattern in range(1 << len(files)):
+			white = bits = 0
+			for i, column in enumerate(files):
+				if (pattern >> i) & 1:
+					white |= 1 << column
+					bits |= 1 << (len(files) - 1 - i)
+			colors[(rank << 8) | white] = bits
+	return counts, tuple(colors)
+
+# RANK_COUNTS[rank] is the number of pieces on a row whose occupied squares are the bits of rank,
+# and RANK_COLORS[(rank << 8) | white] the colors of those pieces as binary digits, 1 for the
+# squares in white and the first square the highest digit (see BitBoard.color_bits)
+RANK_COUNTS, RANK_COLORS = _rank_tables()
+
+# Random keys for Zobrist hashing: the hash of a board is the exclusive or of the keys of each
+# piece name on its square. They are drawn from a fixed seed so that hashes are reproducible.
+ZOBRIST_SEED = 2022
+_zobrist_random = random.Random(ZOBRIST_SEED)
+ZOBRIST_KEYS = {name: tuple(_zobrist_random.getrandbits(64) for square in range(64)) for name in PIECE_NAMES}
+
+def ray_attacks(square, occupied, direction):
+	ray = RAYS[direction][square]
+	blockers = ray & occupied
+	if blockers:
+		# The nearest blocker is the lowest bit for increasing rays and the highest bit otherwise
+		if direction < SOUTH:
+			blocker = (blockers & -blockers).bit_length() - 1
+		else:
+			blocker = blockers.bit_length() - 1
+		ray ^= RAYS[direction][blocker]
+	return ray
+
+def rook_attacks(square, occupied):
+	return ray_attacks(square, occupied, NORTH) | ray_attacks(square, occupied, EAST) | \
+	       ray_attacks(square, occupied, SOUTH) | ray_attacks(square, occupied, WEST)
+
+def bishop_attacks(square, occupied):
+	return ray_attacks(square, occupied, NORTH_EAST) | ray_attacks(square, occupied, NORTH_WEST) | \
+	       ray_attacks(square, occupied, SOUTH_WEST) | ray_attacks(square, occupied, SOUTH_EAST)
+
+def queen_attacks(square, occupied):
+	return rook_attacks(square, occupied) | bishop_attacks(square, occupied)
+
+# Squares attacked by the piece called name (such as "wN") standing on square
+def piece_attacks(name, square, occupied):
+	piece_type = name[1]
+	if piece_type == 'P':
+		return PAWN_ATTACKS[name[0]][square]
+	if piece_type == 'N':
+		return KNIGHT_ATTACKS[square]
+	if piece_type == 'B':
+		return bishop_attacks(square, occupied)
+	if piece_type == 'R':
+		return rook_attacks(square, occupied)
+	if piece_type == 'Q':
+		return queen_attacks(square, occupied)
+	return KING_ATTACKS[square]
+
+# The 8x8 Board of pieces, kept in sync with one occupancy bitboard per piece name and color
+# and with the squares attacked by each piece and by each side. Its Zobrist hash is updated as
+# pieces are placed and lifted. It also holds the castling rights (see CASTLING_RIGHTS), which are
+# those of the kings and rooks on their starting squares unless given, and the square of the pawn
+# that has just moved two squares, which may be captured en passant, or None. Moving pieces does
+# not change these, which is left to whatever makes the move (see chess_game.Position).
+class BitBoard(list):
+	def __init__(self, pieces, castling=None, en_passant=None):
+		super().__init__([None for x in range(8)] for y in range(8))
+		self.zobrist = 0
+		self.bitboards = {name: 0 for name in PIECE_NAMES}
+		self.colors = {color: 0 for color in COLORS}
+		self.occupied = 0
+		self.attacks = {}
+		self.attacked = {color: 0 for color in COLORS}
+		for p in pieces.values():
+			for piece in p:
+				self._place(piece)
+		for square in self.attacks:
+			self.attacks[square] = piece_attacks(self._name_at(square), square, self.occupied)
+		self._update_attacked()
+		if castling is None:
+			castling = 0
+			for (color, long), right in CASTLING_RIGHTS.items():
+				row = 0 if color == 'w' else 7
+				if (self.bitboards[color + 'K'] >> square_of(row, 4)) & 1 and \
+				   (self.bitboards[color + 'R'] >> square_of(row, 0 if long else 7)) & 1:
+					castling |= right
+		self.castling = castling
+		self.en_passant = en_passant
+
+	def _name_at(self, square):
+		return self[square // 8][square % 8].name
+
+	def _place(self, piece):
+		square = square_of(piece.row, piece.column)
+		bit = 1 << square
+		self[piece.row][piece.column] = piece
+		self.zobrist ^= ZOBRIST_KEYS[piece.name][square]
+		self.bitboards[piece.name] |= bit
+		self.colors[piece.name[0]] |= bit
+		self.occupied |= bit
+		self.attacks[square] = piece_attacks(piece.name, square, self.occupied)
+		return bit
+
+	def _lift(self, piece):
+		square = square_of(piece.row, piece.column)
+		bit = 1 << square
+		self[piece.row][piece.column] = None
+		self.zobrist ^= ZOBRIST_KEYS[piece.name][square]
+		self.bitboards[piece.name] &= ~bit
+		self.colors[piece.name[0]] &= ~bit
+		self.occupied &= ~bit
+		del self.attacks[square]
+		return bit
+
+	# Recompute the sliding pieces whose rays pass through the changed squares
+	def _update_attacks(self, changed):
+		bitboards = self.bitboards
+		sliders = bitboards['wB'] | bitboards['wR'] | bitboards['wQ'] | \
+		          bitboards['bB'] | bitboards['bR'] | bitboards['bQ']
+		for square in squares(sliders):
+			if self.attacks[square] & changed:
+				self.attacks[square] = piece_attacks(self._name_at(square), square, self.occupied)
+		self._update_attacked()
+
+	def _update_attacked(self):
+		for color in COLORS:
+			attacked = 0
+			for square in squares(self.colors[color]):
+				attacked |= self.attacks[square]
+			self.attacked[color] = attacked
+
+	def add(self, piece):
+		self._update_attacks(self._place(piece))
+
+	def remove(self, piece):
+		self._update_attacks(self._lift(piece))
+
+	# Move piece to destination_row, destination_column, which must be empty
+	def move(self, piece, destination_row, destination_column):
+		changed = self._lift(piece)
+		piece.move(destination_row, destination_column)
+		self._update_attacks(changed | self._place(piece))
+
+	# The colors of the pieces from a1 to h8 as binary digits, 1 for white and 0 for black with the
+	# first piece the highest digit, and the number of pieces, as (bits, length)
+	def color_bits(self):
+		occupied = self.occupied
+		white = self.colors['w']
+		bits = length = 0
+		for shift in range(0, 64, 8):
+			rank = (occupied >> shift) & 0xFF
+			if rank:
+				count = RANK_COUNTS[rank]
+				bits = (bits << count) | RANK_COLORS[(rank << 8) | ((white >> shift) & 0xFF)]
+				length += count
+		return bits, length
+
+	# Check if square is attacked by any piece of color
+	def is_attacked(self, square, color):
+		return (self.attacked[color] >> square) & 1 == 1
+
+	# Bitboard of the pieces of color that attack square when the board is occupied
+	def attackers(self, square, color, occupied=None):
+		if occupied is None:
+			occupied = self.occupied
+		bitboards = self.bitboards
+		opposite_color = 'w' if color == 'b' else 'b'
+		return (KNIGHT_ATTACKS[square] & bitboards[color + 'N']) | \
+		       (KING_ATTACKS[square] & bitboards[color + 'K']) | \
+		       (PAWN_ATTACKS[opposite_color][square] & bitboards[color + 'P']) | \
+		       (rook_attacks(square, occupied) & (bitboards[color + 'R'] | bitboards[color + 'Q'])) | \
+		       (bishop_attacks(square, occupied) & (bitboards[color + 'B'] | bitboards[color + 'Q']))
+
+	# Bitboard of the pieces called name that can move to square
+	def movers(self, name, square):
+		color = name[0]
+		bit = 1 << square
+		if self.colors[color] & bit:
+			return 0
+		if name[1] != 'P':
+			# Every piece but the pawn attacks symmetrically
+			return piece_attacks(name, square, self.occupied) & self.bitboards[name]
+
+		opposite_color = 'w' if color == 'b' else 'b'
+		pawns = self.bitboards[name]
+		if self.colors[opposite_color] & bit:
+			return PAWN_ATTACKS[opposite_color][square] & pawns
+
+		row, column = divmod(square, 8)
+		direction = 1 if color == 'w' else -1
+		home_row = 1 if color == 'w' else 6
+		origins = 0
+		if 0 <= row - direction < 8:
+			one_step = 1 << square_of(row - direction, column)
+			if pawns & one_step:
+				origins |= one_step
+			elif row - 2 * direction == home_row and not self.occupied & one_step:
+				origins |= pawns & (1 << square_of(home_row, column))
+		for origin in squares(PAWN_ATTACKS[opposite_color][square] & pawns):
+			if self[origin // 8][origin % 8].valid_en_passant(row, column, self):
+				origins |= 1 << origin
+		return origins
@@ -0,0 +1,85 @@
+# Cache of the machines loaded from chessoteric programs, so that a program that has been run
+# before does not need its chess game simulated again
+import hashlib
+import marshal
+import os
+import zlib
+from Machine import Machine
+from tape import Tape
+
+# Version of the interpreter. Change it whenever a change to the chess simulation or to the
+# Machine changes what a program loads, so that older cache entries are no longer used.
+VERSION = 2
+# Default directory and size (in bytes) of the cache
+CACHE_DIRECTORY = os.environ.get("CHESSOTERIC_CACHE_DIR",
+                                 os.path.join(os.path.expanduser("~"), ".cache", "chessoteric"))
+CACHE_SIZE = 64 << 20
+# Number of bytes hashed at a time
+BLOCK_SIZE = 1 << 16
+
+class ProgramCache:
+	def __init__(self, directory=CACHE_DIRECTORY, max_size=CACHE_SIZE):
+		self.directory = directory
+		self.max_size = max_size
+
+	# Key for a program whose source is read from the binary stream
+	def key(self, stream):
+		digest = hashlib.sha256(f"chessoteric {VERSION}\n".encode())
+		while True:
+			block = stream.read(BLOCK_SIZE)
+			if not block:
+				break
+			digest.update(block)
+		return digest.hexdigest()
+
+	def _path(self, key):
+		return os.path.join(self.directory, key + ".machine")
+
+	# The machine stored under key, or None if there is none
+	def load(self, key):
+		path = self._path(key)
+		try:
+			with open(path, "rb") as f:
+				rules, tape = marshal.loads(zlib.decompress(f.read()))
+			# Mark the entry as recently used
+			os.utime(path)
+		except (OSError, ValueError, EOFError, TypeError, zlib.error):
+			return None
+		mach = Machine()
+		mach.rules = {(state, symbol): (next_state, next_symbol, direction)
+		              for state, symbol, next_state, next_symbol, direction in rules}
+		mach.tape = Tape(tape)
+		return mach
+
+	# Store the rules and tape of a loaded machine under key. The cache is only an optimization,
+	# so failing to write to it is not an error.
+	def store(self, key, mach):
+		rules = [(state, symbol) + transition for (state, symbol), transition in mach.rules.items()]
+		data = zlib.compress(marshal.dumps((rules, mach.tape.tolist())))
+		path = self._path(key)
+		try:
+			os.makedirs(self.directory, exist_ok=True)
+			temporary_path = f"{path}.{os.getpid()}.tmp"
+			with open(temporary_path, "wb") as f:
+				f.write(data)
+			os.replace(temporary_path, path)
+			self.evict()
+		except OSError:
+			pass
+
+	# Remove the least recently used entries until the cache fits in its maximum size
+	def evict(self):
+		entries = []
+		for name in os.listdir(self.directory):
+			if name.endswith(".machine"):
+				status = os.stat(os.path.join(self.directory, name))
+				entries.append((status.st_mtime, status.st_size, name))
+		total = sum(size for used, size, name in entries)
+		for used, size, name in sorted(entries):
+			if total <= self.max_size:
+				break
+			try:
+				os.remove(os.path.join(self.directory, name))
+			except OSError:
+				continue
+			total -= size
@@ -0,0 +1,138 @@
+# Checkpoints of long runs of the Turing Machine, from which a run that was stopped or killed can
+# be resumed
+# For use with the chessoteric programming language
+import marshal
+import os
+import time
+import zlib
+from array import array
+from Machine import Budget, Machine
+from tape import Tape
+
+# Version of the format of checkpoint files
+VERSION = 1
+# Default number of seconds between checkpoints
+CHECKPOINT_INTERVAL = 60
+
+# Where a run had got to: the state of the machine, the index of its head, the steps it had
+# taken, the lines of input it had read and the bytes of output it had written
+class Checkpoint:
+	def __init__(self, state, head, steps, lines_read=0, bytes_written=0):
+		self.state = state
+		self.head = head
+		self.steps = steps
+		self.lines_read = lines_read
+		self.bytes_written = bytes_written
+
+# Save the rules and tape of mach with checkpoint to path. The file is replaced at once, so a run
+# killed while saving leaves the previous checkpoint whole.
+def save_checkpoint(path, mach, checkpoint):
+	tape = mach.tape
+	# A run of the table engine is saved with the symbols its tape stands for
+	if mach.table is not None:
+		tape = mach.table.restore_tape(tape)
+	# Pages are saved as the bytes of their arrays, or as lists for pages of Python ints
+	pages = [(number, page.typecode, page.tobytes()) if isinstance(page, array) else (number, None, list(page))
+	         for number, page in tape.pages.items()]
+	rules = [(state, symbol) + transition for (state, symbol), transition in mach.rules.items()]
+	position = (checkpoint.state, checkpoint.head, checkpoint.steps, checkpoint.lines_read, checkpoint.bytes_written)
+	data = marshal.dumps((VERSION, rules, tape.page_size, tape.typecode, tape.start, tape.end, pages, position))
+	temporary_path = f"{path}.{os.getpid()}.tmp"
+	with open(temporary_path, "wb") as f:
+		f.write(zlib.compress(data, 1))
+		f.flush()
+		os.fsync(f.fileno())
+	os.replace(temporary_path, path)
+
+# The Machine and Checkpoint saved at path, or None if there is no checkpoint there
+def load_checkpoint(path):
+	try:
+		with open(path, "rb") as f:
+			data = f.read()
+	except FileNotFoundError:
+		return None
+	try:
+		version, rules, page_size, typecode, start, end, pages, position = marshal.loads(zlib.decompress(data))
+	except (ValueError, EOFError, TypeError, zlib.error):
+		raise ValueError(f"Not a checkpoint: {path}")
+	if version != VERSION:
+		raise ValueError(f"Checkpoint saved by another version of the interpreter: {path}")
+	mach = Machine()
+	mach.rules = {(state, symbol): (next_state, next_symbol, direction)
+	              for state, symbol, next_state, next_symbol, direction in rules}
+	mach.tape = Tape(page_size=page_size)
+	mach.tape.typecode = typecode
+	mach.tape.start = start
+	mach.tape.end = end
+	for number, page_typecode, contents in pages:
+		if page_typecode is None:
+			mach.tape.pages[number] = contents
+		else:
+			page = mach.tape.pages[number] = array(page_typecode)
+			page.frombytes(contents)
+	return mach, Checkpoint(*position)
+
+# Saves checkpoints of a run of mach with io to path, whenever its Budget is checked (see
+# Machine.py) once interval seconds have passed since the last one
+class Checkpointer:
+	def __init__(self, path, mach, io, interval=CHECKPOINT_INTERVAL):
+		self.path = path
+		self.mach = mach
+		self.io = io
+		self.interval = interval
+		self.saved = time.monotonic()
+
+	def due(self):
+		return time.monotonic() - self.saved >= self.interval
+
+	# Save the run, which is in state with its head at index head after steps steps. The output
+	# is written out first, so that the checkpoint can say how much of it there is.
+	def save(self, state, head, steps):
+		self.io.flush()
+		save_checkpoint(self.path, self.mach, Checkpoint(state, head, steps, self.io.reader.lines_read,
+		                                                 self.io.writer.bytes_written))
+		self.saved = time.monotonic()
+
+	# Remove the checkpoint of a run that has halted
+	def remove(self):
+		try:
+			os.remove(self.path)
+		except FileNotFoundError:
+			pass
+
+# Open the file at path for the output of a run, as bytes or as text. For a run resumed from a
+# checkpoint, the output written after the checkpoint is cut off, as the run writes it again.
+def open_output(path, binary=False, checkpoint=None):
+	if checkpoint is None:
+		mode = "w"
+	else:
+		with open(path, "ab") as f:
+			f.truncate(checkpoint.bytes_written)
+		mode = "a"
+	if binary:
+		return open(path, mode + "b")
+	return open(path, mode, encoding="utf-8", newline="")
+
+# Pick the input and output of io up where the run saved in checkpoint left them
+def resume_io(io, checkpoint):
+	for line in range(checkpoint.lines_read):
+		io.reader.readline()
+	io.writer.bytes_written = checkpoint.bytes_written
+
+# Run mach with io for a command line: under a Budget of max_steps and time_limit, saving a
+# checkpoint to path (if there is one) every interval seconds, and continuing from checkpoint if
+# the run is being resumed. The checkpoint is removed once the machine halts.
+def run_with_checkpoints(mach, engine, io, stats=None, max_steps=None, time_limit=None, path=None,
+                         interval=CHECKPOINT_INTERVAL, checkpoint=None):
+	checkpointer = Checkpointer(path, mach, io, interval) if path is not None else None
+	budget = None
+	if max_steps is not None or time_limit is not None or checkpointer is not None:
+		budget = Budget(max_steps, time_limit, checkpointer=checkpointer)
+	if checkpoint is None:
+		steps = mach.run_machine(engine, io, budget, stats)
+	else:
+		resume_io(io, checkpoint)
+		steps = mach.run_machine(engine, io, budget, stats, checkpoint.state, checkpoint.head, checkpoint.steps)
+	if checkpointer is not None:
+		checkpointer.remove()
+	return steps
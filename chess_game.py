@@ -2,9 +2,20 @@
 # For use with the chessoteric programming language
 # Created by Jamie Large in 2022
 from pieces import *
+from bitboard import *
+from movegen import can_castle, has_legal_move, legal_movers
+from positions import PositionCache
 
 FILES = ('a', 'b', 'c', 'd', 'e', 'f', 'g', 'h')
 RANKS = ('1', '2', '3', '4', '5', '6', '7', '8')
+# Positions that have come up in the games simulated so far
+POSITION_CACHE = PositionCache()
+# Classes of the pieces a pawn may promote to, by their letters
+PROMOTION_CLASSES = {'Q': Queen, 'R': Rook, 'B': Bishop, 'N': Knight}
+# Classes of every piece by its letter
+PIECE_CLASSES = dict(PROMOTION_CLASSES, K=King, P=Pawn)
+# Castling rights by their letters in FEN
+FEN_CASTLING = {'K': ('w', False), 'Q': ('w', True), 'k': ('b', False), 'q': ('b', True)}
 
 def print_board(Board, turn, turn_number):
 	t = "White's turn" if turn == 'w' else "Black's turn"
@@ -17,11 +28,7 @@ def print_board(Board, turn, turn_number):
 		print([p.name if p is not None else '  ' for p in Board[i]])
 
 def update_board(pieces):
-	Board = [[None for x in range(8)] for y in range(8)]
-	for p in pieces.values():
-		for piece in p:
-			Board[piece.row][piece.column] = piece
-	return Board
+	return BitBoard(pieces)
 
 def initialize_game():
 	turn = 'w'	
@@ -42,6 +49,95 @@ def initialize_game():
 	Board = update_board(pieces)
 	return (Board, pieces, turn)
 
+# The game in the position described by fen, in Forsyth-Edwards Notation: the pieces on each row
+# from the 8th down, the side to move, the castling rights and the square that a pawn may capture
+# en passant on. The counts of moves that may follow are ignored. Castling rights and the en passant
+# square are checked against the pieces. Returns (Board, pieces, turn).
+def read_fen(fen):
+	fields = fen.split()
+	if len(fields) < 4 or len(fields[0].split('/')) != 8:
+		raise SyntaxError(f"Invalid FEN: {fen}")
+	pieces = {name: [] for name in PIECE_NAMES}
+	for i, text in enumerate(fields[0].split('/')):
+		row = 7 - i
+		column = 0
+		for char in text:
+			if char in "12345678":
+				column += int(char)
+				continue
+			if char.upper() not in PIECE_CLASSES or column > 7:
+				raise SyntaxError(f"Invalid FEN row: {text}")
+			name = ('w' if char.isupper() else 'b') + char.upper()
+			pieces[name].append(PIECE_CLASSES[char.upper()](name, row, column))
+			column += 1
+		if column != 8:
+			raise SyntaxError(f"Invalid FEN row: {text}")
+	if len(pieces["wK"]) != 1 or len(pieces["bK"]) != 1:
+		raise SyntaxError(f"FEN must have one king of each color: {fen}")
+
+	turn = fields[1]
+	if turn not in COLORS:
+		raise SyntaxError(f"Invalid side to move in FEN: {turn}")
+	castling = 0
+	if fields[2] != '-':
+		for char in fields[2]:
+			if char not in FEN_CASTLING:
+				raise SyntaxError(f"Invalid castling rights in FEN: {fields[2]}")
+			castling |= CASTLING_RIGHTS[FEN_CASTLING[char]]
+	en_passant = None
+	if fields[3] != '-':
+		target = fields[3]
+		if len(target) != 2 or target[0] not in FILES or target[1] != ('6' if turn == 'w' else '3'):
+			raise SyntaxError(f"Invalid en passant square in FEN: {target}")
+		# The pawn that may be captured has just passed over the square
+		en_passant = square_of(RANKS.index(target[1]) + (-1 if turn == 'w' else 1), FILES.index(target[0]))
+
+	Board = BitBoard(pieces, castling, en_passant)
+	# Castling rights need their king and rook on their starting squares, which is what the rights
+	# of a board built without them are
+	if castling & ~BitBoard(pieces).castling:
+		raise SyntaxError(f"Castling rights in FEN without their king and rook in place: {fields[2]}")
+	# The pawn that may be captured en passant must be the other side's, and the squares it passed
+	# over and started from must be empty
+	if en_passant is not None:
+		direction = 8 if turn == 'w' else -8
+		pawn = 1 << en_passant
+		if not Board.bitboards[('b' if turn == 'w' else 'w') + 'P'] & pawn or \
+		   Board.occupied & ((1 << (en_passant + direction)) | (1 << (en_passant + 2 * direction))):
+			raise SyntaxError(f"No pawn that could be captured en passant on {fields[3]} in FEN: {fen}")
+	opposite_king = pieces[('b' if turn == 'w' else 'w') + 'K'][0]
+	if Board.is_attacked(square_of(opposite_king.row, opposite_king.column), turn):
+		raise SyntaxError(f"The side that has just moved is in check in FEN: {fen}")
+	return Board, pieces, turn
+
+def square_name(square):
+	return FILES[square % 8] + RANKS[square // 8]
+
+# The move of the piece on origin of Board to destination, promoting to promotion (a piece letter)
+# if given, as written in a game before any check or checkmate symbol. Castling is the king moving
+# two squares. Pieces other than pawns name as little of their origin as tells them apart from the
+# other pieces of their kind that can legally move to destination.
+def move_san(Board, origin, destination, promotion=""):
+	name = Board[origin // 8][origin % 8].name
+	target = square_name(destination)
+	if name[1] == 'K' and abs(destination - origin) == 2:
+		return "O-O-O" if destination < origin else "O-O"
+	if name[1] == 'P':
+		move = f"{FILES[origin % 8]}x{target}" if origin % 8 != destination % 8 else target
+		return f"{move}={promotion}" if promotion else move
+	others = legal_movers(Board, name, destination) & ~(1 << origin)
+	origin_row, origin_column = divmod(origin, 8)
+	if not others:
+		origin_name = ""
+	elif not any(other % 8 == origin_column for other in squares(others)):
+		origin_name = FILES[origin_column]
+	elif not any(other // 8 == origin_row for other in squares(others)):
+		origin_name = RANKS[origin_row]
+	else:
+		origin_name = square_name(origin)
+	capture = (Board.occupied >> destination) & 1
+	return f"{name[1]}{origin_name}{'x' if capture else ''}{target}"
+
 def parse_code(code):
 	piece_name = code[0] if code[0] in ('R', 'N', 'B', 'Q', 'K') else 'P'
 	if piece_name == 'P' and code[0] not in FILES:
@@ -96,144 +192,179 @@ def parse_code(code):
 	return (piece_name, origin_row, origin_column, destination_row, destination_column, 
 			capturing, checking, checkmate, end_symbol, promotion_piece)
 
-def make_move(code, Board, pieces, turn):
-	for pawn in pieces[turn + 'P']:
-		pawn.en_passant = False
-
-	checking = checkmate = False
-	# Check for castle
-	if (len(code) >= 3 and code[0:3] == "O-O") or (len(code) >= 5 and code[0:5] == "O-O-O"):
-		rook_row = 0 if turn == 'w' else 7
-		rook_col = 0 if (len(code) >= 5 and code[0:5] == "O-O-O") else 7
-		king = pieces[turn + 'K'][0]
-		rooks = [r for r in pieces[turn + 'R'] if r.row == rook_row and r.column == rook_col]
-		
-		if len(rooks) != 1 or king.has_moved or rooks[0].has_moved or king.is_checked(king.row, king.column, pieces, Board):
-			raise SyntaxError(f"Invalid castle: {code}")
-
-		start = min(rook_col, king.column) + 1
-		end = max(rook_col, king.column)
-
-		for i in range(start, end):
-			if Board[rook_row][i] is not None or king.is_checked(rook_row, i, pieces, Board):
-				raise SyntaxError(f"Invalid castle: {code}")
+# Whether the opposite king is in check after turn has moved, and whether it is checkmated: in
+# check with no legal move to make
+def position_status(Board, pieces, turn):
+	opposite_turn = 'w' if turn == 'b' else 'b'
+	opposite_king = pieces[opposite_turn + 'K'][0]
+	in_check = opposite_king.is_checked(opposite_king.row, opposite_king.column, pieces, Board)
+	return in_check, in_check and not has_legal_move(Board, opposite_turn)
 
-		if (len(code) >= 5 and code[0:5] == "O-O-O"):
-			king.move(rook_row, 2)
-			rooks[0].move(rook_row, 3)
-		else:
-			king.move(rook_row, 6)
-			rooks[0].move(rook_row, 5)
+# A game in progress: its Board, lists of its pieces by name and whose turn it is. Moves are made
+# on it in place, and each one pushes what it changed onto a stack from which it can be taken back:
+# (piece moved, its origin, piece captured or None, castling rights and en passant square before
+# the move, (rook, its origin) when castling or None, piece promoted to or None).
+class Position:
+	def __init__(self, Board=None, pieces=None, turn='w'):
+		if Board is None:
+			Board, pieces, turn = initialize_game()
+		self.Board = Board
+		self.pieces = pieces
+		self.turn = turn
+		self.undo = []
 
-		i = 5 if (len(code) >= 5 and code[0:5] == "O-O-O") else 3
+	# Move the piece on origin to destination, promoting it to promotion (a piece letter) if given.
+	# The move must be legal: castling is the king moving two squares, and a pawn moving diagonally
+	# to an empty square captures en passant.
+	def make(self, origin, destination, promotion=""):
+		Board, pieces, turn = self.Board, self.pieces, self.turn
+		piece = Board[origin // 8][origin % 8]
+		captured = Board[destination // 8][destination % 8]
+		if captured is None and piece.name[1] == 'P' and origin % 8 != destination % 8:
+			captured = Board[origin // 8][destination % 8]
+		if captured is not None:
+			pieces[captured.name].remove(captured)
+			Board.remove(captured)
+		rook = None
+		if piece.name[1] == 'K' and abs(destination - origin) == 2:
+			rook_origin = origin - 4 if destination < origin else origin + 3
+			rook = (Board[rook_origin // 8][rook_origin % 8], rook_origin)
+			Board.move(rook[0], destination // 8, (origin + destination) // 2 % 8)
+		Board.move(piece, destination // 8, destination % 8)
+		promoted = None
+		if promotion:
+			pieces[piece.name].remove(piece)
+			Board.remove(piece)
+			promoted = PROMOTION_CLASSES[promotion](turn + promotion, destination // 8, destination % 8)
+			pieces[promoted.name].append(promoted)
+			Board.add(promoted)
+		self.undo.append((piece, origin, captured, Board.castling, Board.en_passant, rook, promoted))
+		Board.castling &= ~(CASTLING_LOST[origin] | CASTLING_LOST[destination])
+		Board.en_passant = destination if piece.name[1] == 'P' and abs(destination - origin) == 16 else None
+		self.turn = 'w' if turn == 'b' else 'b'
 
-		if i < len(code) and code[i] == '+':
-			checking = True
-			i += 1
-		elif i < len(code) and code[i] == '#':
-			checkmate = True
-			i += 1
-		if i < len(code) and code[i:] in ('!', '?', '!!', '!?', '?!', '??'):
-			end_symbol = code[i:]
-			i = len(code)
+	# Take back the last move made
+	def unmake(self):
+		piece, origin, captured, castling, en_passant, rook, promoted = self.undo.pop()
+		Board, pieces = self.Board, self.pieces
+		if promoted is not None:
+			pieces[promoted.name].remove(promoted)
+			Board.remove(promoted)
+			pieces[piece.name].append(piece)
+			Board.add(piece)
+		Board.move(piece, origin // 8, origin % 8)
+		if rook is not None:
+			Board.move(rook[0], rook[1] // 8, rook[1] % 8)
+		if captured is not None:
+			pieces[captured.name].append(captured)
+			Board.add(captured)
+		Board.castling = castling
+		Board.en_passant = en_passant
+		self.turn = 'w' if self.turn == 'b' else 'b'
 
-		if i < len(code):
-			raise SyntaxError(f"Invalid chess notation: {code}")
+	# Make the move written as code in chess notation, checking that it is legal and that its check
+	# and checkmate symbols are right. Returns its end symbol and whether it checkmates. A move that
+	# is not legal raises a SyntaxError and leaves the position as it was.
+	def play(self, code):
+		Board, pieces, turn = self.Board, self.pieces, self.turn
+		checking = checkmate = False
+		end_symbol = ""
+		# Check for castle
+		if code.startswith("O-O"):
+			row = 0 if turn == 'w' else 7
+			long = code.startswith("O-O-O")
+			if not can_castle(Board, turn, long):
+				raise SyntaxError(f"Invalid castle: {code}")
 
-	else:
-		piece_name, origin_row, origin_column, destination_row, destination_column, \
-		capturing, checking, checkmate, end_symbol, promotion_piece = parse_code(code)
+			i = 5 if long else 3
+			if i < len(code) and code[i] == '+':
+				checking = True
+				i += 1
+			elif i < len(code) and code[i] == '#':
+				checkmate = True
+				i += 1
+			if i < len(code) and code[i:] in ('!', '?', '!!', '!?', '?!', '??'):
+				end_symbol = code[i:]
+				i = len(code)
+
+			if i < len(code):
+				raise SyntaxError(f"Invalid chess notation: {code}")
+			self.make(square_of(row, 4), square_of(row, 2 if long else 6))
+
+		else:
+			piece_name, origin_row, origin_column, destination_row, destination_column, \
+			capturing, checking, checkmate, end_symbol, promotion_piece = parse_code(code)
 
-		possible_pieces = [p for p in pieces[turn + piece_name] if p.can_move(destination_row, destination_column, Board)]
+			# Only pieces that can move without leaving their king in check are considered
+			destination = square_of(destination_row, destination_column)
+			movers = legal_movers(Board, turn + piece_name, destination)
+			possible_pieces = [Board[square // 8][square % 8] for square in squares(movers)]
 
-		# Resolve ambiguity
-		if len(possible_pieces) > 1:
-			if origin_row != "":
-				possible_pieces = [p for p in possible_pieces if p.row == origin_row]
-			if origin_column != "":
-				possible_pieces = [p for p in possible_pieces if p.column == origin_column]
+			# Resolve ambiguity
 			if len(possible_pieces) > 1:
-				raise SyntaxError(f"Ambiguity in move: {code}")
-		elif len(possible_pieces) == 1 and (origin_row != "" or origin_column != "") and piece_name != 'P':
-			raise SyntaxError(f"Over-resolved ambiguity in move: {code}")
-
-		# Make sure at least one piece can move
-		if len(possible_pieces) == 0:
-			raise SyntaxError(f"Invalid move: {code}")
-
-		# If it's capturing, validate that it says so and make the capture
-		opposite_turn = 'w' if turn == 'b' else 'b'
-		destination_piece = Board[destination_row][destination_column]
-		if destination_piece is not None:
-			if destination_piece.name == opposite_turn + 'K':
-				raise SyntaxError(f"Cannot capture the king: {code}")
-			if destination_piece.name[0] == opposite_turn:
+				if origin_row != "":
+					possible_pieces = [p for p in possible_pieces if p.row == origin_row]
+				if origin_column != "":
+					possible_pieces = [p for p in possible_pieces if p.column == origin_column]
+				if len(possible_pieces) > 1:
+					raise SyntaxError(f"Ambiguity in move: {code}")
+			elif len(possible_pieces) == 1 and (origin_row != "" or origin_column != "") and piece_name != 'P':
+				raise SyntaxError(f"Over-resolved ambiguity in move: {code}")
+
+			# Make sure at least one piece can move
+			if len(possible_pieces) == 0:
+				if Board.movers(turn + piece_name, destination):
+					raise SyntaxError(f"Move places king in check: {code}")
+				raise SyntaxError(f"Invalid move: {code}")
+			piece = possible_pieces[0]
+
+			# If it's capturing, validate that it says so
+			opposite_turn = 'w' if turn == 'b' else 'b'
+			destination_piece = Board[destination_row][destination_column]
+			if destination_piece is not None:
+				if destination_piece.name == opposite_turn + 'K':
+					raise SyntaxError(f"Cannot capture the king: {code}")
+				if destination_piece.name[0] == opposite_turn and not capturing:
+					raise SyntaxError(f"Move captures a piece: {code}")
+			# En passant capture
+			elif piece.name[1] == 'P' and piece.valid_en_passant(destination_row, destination_column, Board):
 				if not capturing:
 					raise SyntaxError(f"Move captures a piece: {code}")
-				pieces[destination_piece.name] = [p for p in pieces[destination_piece.name] if p.row != destination_row or p.column != destination_column]
-		# En passant capture
-		elif possible_pieces[0].name[1] == 'P' and possible_pieces[0].valid_en_passant(destination_row, destination_column, Board):
-			direction = 1 if turn == 'w' else -1
-			if not capturing:
-				raise SyntaxError(f"Move captures a piece: {code}")
-			pieces[opposite_turn + 'P'] = [p for p in pieces[opposite_turn + 'P'] if p.row != destination_row - direction or p.column != destination_column]		
-
-		# Move the piece
-		possible_pieces[0].move(destination_row, destination_column)
-		# Promote a pawn if necessary
-		if promotion_piece != "":
-			if possible_pieces[0].name[1] != 'P' or destination_row not in (0, 7):
-				raise SyntaxError(f"Invalid pawn promotion")
-			pieces[possible_pieces[0].name] = [p for p in pieces[possible_pieces[0].name] if p.row != destination_row or p.column != destination_column]
-			if promotion_piece == 'Q':
-				pieces[turn + 'Q'].append(Queen(turn + 'Q', destination_row, destination_column))
-			elif promotion_piece == 'N':
-				pieces[turn + 'N'].append(Knight(turn + 'N', destination_row, destination_column))
-			elif promotion_piece == 'R':
-				pieces[turn + 'R'].append(Rook(turn + 'R', destination_row, destination_column))
-			elif promotion_piece == 'B':
-				pieces[turn + 'B'].append(Bishop(turn + 'B', destination_row, destination_column))
-		elif promotion_piece == "" and possible_pieces[0].name[1] == 'P' and destination_row in (0, 7):
-			raise SyntaxError(f"Must specify pawn for promotion")
-		Board = update_board(pieces)
-
-		# If the current king is in check
-		current_king = pieces[turn + 'K'][0]
-		if current_king.is_checked(current_king.row, current_king.column, pieces, Board):
-			raise SyntaxError(f"Move places king in check: {code}")
-
-	# Check if the opposite king is put in check correctly
-	opposite_turn = 'w' if turn == 'b' else 'b'
-	opposite_king = pieces[opposite_turn + 'K'][0]
-	in_check = opposite_king.is_checked(opposite_king.row, opposite_king.column, pieces, Board)
-	
-	# Check if the opposite king is put in checkmate correctly 
-	in_checkmate = True if in_check else False
-
-	possible_spots = ((opposite_king.row + 1, opposite_king.column + 1),
-					  (opposite_king.row + 1, opposite_king.column + 0),
-					  (opposite_king.row + 1, opposite_king.column - 1),
-					  (opposite_king.row + 0, opposite_king.column + 1),
-					  (opposite_king.row + 0, opposite_king.column - 1),
-					  (opposite_king.row - 1, opposite_king.column + 1),
-					  (opposite_king.row - 1, opposite_king.column + 0),
-					  (opposite_king.row - 1, opposite_king.column - 1))
-
-	for (possible_row, possible_column) in possible_spots:
-		if possible_row < 8 and possible_column < 8 and \
-		   possible_row > 0 and possible_column > 0 and \
-		   opposite_king.can_move(possible_row, possible_column, Board) and \
-		   not opposite_king.is_checked(possible_row, possible_column, pieces, Board):
-			in_checkmate = False
-
-	if in_checkmate and not checkmate:
-		raise SyntaxError(f"Need checkmate symbol: {code}")
-	elif not in_checkmate and checkmate:
-		raise SyntaxError(f"Invalid checkmate symbol: {code}")
-	
-	if in_check and not checking and not checkmate:
-		raise SyntaxError(f"Need check symbol: {code}")
-	elif not in_check and checking:
-		raise SyntaxError(f"Invalid check symbol: {code}")
-	
+
+			# Promote a pawn if necessary
+			if promotion_piece != "":
+				if piece.name[1] != 'P' or destination_row not in (0, 7):
+					raise SyntaxError(f"Invalid pawn promotion")
+			elif piece.name[1] == 'P' and destination_row in (0, 7):
+				raise SyntaxError(f"Must specify pawn for promotion")
+			self.make(square_of(piece.row, piece.column), destination, promotion_piece)
+
+		# The checks are only worked out for positions that have not come up recently. Whether the
+		# opposite king can escape check also depends on whether it may capture en passant.
+		position = POSITION_CACHE.get(Board)
+		status = position.status.get((turn, Board.en_passant))
+		if status is None:
+			status = position.status[(turn, Board.en_passant)] = position_status(Board, pieces, turn)
+		in_check, in_checkmate = status
+
+		# Check if the opposite king is put in check and checkmate correctly
+		error = None
+		if in_checkmate and not checkmate:
+			error = f"Need checkmate symbol: {code}"
+		elif not in_checkmate and checkmate:
+			error = f"Invalid checkmate symbol: {code}"
+		elif in_check and not checking and not checkmate:
+			error = f"Need check symbol: {code}"
+		elif not in_check and checking:
+			error = f"Invalid check symbol: {code}"
+		if error is not None:
+			self.unmake()
+			raise SyntaxError(error)
+
+		return end_symbol, in_checkmate
+
+# Make the move written as code on Board and pieces with turn to move, as Position.play does.
+# Returns Board, the move's end symbol and whether it checkmates.
+def make_move(code, Board, pieces, turn):
+	end_symbol, in_checkmate = Position(Board, pieces, turn).play(code)
 	return Board, end_symbol, in_checkmate
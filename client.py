@@ -0,0 +1,115 @@
+# Sends a chessoteric or Binary Turing Machine!? program to a running server.py and writes its
+# output as it arrives
+import argparse
+import http.client
+import json
+import socket
+import sys
+
+# Port on localhost that the server listens on by default
+PORT = 8737
+
+# An HTTP connection over a Unix domain socket
+class UnixHTTPConnection(http.client.HTTPConnection):
+	def __init__(self, socket_path, timeout=None):
+		super().__init__("localhost", timeout=timeout)
+		self.socket_path = socket_path
+
+	def connect(self):
+		self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		self.sock.connect(self.socket_path)
+
+def connect(socket_path=None, port=PORT):
+	if socket_path is not None:
+		return UnixHTTPConnection(socket_path)
+	return http.client.HTTPConnection("127.0.0.1", port)
+
+# The body of a response that is not 200 OK, raised as a RuntimeError
+def _check(response):
+	if response.status != 200:
+		try:
+			error = json.loads(response.read())["error"]
+		except (ValueError, KeyError, TypeError):
+			error = response.reason
+		raise RuntimeError(f"Server answered {response.status}: {error}")
+
+# Run the source of a program (kind is "chessoteric" or "btm") on the server, with input_text as
+# the lines of its input, writing its output to output (a text stream, or a binary one in binary
+# mode) as it arrives. Options left as None take the server's defaults. Returns the result of
+# the run: its status, steps, error and time (see batch.py).
+def run_remote(program, kind="chessoteric", input_text="", output=None, socket_path=None, port=PORT,
+               engine=None, max_steps=None, time_limit=None, binary=False):
+	if output is None:
+		output = sys.stdout.buffer if binary else sys.stdout
+	request = {"program": program, "kind": kind, "input": input_text, "binary": binary}
+	for name, value in (("engine", engine), ("max_steps", max_steps), ("time_limit", time_limit)):
+		if value is not None:
+			request[name] = value
+	connection = connect(socket_path, port)
+	try:
+		connection.request("POST", "/run", json.dumps(request), {"Content-Type": "application/json"})
+		response = connection.getresponse()
+		_check(response)
+		# The response is one JSON object per line: pieces of output, then the result
+		for line in response:
+			event = json.loads(line)
+			if "output" not in event:
+				return event
+			# Binary output is sent byte for byte as the characters 0-255
+			output.write(event["output"].encode("latin-1") if binary else event["output"])
+			output.flush()
+	finally:
+		connection.close()
+	raise RuntimeError("Server closed the connection before the program finished")
+
+# The server's counts of its workers and of the requests it is serving
+def server_status(socket_path=None, port=PORT):
+	connection = connect(socket_path, port)
+	try:
+		connection.request("GET", "/status")
+		response = connection.getresponse()
+		_check(response)
+		return json.loads(response.read())
+	finally:
+		connection.close()
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Run a chessoteric or Binary Turing Machine!? program on a running server.py")
+	parser.add_argument("file", nargs="?",
+	                    help="program to run (read from stdin if omitted); files ending in .btm are Binary Turing "
+	                         "Machine!? programs")
+	parser.add_argument("--btm", action="store_true", help="the program is a Binary Turing Machine!? program")
+	parser.add_argument("--input", metavar="FILE", help="send the lines of FILE as the input of the program")
+	parser.add_argument("--socket", metavar="PATH", help="connect to the server's Unix domain socket at PATH")
+	parser.add_argument("--port", type=int, default=PORT,
+	                    help="connect to the server on this port of localhost (default: %(default)s)")
+	parser.add_argument("--engine", help="engine to run the machine with (the server's default if omitted)")
+	parser.add_argument("--max-steps", type=int, metavar="N", help="stop the machine after N steps")
+	parser.add_argument("--time-limit", type=float, metavar="SECONDS",
+	                    help="stop the program after SECONDS, including loading it")
+	parser.add_argument("--binary", action="store_true",
+	                    help="write output symbols as raw bytes, and send input lines as bytes")
+	parser.add_argument("--status", action="store_true", help="print the server's status as JSON and exit")
+	args = parser.parse_args()
+
+	try:
+		if args.status:
+			print(json.dumps(server_status(args.socket, args.port)))
+			sys.exit()
+		if args.file is not None:
+			with open(args.file, "r", encoding="utf-8") as f:
+				source = f.read()
+		else:
+			source = sys.stdin.read()
+		input_text = ""
+		if args.input is not None:
+			with open(args.input, "rb") as f:
+				input_text = f.read().decode("latin-1" if args.binary else "utf-8")
+		kind = "btm" if args.btm or (args.file or "").endswith(".btm") else "chessoteric"
+		result = run_remote(source, kind, input_text, None, args.socket, args.port, args.engine, args.max_steps,
+		                    args.time_limit, args.binary)
+	except (OSError, RuntimeError) as e:
+		sys.exit(str(e))
+	if result["status"] != "ok":
+		sys.exit(result["error"])
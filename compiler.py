@@ -0,0 +1,253 @@
+# Compiles the rules of a Machine into a specialized Python function
+# For use with the chessoteric programming language
+from Machine import BLANK, INITIAL_STATE, INPUT_STATE, OUTPUT_STATE
+from accelerator import find_all_cycles, skip_cycles, write_run
+from stats import RUN_BUCKETS
+
+# Largest number of cases tested one after another before splitting them in half
+CHAIN_LENGTH = 4
+
+# Emit a dispatch over the sorted keys of cases, splitting in half until the chains are short
+def _dispatch(lines, depth, variable, keys, emit_case, emit_default):
+	indent = '\t' * depth
+	if len(keys) <= CHAIN_LENGTH:
+		for i, key in enumerate(keys):
+			lines.append(f"{indent}{'if' if i == 0 else 'elif'} {variable} == {key}:")
+			emit_case(lines, depth + 1, key)
+		if keys:
+			lines.append(f"{indent}else:")
+			emit_default(lines, depth + 1)
+		else:
+			emit_default(lines, depth)
+		return
+	middle = len(keys) // 2
+	lines.append(f"{indent}if {variable} < {keys[middle]}:")
+	_dispatch(lines, depth + 1, variable, keys[:middle], emit_case, emit_default)
+	lines.append(f"{indent}else:")
+	_dispatch(lines, depth + 1, variable, keys[middle:], emit_case, emit_default)
+
+def _halt(lines, depth):
+	lines.append('\t' * depth + "return")
+
+# The step that found no rule to apply was counted but not taken
+def _halt_counted(lines, depth):
+	lines.append('\t' * depth + "steps -= 1")
+	lines.append('\t' * depth + "return steps")
+
+# Move the head one cell right, onto the next page at the end of this one
+def _move_right(lines, indent):
+	lines.append(f"{indent}offset += 1")
+	lines.append(f"{indent}if offset == page_size:")
+	_next_page(lines, indent + '\t')
+
+def _next_page(lines, indent):
+	lines.append(f"{indent}number += 1")
+	lines.append(f"{indent}page = tape.page(number)")
+	lines.append(f"{indent}offset = 0")
+
+# Move the head one cell left, staying put at the start of the tape
+def _move_left(lines, indent, profiled=False):
+	lines.append(f"{indent}if offset > 0:")
+	lines.append(f"{indent}\toffset -= 1")
+	lines.append(f"{indent}elif number > 0:")
+	lines.append(f"{indent}\tnumber -= 1")
+	lines.append(f"{indent}\tpage = tape.page(number)")
+	lines.append(f"{indent}\toffset = page_size - 1")
+	if profiled:
+		lines.append(f"{indent}else:")
+		lines.append(f"{indent}\tblocked += 1")
+
+# Start a run of the head in heading (1 for right, -1 for left) if it was going the other way,
+# recording the run that ends. The head is as far right as it has been when it turns left.
+def _turn(lines, indent, heading):
+	lines.append(f"{indent}if heading != {heading}:")
+	lines.append(f"{indent}\tmoves[heading] += run")
+	lines.append(f"{indent}\truns[run.bit_length()] += 1")
+	if heading < 0:
+		lines.append(f"{indent}\tfarthest = max(farthest, number * page_size + offset)")
+	lines.append(f"{indent}\theading = {heading}")
+	lines.append(f"{indent}\trun = 0")
+
+# The (state, symbol) pairs of the rules of each cycle, in the order they are applied
+def _cycle_rules(states, cycles):
+	cycle_rules = {}
+	for (state, symbol), key_cycles in cycles.items():
+		cycle_rules[(state, symbol)] = []
+		for right, read, written in key_cycles:
+			rules = []
+			current = state
+			for c_symbol in (read if right else read[::-1]):
+				rules.append((current, c_symbol))
+				current = states[current][c_symbol][0]
+			cycle_rules[(state, symbol)].append(rules)
+	return cycle_rules
+
+# Generate the source of run(tape, io, state, head) for the rules, which starts in state with the
+# head at index head of the tape (the initial state and the start of the tape by default). The head
+# is kept as a page number and an offset into that page of the tape. With accelerate, short cycles
+# of rules and runs of output are applied as single macro steps (see accelerator.py). With budgeted,
+# the function is run(tape, io, budget, state, head, steps) instead, and counts its steps on from
+# steps, checking the Budget (with its state and head) whenever it has taken as many as the Budget
+# asked for, and returning the count when it halts. With profiled, it is
+# run(tape, io, budget, stats, state, head, steps), which also counts how often each rule is
+# applied and how the head moves, adding them to the Stats when it stops.
+def generate_source(rules, accelerate=False, budgeted=False, profiled=False):
+	budgeted = budgeted or profiled
+	states = {}
+	for (state, symbol), transition in rules.items():
+		# The input and output states never consult the rules
+		if state not in (INPUT_STATE, OUTPUT_STATE):
+			states.setdefault(state, {})[symbol] = transition
+	cycles = find_all_cycles(states) if accelerate else {}
+	rule_keys = sorted((state, symbol) for state in states for symbol in states[state])
+	rule_numbers = {key: i for i, key in enumerate(rule_keys)}
+	# Pages are widened up front to hold every symbol in the rules, so that rules (and macro steps)
+	# can write to them directly
+	largest_symbol = max([max(symbol, next_symbol) for transitions in states.values()
+	                      for symbol, (next_state, next_symbol, direction) in transitions.items()], default=BLANK)
+	halt = _halt_counted if budgeted else _halt
+	# Most steps a macro step may take without passing the next check of the Budget
+	allowance = ", check - steps + 1" if budgeted else ""
+
+	def emit_transition(state):
+		def emit(lines, depth, symbol):
+			indent = '\t' * depth
+			next_state, next_symbol, direction = states[state][symbol]
+			if profiled:
+				_turn(lines, indent, 1 if direction % 2 == 0 else -1)
+			if (state, symbol) in cycles:
+				counts = f", cycle_hits[({state}, {symbol})]" if profiled else ""
+				lines.append(f"{indent}moved = skip_cycles(page, offset, CYCLES[({state}, {symbol})]{allowance}{counts})")
+				lines.append(f"{indent}if moved >= 0:")
+				if budgeted:
+					lines.append(f"{indent}\tsteps += abs(moved - offset) - 1")
+				if profiled:
+					lines.append(f"{indent}\trun += abs(moved - offset)")
+				lines.append(f"{indent}\toffset = moved")
+				lines.append(f"{indent}\tif offset == page_size:")
+				_next_page(lines, indent + '\t\t')
+				lines.append(f"{indent}\tcontinue")
+			if profiled:
+				lines.append(f"{indent}hits[{rule_numbers[(state, symbol)]}] += 1")
+				lines.append(f"{indent}run += 1")
+			if next_symbol != symbol:
+				lines.append(f"{indent}page[offset] = {next_symbol}")
+			if direction % 2 == 0:
+				_move_right(lines, indent)
+			else:
+				_move_left(lines, indent, profiled)
+			if next_state != state:
+				lines.append(f"{indent}state = {next_state}")
+		return emit
+
+	def emit_state(lines, depth, state):
+		indent = '\t' * depth
+		if profiled and state in (INPUT_STATE, OUTPUT_STATE):
+			_turn(lines, indent, 1)
+			lines.append(f"{indent}run += 1")
+		if state == INPUT_STATE:
+			# The symbol read may not fit in the page, which is then replaced by a wider one
+			lines.append(f"{indent}tape[number * page_size + offset] = read_symbol()")
+			lines.append(f"{indent}page = tape.page(number)")
+			lines.append(f"{indent}state = {INITIAL_STATE}")
+		elif state == OUTPUT_STATE and accelerate:
+			lines.append(f"{indent}if symbol != {BLANK}:")
+			if budgeted:
+				lines.append(f"{indent}\tend = write_run(page, offset, write_symbols{allowance})")
+				lines.append(f"{indent}\tsteps += end - offset - 1")
+				if profiled:
+					lines.append(f"{indent}\trun += end - offset - 1")
+				lines.append(f"{indent}\toffset = end")
+			else:
+				lines.append(f"{indent}\toffset = write_run(page, offset, write_symbols)")
+			lines.append(f"{indent}\tif offset == page_size:")
+			_next_page(lines, indent + '\t\t')
+			lines.append(f"{indent}\tcontinue")
+			lines.append(f"{indent}state = {INITIAL_STATE}")
+		elif state == OUTPUT_STATE:
+			lines.append(f"{indent}if symbol != {BLANK}:")
+			lines.append(f"{indent}\twrite_symbol(symbol)")
+			lines.append(f"{indent}else:")
+			lines.append(f"{indent}\tstate = {INITIAL_STATE}")
+		else:
+			_dispatch(lines, depth, "symbol", sorted(states[state]), emit_transition(state), halt)
+			return
+		_move_right(lines, indent)
+
+	if profiled:
+		signature = f"def run(tape, io, budget, stats, state={INITIAL_STATE}, head=0, steps=0):"
+	elif budgeted:
+		signature = f"def run(tape, io, budget, state={INITIAL_STATE}, head=0, steps=0):"
+	else:
+		signature = f"def run(tape, io, state={INITIAL_STATE}, head=0):"
+	lines = [
+		signature,
+		"\tread_symbol = io.read_symbol",
+		"\twrite_symbol = io.write_symbol",
+		"\twrite_symbols = io.write_symbols",
+		f"\ttape.reserve({largest_symbol})",
+		"\tpage_size = tape.page_size",
+		"\tnumber, offset = divmod(head, page_size)",
+		"\tpage = tape.page(number)",
+	]
+	if budgeted:
+		lines += [
+			"\tcheck = budget.start(steps)",
+		]
+	# The loop of the profiled function is wrapped in a try, so that its stats are recorded however
+	# it stops
+	depth = 2
+	if profiled:
+		lines += [
+			f"\thits = [0] * {len(rule_keys)}",
+			"\tcycle_hits = {key: [0] * len(key_cycles) for key, key_cycles in CYCLES.items()}",
+			f"\truns = [0] * {RUN_BUCKETS}",
+			"\tmoves = {-1: 0, 0: 0, 1: 0}",
+			"\theading = 0",
+			"\trun = 0",
+			"\tfarthest = head",
+			# Steps taken before the run was resumed are not this run's
+			"\tresumed = steps",
+			"\tblocked = 0",
+			"\ttry:",
+		]
+		depth = 3
+	indent = '\t' * depth
+	lines += [
+		f"{indent[:-1]}while True:",
+		f"{indent}symbol = page[offset]",
+	]
+	if budgeted:
+		lines += [
+			f"{indent}if steps >= check:",
+			# A machine that halts now has not gone over its budget
+			f"{indent}\tif state != {INPUT_STATE} and state != {OUTPUT_STATE} and (state, symbol) not in RULES:",
+			f"{indent}\t\treturn steps",
+			f"{indent}\tcheck = budget.check(steps, state, number * page_size + offset)",
+			f"{indent}steps += 1",
+		]
+	_dispatch(lines, depth, "state", sorted(set(states) | {INPUT_STATE, OUTPUT_STATE}), emit_state, halt)
+	if profiled:
+		lines += [
+			"\tfinally:",
+			"\t\trule_hits = dict(zip(RULE_KEYS, hits))",
+			"\t\tfor key, counts in cycle_hits.items():",
+			"\t\t\tfor rules, count in zip(CYCLE_RULES[key], counts):",
+			"\t\t\t\tfor rule in rules:",
+			"\t\t\t\t\trule_hits[rule] += count",
+			"\t\tmoves[heading] += run",
+			"\t\truns[run.bit_length()] += 1",
+			"\t\tstats.add_run(steps - resumed, rule_hits, runs, moves, max(farthest, number * page_size + offset), blocked)",
+		]
+	return '\n'.join(lines) + '\n', cycles, rule_keys, _cycle_rules(states, cycles)
+
+# Compile the rules into run(tape, io, state, head), which runs the machine on a Tape with a
+# MachineIO, or with budgeted into run(tape, io, budget, state, head, steps), which also takes a
+# Budget and returns its step count, or with profiled into
+# run(tape, io, budget, stats, state, head, steps), which also records what it did in a Stats
+def compile_rules(rules, accelerate=False, budgeted=False, profiled=False):
+	source, cycles, rule_keys, cycle_rules = generate_source(rules, accelerate, budgeted, profiled)
+	namespace = {"CYCLES": cycles, "skip_cycles": skip_cycles, "write_run": write_run,
+	             "RULES": set(rule_keys), "RULE_KEYS": rule_keys, "CYCLE_RULES": cycle_rules}
+	exec(compile(source, "<chessoteric machine>", "exec"), namespace)
+	return namespace["run"]
@@ -0,0 +1,191 @@
+# Runs one Turing Machine on many inputs at once, as lanes of NumPy arrays that take a step together
+# For use with the chessoteric programming language
+import argparse
+import json
+import sys
+from array import array
+from io import BytesIO, StringIO
+import BTM
+import Chessoteric
+from cache import ProgramCache, CACHE_DIRECTORY
+from Machine import BLANK, INITIAL_STATE, INPUT_STATE, OUTPUT_STATE
+from machine_io import ByteWriter, MachineIO, TextWriter
+
+# NumPy is only needed by this engine, so the rest of the interpreter runs without it
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+# Number of cells of tape each lane starts with, at least
+TAPE_WIDTH = 1 << 10
+
+def _check_numpy():
+	if numpy is None:
+		raise RuntimeError("Running lanes needs NumPy, which is not installed (pip install numpy)")
+
+# The output of a lane, written from its symbols as MachineIO writes them
+def _output(symbols, binary):
+	stream = BytesIO() if binary else StringIO()
+	writer = ByteWriter(stream) if binary else TextWriter(stream)
+	writer.write_symbols(symbols)
+	writer.flush()
+	return stream.getvalue()
+
+# Run mach once for each of inputs (the bytes of each lane's input), starting each lane on its own
+# list of symbols from tapes, or on the machine's tape if there are none. Every lane takes a step
+# at once: its rule is looked up in the tables of the machine's RuleTable (see rule_table.py) by
+# index, and applied to all the lanes that have one with a single operation on each array. Lanes
+# in the input and output states read and write one at a time. A lane stops when it halts, when it
+# has taken max_steps steps and not halted, or when reading its input fails, and the others go on
+# without it.
+# Returns a list with the result of each lane: its status ("ok", "step_limit" or "error"), steps,
+# error and output as in the report of batch.py (an error's steps being those taken before the
+# read that failed), and its tape (as a list of symbols up to its last cell that is not blank) if
+# keep_tapes.
+def run_lanes(mach, inputs, tapes=None, max_steps=None, binary=False, keep_tapes=False):
+	_check_numpy()
+	# Symbols of the inputs and tapes are interned in a copy, leaving the machine's table as it is
+	table = mach.rule_table().copy()
+	if not isinstance(table.next_states, array):
+		raise ValueError("Too many states and symbols for a dense table of rules")
+	count = len(inputs)
+	n_symbols = table.n_symbols
+	next_states = numpy.frombuffer(table.next_states, dtype=numpy.int32).astype(numpy.int64)
+	next_symbols = numpy.frombuffer(table.next_symbols, dtype=numpy.int32)
+	moves = numpy.where(numpy.frombuffer(table.rights, dtype=numpy.int8) != 0, 1, -1)
+	initial, input_state, output_state = (table.state_ids[special] for special in (INITIAL_STATE, INPUT_STATE, OUTPUT_STATE))
+	symbols = table.symbols
+
+	if tapes is None:
+		tapes = [mach.tape.tolist()] * count
+	width = TAPE_WIDTH
+	while width < max((len(symbols_of_lane) for symbols_of_lane in tapes), default=0) + 1:
+		width *= 2
+	tape = numpy.zeros((count, width), dtype=numpy.int32)
+	for lane, symbols_of_lane in enumerate(tapes):
+		tape[lane, :len(symbols_of_lane)] = [table.symbol_id(symbol) for symbol in symbols_of_lane]
+	ios = [MachineIO(BytesIO(data), StringIO(), binary) for data in inputs]
+
+	results = [{"status": "ok", "steps": None, "error": None} for lane in range(count)]
+	# The lanes still running, with their states, heads and steps so far
+	lanes = numpy.arange(count)
+	state = numpy.full(count, initial, dtype=numpy.int64)
+	head = numpy.zeros(count, dtype=numpy.int64)
+	steps = numpy.zeros(count, dtype=numpy.int64)
+	# The lanes and symbols written by the output state at each step
+	written_lanes = []
+	written_symbols = []
+	while len(lanes):
+		symbol = tape[lanes, head]
+		known = symbol < n_symbols
+		index = state * n_symbols + numpy.where(known, symbol, 0)
+		next_state = numpy.where(known, next_states[index], -1)
+		applies = next_state >= 0
+		reading = state == input_state
+		writing = state == output_state
+		stopped = ~(applies | reading | writing)
+		if max_steps is not None:
+			limited = ~stopped & (steps >= max_steps)
+			for i in numpy.flatnonzero(limited):
+				results[lanes[i]].update(status="step_limit", error=f"Step limit of {max_steps} reached")
+			stopped |= limited
+		if stopped.any():
+			for i in numpy.flatnonzero(stopped):
+				results[lanes[i]]["steps"] = int(steps[i])
+			kept = ~stopped
+			lanes, state, head, steps = lanes[kept], state[kept], head[kept], steps[kept]
+			symbol, index, next_state = symbol[kept], index[kept], next_state[kept]
+			applies, reading, writing = applies[kept], reading[kept], writing[kept]
+			if not len(lanes):
+				break
+		steps += 1
+
+		if applies.any():
+			rule_index = index[applies]
+			tape[lanes[applies], head[applies]] = next_symbols[rule_index]
+			state[applies] = next_state[applies]
+			head[applies] += moves[rule_index]
+			# The head stays put at the start of the tape
+			numpy.maximum(head, 0, out=head)
+		if writing.any():
+			blank = writing & (symbol == BLANK)
+			written = writing & ~blank
+			written_lanes.append(lanes[written])
+			written_symbols.append(symbol[written])
+			state[blank] = initial
+			head[writing] += 1
+		if reading.any():
+			failed = numpy.zeros(len(lanes), dtype=bool)
+			for i in numpy.flatnonzero(reading):
+				lane = lanes[i]
+				try:
+					value = ios[lane].read_symbol()
+				except Exception as e:
+					# The read that failed is not a step
+					results[lane].update(status="error", steps=int(steps[i]) - 1, error=f"{type(e).__name__}: {e}")
+					failed[i] = True
+					continue
+				tape[lane, head[i]] = table.symbol_id(value)
+				state[i] = initial
+				head[i] += 1
+			if failed.any():
+				kept = ~failed
+				lanes, state, head, steps = lanes[kept], state[kept], head[kept], steps[kept]
+		if len(lanes) and head.max() >= width:
+			tape = numpy.concatenate((tape, numpy.zeros_like(tape)), axis=1)
+			width *= 2
+
+	# The symbols each lane wrote, in the order it wrote them
+	outputs = [[] for lane in range(count)]
+	if written_lanes:
+		written_lanes = numpy.concatenate(written_lanes)
+		written_symbols = numpy.concatenate(written_symbols)
+		for i in numpy.argsort(written_lanes, kind="stable"):
+			outputs[written_lanes[i]].append(symbols[written_symbols[i]])
+	for lane, result in enumerate(results):
+		result["output"] = _output(outputs[lane], binary)
+		if keep_tapes:
+			cells = numpy.flatnonzero(tape[lane])
+			result["tape"] = [symbols[symbol] for symbol in tape[lane, :cells[-1] + 1]] if len(cells) else []
+	return results
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Run a chessoteric or Binary Turing Machine!? program on many inputs at "
+	                                             "once, as lanes of NumPy arrays")
+	parser.add_argument("file", help="program to run; files ending in .btm are Binary Turing Machine!? programs")
+	parser.add_argument("inputs", nargs="*", help="files of input, one lane for each")
+	parser.add_argument("--vectors", metavar="FILE", help="also run one lane for each line of FILE, with that line as its input")
+	parser.add_argument("--max-steps", type=int, metavar="N", help="stop each lane after N steps")
+	parser.add_argument("--binary", action="store_true",
+	                    help="capture output symbols as raw bytes, and read input lines as bytes")
+	parser.add_argument("--no-cache", action="store_true",
+	                    help="always simulate the game instead of using the cache of loaded programs")
+	parser.add_argument("--cache-dir", default=CACHE_DIRECTORY, metavar="DIR",
+	                    help="directory of the cache of loaded programs")
+	args = parser.parse_args()
+
+	inputs = []
+	for path in args.inputs:
+		with open(path, "rb") as f:
+			inputs.append(f.read())
+	if args.vectors is not None:
+		with open(args.vectors, "rb") as f:
+			inputs += [line.rstrip(b"\r\n") for line in f]
+	if args.file.endswith(".btm"):
+		machine = BTM.load_file(args.file)
+	else:
+		machine = Chessoteric.load_file(args.file, None if args.no_cache else ProgramCache(args.cache_dir))
+	try:
+		results = run_lanes(machine, inputs, max_steps=args.max_steps, binary=args.binary)
+	except (RuntimeError, ValueError) as e:
+		sys.exit(str(e))
+	statuses = {}
+	for lane, result in enumerate(results):
+		if args.binary:
+			# Binary output is kept byte for byte as the characters 0-255
+			result["output"] = result["output"].decode("latin-1")
+		print(json.dumps(dict(lane=lane, **result)))
+		statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+	print(", ".join(f"{count} {status}" for status, count in sorted(statuses.items())), file=sys.stderr)
@@ -0,0 +1,166 @@
+# Input and output for the Turing Machine of the chessoteric programming language
+import codecs
+import sys
+
+# Number of characters or bytes of output held before they are written out
+BUFFER_SIZE = 1 << 16
+# Number of bytes of input read at a time
+READ_SIZE = 1 << 16
+
+# Reads input one line at a time for the input state, taking blocks of whatever is available from
+# a binary (or text) stream. In binary mode every byte of a line is a character of its own, and
+# otherwise lines may end in "\r\n" as well as "\n", as with input().
+class LineReader:
+	def __init__(self, stream=None, binary=False):
+		if stream is None:
+			stream = getattr(sys.stdin, "buffer", sys.stdin)
+		self.stream = stream
+		self.binary = binary
+		self.decoder = codecs.getincrementaldecoder("latin-1" if binary else "utf-8")("strict")
+		self.lines = []
+		self.partial = ""
+		self.at_end = False
+		self.bytes_read = 0
+		# Number of lines returned, which is where a resumed run picks the input up again
+		self.lines_read = 0
+
+	def _fill(self):
+		read = getattr(self.stream, "read1", self.stream.read)
+		block = read(READ_SIZE)
+		self.bytes_read += len(block)
+		if not block:
+			self.at_end = True
+		if isinstance(block, str):
+			text = self.partial + block
+		else:
+			text = self.partial + self.decoder.decode(block, final=not block)
+		# A "\r" at the end of the block stays in partial until the "\n" after it is read
+		if not self.binary and '\r' in text:
+			text = text.replace('\r\n', '\n')
+		self.lines = text.split('\n')
+		self.partial = self.lines.pop()
+		self.lines.reverse()
+
+	# The next line without its newline, like input()
+	def readline(self):
+		while not self.lines:
+			if self.at_end:
+				if self.partial:
+					line, self.partial = self.partial, ""
+					if not self.binary and line.endswith('\r'):
+						line = line[:-1]
+					self.lines_read += 1
+					return line
+				raise EOFError("No input left for the input state")
+			self._fill()
+		self.lines_read += 1
+		return self.lines.pop()
+
+# Collects text output and writes it to a text stream in blocks
+class TextWriter:
+	def __init__(self, stream=None, buffer_size=BUFFER_SIZE):
+		if stream is None:
+			stream = sys.stdout
+		self.stream = stream
+		self.buffer_size = buffer_size
+		self.buffer = []
+		self.strings = {}
+		self.bytes_written = 0
+		self.encoding = getattr(stream, "encoding", None) or "utf-8"
+		self.errors = getattr(stream, "errors", None) or "strict"
+
+	# The text printed for symbol: its character, or the integer if it has no printable character
+	def _string(self, symbol):
+		try:
+			string = chr(symbol)
+			string.encode(self.encoding, self.errors)
+		except (ValueError, OverflowError, UnicodeEncodeError):
+			string = str(symbol)
+		self.strings[symbol] = string
+		return string
+
+	def write_symbol(self, symbol):
+		string = self.strings.get(symbol)
+		if string is None:
+			string = self._string(symbol)
+		self.buffer.append(string)
+		if len(self.buffer) >= self.buffer_size:
+			self.flush()
+
+	def write_symbols(self, symbols):
+		strings = self.strings
+		for symbol in symbols:
+			string = strings.get(symbol)
+			self.buffer.append(string if string is not None else self._string(symbol))
+		if len(self.buffer) >= self.buffer_size:
+			self.flush()
+
+	def flush(self):
+		if self.buffer:
+			text = ''.join(self.buffer)
+			self.buffer = []
+			self.bytes_written += len(text.encode(self.encoding, self.errors))
+			self.stream.write(text)
+		self.stream.flush()
+
+# Writes each symbol as a single byte to a binary stream, or as its integer if it is not a byte
+class ByteWriter:
+	def __init__(self, stream=None, buffer_size=BUFFER_SIZE):
+		if stream is None:
+			stream = sys.stdout.buffer
+		self.stream = stream
+		self.buffer_size = buffer_size
+		self.buffer = bytearray()
+		self.bytes_written = 0
+
+	def write_symbol(self, symbol):
+		if 0 <= symbol < 256:
+			self.buffer.append(symbol)
+		else:
+			self.buffer += str(symbol).encode()
+		if len(self.buffer) >= self.buffer_size:
+			self.flush()
+
+	def write_symbols(self, symbols):
+		for symbol in symbols:
+			if 0 <= symbol < 256:
+				self.buffer.append(symbol)
+			else:
+				self.buffer += str(symbol).encode()
+		if len(self.buffer) >= self.buffer_size:
+			self.flush()
+
+	def flush(self):
+		if self.buffer:
+			self.bytes_written += len(self.buffer)
+			self.stream.write(self.buffer)
+			self.buffer = bytearray()
+		self.stream.flush()
+
+# The input and output of a Machine
+class MachineIO:
+	def __init__(self, input_stream=None, output_stream=None, binary=False, buffer_size=BUFFER_SIZE):
+		self.reader = LineReader(input_stream, binary)
+		if binary:
+			self.writer = ByteWriter(output_stream, buffer_size)
+		else:
+			self.writer = TextWriter(output_stream, buffer_size)
+		self.write_symbol = self.writer.write_symbol
+		self.write_symbols = self.writer.write_symbols
+
+	# Read one symbol: an integer, or else the sum of the characters typed
+	def read_symbol(self):
+		if not self.reader.lines:
+			# Show the output so far before waiting for input, like input() does
+			self.writer.flush()
+		user_input = self.reader.readline()
+		try:
+			return int(user_input)
+		except ValueError:
+			int_input = 0
+			for c in user_input:
+				int_input += ord(c)
+			return int_input
+
+	def flush(self):
+		self.writer.flush()
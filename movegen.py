@@ -0,0 +1,157 @@
+# Legal move generation, with pins and check evasions, from the lookup tables in bitboard.py
+# For use with the chessoteric programming language
+from bitboard import *
+
+# Every square on the board
+FULL = (1 << 64) - 1
+PROMOTION_PIECES = ('Q', 'R', 'B', 'N')
+
+def _opposite(color):
+	return 'w' if color == 'b' else 'b'
+
+def king_square(Board, color):
+	return Board.bitboards[color + 'K'].bit_length() - 1
+
+# The squares that a piece of color other than its king may move to without leaving the king in
+# check, and a mask of the squares along its pin for each pinned piece, as (evasions, pins).
+# Evasions are every square when the king is not in check, the checking piece and the squares
+# between it and a sliding checker in single check, and no square in double check.
+def restrictions(Board, color):
+	opposite_color = _opposite(color)
+	king = king_square(Board, color)
+	checkers = Board.attackers(king, opposite_color) if (Board.attacked[opposite_color] >> king) & 1 else 0
+	if not checkers:
+		evasions = FULL
+	elif checkers & (checkers - 1):
+		evasions = 0
+	else:
+		checker = checkers.bit_length() - 1
+		evasions = checkers | BETWEEN[king][checker]
+
+	bitboards = Board.bitboards
+	snipers = (ROOK_RAYS[king] & (bitboards[opposite_color + 'R'] | bitboards[opposite_color + 'Q'])) | \
+	          (BISHOP_RAYS[king] & (bitboards[opposite_color + 'B'] | bitboards[opposite_color + 'Q']))
+	pins = {}
+	for sniper in squares(snipers):
+		line = BETWEEN[king][sniper]
+		blockers = line & Board.occupied
+		# A single piece of color between the king and a sliding piece may only move along the line
+		if blockers and not blockers & (blockers - 1) and blockers & Board.colors[color]:
+			pins[blockers.bit_length() - 1] = line | (1 << sniper)
+	return evasions, pins
+
+# Check if the king of color would be safe on square, once it has left its own square
+def king_safe(Board, color, square):
+	king = Board.bitboards[color + 'K']
+	return not Board.attackers(square, _opposite(color), Board.occupied & ~king)
+
+# Check if capturing en passant from origin to destination leaves the king of color safe. Both
+# pawns leave their row at once, so the board after the capture is tested directly.
+def en_passant_safe(Board, color, origin, destination):
+	captured = 1 << (destination - 8 if color == 'w' else destination + 8)
+	occupied = (Board.occupied & ~(1 << origin) & ~captured) | (1 << destination)
+	return not Board.attackers(king_square(Board, color), _opposite(color), occupied) & ~captured
+
+def _is_en_passant(Board, origin, destination):
+	return origin % 8 != destination % 8 and not (Board.occupied >> destination) & 1
+
+# Bitboard of the pieces called name that can legally move to square
+def legal_movers(Board, name, square):
+	movers = Board.movers(name, square)
+	if not movers:
+		return 0
+	color = name[0]
+	if name[1] == 'K':
+		return movers if king_safe(Board, color, square) else 0
+
+	# Pieces off the king's lines cannot be pinned, so they are free to move when it is not in check
+	king = king_square(Board, color)
+	if not (Board.attacked[_opposite(color)] >> king) & 1 and not movers & (ROOK_RAYS[king] | BISHOP_RAYS[king]) \
+	   and not (name[1] == 'P' and not (Board.occupied >> square) & 1):
+		return movers
+	evasions, pins = restrictions(Board, color)
+	bit = 1 << square
+	legal = 0
+	for origin in squares(movers):
+		if name[1] == 'P' and _is_en_passant(Board, origin, square):
+			if en_passant_safe(Board, color, origin, square):
+				legal |= 1 << origin
+		elif bit & evasions & pins.get(origin, FULL):
+			legal |= 1 << origin
+	return legal
+
+# Squares a pawn of color on origin may move to, ignoring pins and checks
+def _pawn_targets(Board, color, origin):
+	row, column = divmod(origin, 8)
+	direction = 1 if color == 'w' else -1
+	home_row = 1 if color == 'w' else 6
+	targets = PAWN_ATTACKS[color][origin] & Board.colors[_opposite(color)]
+	one_step = 1 << square_of(row + direction, column)
+	if not Board.occupied & one_step:
+		targets |= one_step
+		if row == home_row:
+			two_steps = 1 << square_of(row + 2 * direction, column)
+			if not Board.occupied & two_steps:
+				targets |= two_steps
+	pawn = Board[row][column]
+	for destination in squares(PAWN_ATTACKS[color][origin] & ~Board.occupied):
+		if pawn.valid_en_passant(destination // 8, destination % 8, Board):
+			targets |= 1 << destination
+	return targets
+
+# Check if color may castle on the queen's side (long) or on the king's side
+def can_castle(Board, color, long):
+	row = 0 if color == 'w' else 7
+	rook_column = 0 if long else 7
+	if not Board.castling & CASTLING_RIGHTS[(color, long)]:
+		return False
+	king = Board[row][4]
+	rook = Board[row][rook_column]
+	if king is None or king.name != color + 'K' or rook is None or rook.name != color + 'R':
+		return False
+	if BETWEEN[square_of(row, 4)][square_of(row, rook_column)] & Board.occupied:
+		return False
+	# The king may not castle out of, through or into check
+	path = (4, 3, 2) if long else (4, 5, 6)
+	attacked = Board.attacked[_opposite(color)]
+	return not any((attacked >> square_of(row, column)) & 1 for column in path)
+
+# Yield the legal moves of color as (origin, destination, promotion piece or ""). Castling is
+# the king moving two squares.
+def generate_moves(Board, color):
+	evasions, pins = restrictions(Board, color)
+	own = Board.colors[color]
+	king = king_square(Board, color)
+	for destination in squares(KING_ATTACKS[king] & ~own):
+		if king_safe(Board, color, destination):
+			yield king, destination, ""
+	# Only the king may move out of double check
+	if evasions:
+		for origin in squares(own & ~(1 << king)):
+			name = Board[origin // 8][origin % 8].name
+			if name[1] == 'P':
+				targets = _pawn_targets(Board, color, origin)
+			else:
+				targets = Board.attacks[origin] & ~own
+			allowed = evasions & pins.get(origin, FULL)
+			for destination in squares(targets):
+				if name[1] == 'P' and _is_en_passant(Board, origin, destination):
+					if not en_passant_safe(Board, color, origin, destination):
+						continue
+				elif not (allowed >> destination) & 1:
+					continue
+				if name[1] == 'P' and destination // 8 in (0, 7):
+					for piece in PROMOTION_PIECES:
+						yield origin, destination, piece
+				else:
+					yield origin, destination, ""
+	if evasions == FULL:
+		for long in (False, True):
+			if can_castle(Board, color, long):
+				yield king, king + (-2 if long else 2), ""
+
+def legal_moves(Board, color):
+	return list(generate_moves(Board, color))
+
+def has_legal_move(Board, color):
+	return next(generate_moves(Board, color), None) is not None
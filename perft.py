@@ -0,0 +1,167 @@
+# Counts the positions reached by every sequence of legal moves to a depth (perft), to check the
+# chess simulation against known counts and to time it
+# For use with the chessoteric programming language
+import argparse
+import sys
+import time
+from chess_game import Position, move_san, read_fen, square_name
+from movegen import legal_moves
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+# Well known positions with their counts at depths 1, 2, ..., as (name, FEN, counts). Between
+# them they castle, capture en passant (with the king in check along the rank), promote and give
+# discovered checks.
+REFERENCE = (
+	("start", START_FEN, (20, 400, 8902, 197281, 4865609)),
+	("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+	 (48, 2039, 97862, 4085603)),
+	("endgame", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", (14, 191, 2812, 43238, 674624)),
+	("promotion", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", (6, 264, 9467, 422333)),
+	("check", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", (44, 1486, 62379, 2103487)),
+	("middlegame", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+	 (46, 2079, 89890, 3894594)),
+)
+# Most positions counted for each reference position, which sets the depth it is searched to, and
+# the same when every move is played as written in a game, which is slower
+REFERENCE_NODES = 100000
+SAN_REFERENCE_NODES = 10000
+
+# The number of positions reached from position by every sequence of depth legal moves. The moves
+# at the last depth are counted without being made.
+def perft(position, depth):
+	if depth == 0:
+		return 1
+	moves = legal_moves(position.Board, position.turn)
+	if depth == 1:
+		return len(moves)
+	nodes = 0
+	for move in moves:
+		position.make(*move)
+		nodes += perft(position, depth - 1)
+		position.unmake()
+	return nodes
+
+# Play the move of the piece on origin to destination (promoting to promotion) on position as it
+# would be written in a game, through Position.play, which finds the piece from the notation and
+# checks the check or checkmate symbol. Raises a RuntimeError if no symbol makes it legal, or if a
+# different piece is moved.
+def play_san(position, origin, destination, promotion=""):
+	name = move_san(position.Board, origin, destination, promotion)
+	for suffix in ("", "+", "#"):
+		try:
+			position.play(name + suffix)
+		except SyntaxError as e:
+			error = e
+			continue
+		if position.undo[-1][1] != origin:
+			raise RuntimeError(f"{name + suffix} moved the piece on {square_name(position.undo[-1][1])} "
+			                   f"instead of {square_name(origin)}")
+		return name + suffix
+	raise RuntimeError(f"Legal move {name} was not played: {error}")
+
+# perft, counting every move (at the last depth too) by playing it with play_san, so that the
+# moves of movegen are checked against the way games are played
+def perft_san(position, depth):
+	if depth == 0:
+		return 1
+	nodes = 0
+	for move in legal_moves(position.Board, position.turn):
+		play_san(position, *move)
+		nodes += perft_san(position, depth - 1)
+		position.unmake()
+	return nodes
+
+# The count of perft for the position after each legal move of position, as (move, count), with
+# moves written as their origin and destination squares (and the piece promoted to), or as they
+# would be written in a game with san
+def divide(position, depth, san=False):
+	counts = []
+	for origin, destination, promotion in legal_moves(position.Board, position.turn):
+		if san:
+			name = play_san(position, origin, destination, promotion)
+			counts.append((name, perft_san(position, depth - 1)))
+		else:
+			position.make(origin, destination, promotion)
+			name = square_name(origin) + square_name(destination) + promotion.lower()
+			counts.append((name, perft(position, depth - 1)))
+		position.unmake()
+	return counts
+
+# The deepest depth whose count in counts is at most max_nodes, and at least 1
+def reference_depth(counts, max_nodes=REFERENCE_NODES):
+	return max([depth for depth, count in enumerate(counts, 1) if count <= max_nodes], default=1)
+
+# Count each reference position to the deepest depth with at most max_nodes positions, or to depth,
+# with perft_san if san. Returns (name, depth, count, expected count, seconds) for each of them.
+def run_reference(max_nodes=REFERENCE_NODES, depth=None, san=False):
+	results = []
+	for name, fen, counts in REFERENCE:
+		searched = min(depth, len(counts)) if depth is not None else reference_depth(counts, max_nodes)
+		position = Position(*read_fen(fen))
+		start = time.perf_counter()
+		nodes = (perft_san if san else perft)(position, searched)
+		results.append((name, searched, nodes, counts[searched - 1], time.perf_counter() - start))
+	return results
+
+def _rate(nodes, seconds):
+	return f"{nodes / seconds:,.0f} nodes/s" if seconds > 0 else "- nodes/s"
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Count the positions reached by every sequence of legal moves to a "
+	                                             "depth (perft) with the chess simulation of the chessoteric interpreter")
+	parser.add_argument("--fen", default=START_FEN, help="position to count from, in FEN (the starting position by default)")
+	parser.add_argument("--depth", type=int, metavar="N", help="number of half-moves to count to (default: 3)")
+	parser.add_argument("--divide", action="store_true", help="also print the count after each legal move")
+	parser.add_argument("--reference", action="store_true",
+	                    help="count each of the reference positions and check the counts against the known ones, "
+	                         "exiting with status 1 if any differs")
+	parser.add_argument("--san", action="store_true",
+	                    help="play every move as it would be written in a game, checking that the interpreter "
+	                         "finds the same piece to move and the right check and checkmate symbols")
+	parser.add_argument("--max-nodes", type=int, metavar="N",
+	                    help=f"with --reference and no --depth, count each position to the deepest depth with at "
+	                         f"most N positions (default: {REFERENCE_NODES}, or {SAN_REFERENCE_NODES} with --san)")
+	args = parser.parse_args()
+	if args.max_nodes is None:
+		args.max_nodes = SAN_REFERENCE_NODES if args.san else REFERENCE_NODES
+	if args.depth is not None and args.depth < 1:
+		parser.error("--depth must be at least 1")
+
+	if args.reference:
+		total_nodes = total_seconds = 0
+		wrong = 0
+		try:
+			results = run_reference(args.max_nodes, args.depth, args.san)
+		except RuntimeError as e:
+			sys.exit(str(e))
+		for name, depth, nodes, expected, seconds in results:
+			verdict = "ok" if nodes == expected else f"expected {expected}"
+			print(f"{name} depth {depth}: {nodes} nodes in {seconds:.3f}s ({_rate(nodes, seconds)}) {verdict}")
+			total_nodes += nodes
+			total_seconds += seconds
+			wrong += nodes != expected
+		print(f"Total: {total_nodes} nodes in {total_seconds:.3f}s ({_rate(total_nodes, total_seconds)})")
+		if wrong:
+			sys.exit(f"{wrong} of {len(REFERENCE)} counts differ from the reference")
+		sys.exit()
+
+	try:
+		position = Position(*read_fen(args.fen))
+	except SyntaxError as e:
+		sys.exit(str(e))
+	depth = 3 if args.depth is None else args.depth
+	start = time.perf_counter()
+	try:
+		if args.divide:
+			counts = divide(position, depth, args.san)
+			for move, count in counts:
+				print(f"{move}: {count}")
+			nodes = sum(count for move, count in counts)
+		else:
+			nodes = (perft_san if args.san else perft)(position, depth)
+	except RuntimeError as e:
+		sys.exit(str(e))
+	seconds = time.perf_counter() - start
+	print(f"Nodes: {nodes}")
+	print(f"Time: {seconds:.3f}s ({_rate(nodes, seconds)})")
@@ -0,0 +1,163 @@
+# Reads chess games written in PGN a piece at a time, and databases of many games written in
+# standard PGN, with tag pairs, comments, variations and numeric annotations
+# For use with the chessoteric programming language
+import mmap
+import os
+import re
+
+RESULTS = ('1-0', '0-1', '1/2-1/2')
+# Number of characters read from a stream at a time
+BLOCK_SIZE = 1 << 16
+# The annotations that numeric annotation glyphs ($1 to $6) stand for
+NAG_ANNOTATIONS = {1: '!', 2: '?', 3: '!!', 4: '??', 5: '!?', 6: '?!'}
+
+# A tag pair, whose value is quoted and may hold any character, escaping quotes and backslashes
+_TAG_PAIR = r'\[[^\]"]*(?:"(?:[^"\\]|\\.)*"[^\]"]*)*\]'
+# What divides a database into games: comments, tag pairs and results (or * for a game that has
+# none). A tag pair after moves that no result ended starts a new game.
+_STRUCTURE = re.compile(rb'\{[^}]*\}|;[^\n]*|' + _TAG_PAIR.encode() + rb'|(?<!\S)(1-0|0-1|1/2-1/2|\*)(?!\S)')
+# The tokens of a game: comments, tag pairs, numeric annotation glyphs, the parentheses around
+# variations, move numbers (a number with one period, or more for a move by black) and words
+_TOKEN = re.compile(r'\{[^}]*\}|;[^\n]*|' + _TAG_PAIR + r'|\$\d+|[()]|(\d+)\.+|([^\s{}()\[\];$]+)|\S')
+_TAG = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+_ESCAPE = re.compile(r'\\(.)')
+
+# Split the text of stream into words separated by whitespace, reading one block at a time
+def read_words(stream, block_size=BLOCK_SIZE):
+	partial = ""
+	while True:
+		block = stream.read(block_size)
+		if not block:
+			break
+		words = (partial + block).split()
+		# The last word may continue in the next block
+		partial = words.pop() if words and not block[-1].isspace() else ""
+		yield from words
+	if partial:
+		yield partial
+
+# Check the move numbers and the result of a game as its words arrive, yielding each move
+def read_moves(words):
+	# A word is only known not to be the result once the word after it arrives
+	previous = None
+	i = 0
+	for word in words:
+		if previous is not None:
+			if i % 3 == 0:
+				if not previous[:-1].isnumeric() or previous[-1] != '.' or int(previous[:-1]) != i // 3 + 1:
+					raise SyntaxError(f"Incorrect number: {previous}")
+			else:
+				yield previous
+			i += 1
+		previous = word
+
+	if previous not in RESULTS:
+		raise SyntaxError(f"Invalid ending: {previous}")
+
+# The byte offsets of the games in data, a PGN database, as a list of (start, end), found in a
+# single pass
+def index_games(data):
+	games = []
+	start = previous = 0
+	# Whether the game has any tag pairs and any moves yet
+	tagged = moved = False
+	for match in _STRUCTURE.finditer(data):
+		if not moved and data[previous:match.start()].strip():
+			moved = True
+		if match.group(1) is not None:
+			games.append((start, match.end()))
+			start = match.end()
+			tagged = moved = False
+		elif match.group().startswith(b'['):
+			if moved:
+				games.append((start, match.start()))
+				start = match.start()
+				moved = False
+			tagged = True
+		previous = match.end()
+	if tagged or moved or data[previous:].strip():
+		games.append((start, len(data)))
+	return games
+
+# The tag pairs of the text of a game, as a dict from their names to their values
+def read_tags(text):
+	tags = {}
+	for match in _TOKEN.finditer(text):
+		token = match.group()
+		if token.startswith('['):
+			tag = _TAG.fullmatch(token)
+			if tag is None:
+				raise SyntaxError(f"Invalid tag pair: {token}")
+			tags[tag.group(1)] = _ESCAPE.sub(r'\1', tag.group(2))
+		# The tag pairs come before the moves
+		elif not token.startswith(('{', ';')):
+			break
+	return tags
+
+# The words of the text of a game from a PGN database, as read_words splits a game: its tag pairs,
+# comments and variations left out, each move number written once as a number and a period, and
+# numeric annotation glyphs for the annotations of chessoteric written onto their moves
+def game_words(text):
+	# A move is only yielded once any glyph after it has been added to it
+	move = None
+	depth = 0
+	for match in _TOKEN.finditer(text):
+		token = match.group()
+		if token == '(':
+			depth += 1
+		elif token == ')':
+			if depth == 0:
+				raise SyntaxError("Unmatched ) in game")
+			depth -= 1
+		elif depth > 0 or token.startswith(('{', ';', '[')):
+			continue
+		elif token.startswith('$'):
+			annotation = NAG_ANNOTATIONS.get(int(token[1:]))
+			if annotation is not None and move is not None and move[-1] not in '.!?':
+				move += annotation
+		elif match.group(1) is not None:
+			# The number of a move by black after a comment repeats the number of white's move
+			if token.endswith('..'):
+				continue
+			if move is not None:
+				yield move
+			move = match.group(1) + '.'
+		elif match.group(2) is not None:
+			if move is not None:
+				yield move
+			move = token
+		else:
+			raise SyntaxError(f"Unexpected {token} in game")
+	if depth > 0:
+		raise SyntaxError("Unclosed variation in game")
+	if move is not None:
+		yield move
+
+# The bytes of the game between the byte offsets start and end of the file at path
+def read_game(path, start, end):
+	with open(path, "rb") as f:
+		f.seek(start)
+		return f.read(end - start)
+
+# A database of games in standard PGN, mapped into memory and indexed when it is opened
+class PGNDatabase:
+	def __init__(self, path):
+		self.path = path
+		with open(path, "rb") as f:
+			# An empty file cannot be mapped
+			if os.fstat(f.fileno()).st_size == 0:
+				self.data = b""
+			else:
+				self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		self.games = index_games(self.data)
+
+	def __len__(self):
+		return len(self.games)
+
+	# The text of game number (counting from 0)
+	def text(self, number):
+		start, end = self.games[number]
+		return self.data[start:end].decode("utf-8", "replace")
+
+	def tags(self, number):
+		return read_tags(self.text(number))
@@ -1,19 +1,18 @@
 # Class definitions for each chess piece
 # For use with the chessoteric programming language
 # Created by Jamie Large in 2022
+from bitboard import *
 
 class Piece:
 	def __init__(self, name, row, column):
 		self.name = name
 		self.row = row
 		self.column = column
-		self.has_moved = False
 
 	# Move piece to destination_row, destination_column
 	def move(self, destination_row, destination_column):
 		self.row = destination_row
 		self.column = destination_column
-		self.has_moved = True
 
 	# Check if piece can move
 	def can_move(self, destination_row, destination_column, Board):
@@ -25,54 +24,23 @@ class Piece:
 			raise ValueError(f"Piece {self.name} already at {self.row}, {self.column}")
 
 		# Make sure that there is no piece of the same color in this space already
-		if Board[destination_row][destination_column] is not None and \
-		   Board[destination_row][destination_column].name[0] == self.name[0]:
-			return False
-		return True
+		return not (Board.colors[self.name[0]] >> square_of(destination_row, destination_column)) & 1
 
 class Rook(Piece):
 	def can_move(self, destination_row, destination_column, Board):
 		if not Piece.can_move(self, destination_row, destination_column, Board):
 			return False
 
-		if self.row != destination_row and self.column != destination_column:
-			return False
-		
-		end = abs(self.row - destination_row) if self.row != destination_row else abs(self.column - destination_column)
-		row_increment = int((destination_row - self.row) / end)
-		column_increment = int((destination_column - self.column) / end)
-		row_counter = row_increment
-		column_counter = column_increment
-
-		for i in range(end - 1):
-			if Board[self.row + row_counter][self.column + column_counter] is not None:
-				return False
-			row_counter += row_increment
-			column_counter += column_increment
-
-		return True
+		attacks = rook_attacks(square_of(self.row, self.column), Board.occupied)
+		return (attacks >> square_of(destination_row, destination_column)) & 1 == 1
 
 class Bishop(Piece):
 	def can_move(self, destination_row, destination_column, Board):
 		if not Piece.can_move(self, destination_row, destination_column, Board):
 			return False
 
-		if abs(self.row - destination_row) != abs(self.column - destination_column):
-			return False
-
-		end = abs(self.row - destination_row)
-		row_increment = int((destination_row - self.row) / end)
-		column_increment = int((destination_column - self.column) / end)
-		row_counter = row_increment
-		column_counter = column_increment
-		
-		for i in range(end - 1):
-			if Board[self.row + row_counter][self.column + column_counter] is not None:
-				return False
-			row_counter += row_increment
-			column_counter += column_increment
-		
-		return True
+		attacks = bishop_attacks(square_of(self.row, self.column), Board.occupied)
+		return (attacks >> square_of(destination_row, destination_column)) & 1 == 1
 
 class Knight(Piece):
 	def can_move(self, destination_row, destination_column, Board):
@@ -89,18 +57,10 @@ class Queen(Rook, Bishop):
 		       Bishop.can_move(self, destination_row, destination_column, Board)
 
 class King(Piece):
+	# Check if the king would be attacked at destination_row, destination_column
 	def is_checked(self, destination_row, destination_column, pieces, Board):
-		original_piece = Board[destination_row][destination_column]
-		Board[destination_row][destination_column] = self
-		for p in pieces.values():
-			for piece in p:
-				if piece.name[0] != self.name[0] and \
-				   (piece.row != destination_row or piece.column != destination_column) and \
-				   piece.can_move(destination_row, destination_column, Board):
-					Board[destination_row][destination_column] = original_piece
-					return True
-		Board[destination_row][destination_column] = original_piece
-		return False
+		opposite_color = 'w' if self.name[0] == 'b' else 'b'
+		return Board.is_attacked(square_of(destination_row, destination_column), opposite_color)
 
 	def can_move(self, destination_row, destination_column, Board):
 		if not Piece.can_move(self, destination_row, destination_column, Board):
@@ -109,25 +69,15 @@ class King(Piece):
 		return (abs(self.row - destination_row) <= 1 and abs(self.column - destination_column) <= 1)
 
 class Pawn(Piece):
-	def __init__(self, name, row, column):
-		super().__init__(name, row, column)
-		self.en_passant = False
-
-	def move(self, destination_row, destination_column):
-		if abs(destination_row - self.row) == 2:
-			self.en_passant = True
-		super().move(destination_row, destination_column)
-
+	# Check if the pawn may capture en passant on destination_row, destination_column: the pawn it
+	# passes has just moved two squares (see BitBoard.en_passant)
 	def valid_en_passant(self, destination_row, destination_column, Board):
 		home_row = 1 if self.name[0] == 'w' else 6
 		direction = 1 if self.name[0] == 'w' else -1
-		opposite_color = 'w' if self.name[0] == 'b' else 'b'
 		return (destination_row == self.row + direction and \
 		        abs(destination_column - self.column) == 1 and \
 		        self.row == home_row + direction * 3 and \
-		        Board[destination_row - direction][destination_column] is not None and \
-		        Board[destination_row - direction][destination_column].name == opposite_color + 'P' and \
-		        Board[destination_row - direction][destination_column].en_passant)
+		        Board.en_passant == square_of(destination_row - direction, destination_column))
 
 	def can_move(self, destination_row, destination_column, Board):
 		if not Piece.can_move(self, destination_row, destination_column, Board):
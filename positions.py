@@ -0,0 +1,44 @@
+# Cache of what has been worked out about positions that come up again and again
+# For use with the chessoteric programming language
+from collections import OrderedDict
+
+# Number of positions kept before the least recently used one is dropped
+POSITION_CACHE_SIZE = 1 << 14
+
+# What is known about one arrangement of pieces: the string the Machine is sent for it, and for
+# each side that may have just moved there (with the square of the pawn it may have just moved
+# two squares, which could be captured en passant), whether the other king is in check and
+# whether it is checkmated. Anything not worked out yet is missing.
+class KnownPosition:
+	__slots__ = ("board_string", "status")
+
+	def __init__(self):
+		self.board_string = None
+		self.status = {}
+
+# Least recently used cache of KnownPositions, keyed by the Zobrist hash of the board (see bitboard.py)
+class PositionCache:
+	def __init__(self, size=POSITION_CACHE_SIZE):
+		self.size = size
+		self.positions = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+
+	# The KnownPosition of Board, which is new if it has not been seen recently
+	def get(self, Board):
+		key = Board.zobrist
+		position = self.positions.get(key)
+		if position is not None:
+			self.hits += 1
+			self.positions.move_to_end(key)
+			return position
+		self.misses += 1
+		position = self.positions[key] = KnownPosition()
+		if len(self.positions) > self.size:
+			self.positions.popitem(last=False)
+		return position
+
+	def clear(self):
+		self.positions.clear()
+		self.hits = 0
+		self.misses = 0
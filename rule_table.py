@@ -0,0 +1,202 @@
+# Rules of a Machine as flat tables indexed by small integers, for the table engine
+# For use with the chessoteric programming language
+import copy
+from array import array
+from Machine import BLANK, INITIAL_STATE, INPUT_STATE, OUTPUT_STATE
+from stats import RUN_BUCKETS
+from tape import Tape, widen_typecode
+
+# Largest number of entries of a dense table. The rules of machines with more (states, symbol)
+# pairs than this are kept in dicts, still keyed by the entry's index.
+TABLE_SIZE = 1 << 22
+
+# A dict of the next states of rules, with -1 (no rule) for every index without one
+class _SparseStates(dict):
+	def __missing__(self, index):
+		return -1
+
+# A page of the tape holding values, in the narrowest array that fits them
+def _page(values):
+	typecode = 'B'
+	for value in (min(values, default=BLANK), max(values, default=BLANK)):
+		typecode = widen_typecode(typecode, value)
+	return list(values) if typecode is None else array(typecode, values)
+
+# The rules with their states and symbols interned as small integers, counting from 0 in the order
+# they are first seen. The rule for state and symbol is at index state * n_symbols + symbol of
+# the tables of the next state (-1 for no rule), the next symbol and whether the head moves right.
+# Symbols that no rule reads (such as those read by the input state) are interned as they are
+# seen, after the symbols of the rules, so that no rule is found for them.
+class RuleTable:
+	def __init__(self, rules):
+		self.states = []
+		self.state_ids = {}
+		self.symbols = []
+		self.symbol_ids = {}
+		# The blank symbol is 0 in both forms, as cells that were never written are
+		for state in (INITIAL_STATE, INPUT_STATE, OUTPUT_STATE):
+			self.state_id(state)
+		self.symbol_id(BLANK)
+		for (state, symbol), (next_state, next_symbol, direction) in rules.items():
+			if state not in (INPUT_STATE, OUTPUT_STATE):
+				self.state_id(state)
+				self.state_id(next_state)
+				self.symbol_id(symbol)
+				self.symbol_id(next_symbol)
+		self.n_symbols = len(self.symbols)
+
+		size = len(self.states) * self.n_symbols
+		if size <= TABLE_SIZE:
+			self.next_states = array('i', [-1]) * size
+			self.next_symbols = array('i', [0]) * size
+			self.rights = array('b', [0]) * size
+		else:
+			self.next_states = _SparseStates()
+			self.next_symbols = {}
+			self.rights = {}
+		# The rules in the order of their indices, for the stats of a profiled run
+		self.rule_keys = {}
+		for (state, symbol), (next_state, next_symbol, direction) in rules.items():
+			# The input and output states never consult the rules
+			if state not in (INPUT_STATE, OUTPUT_STATE):
+				index = self.state_ids[state] * self.n_symbols + self.symbol_ids[symbol]
+				self.next_states[index] = self.state_ids[next_state]
+				self.next_symbols[index] = self.symbol_ids[next_symbol]
+				self.rights[index] = direction % 2 == 0
+				self.rule_keys[index] = (state, symbol)
+
+	# A RuleTable sharing the tables of rules of this one, with its own copies of the interned states
+	# and symbols. Runs intern the symbols they read and find on the tape in a copy, so that a
+	# RuleTable that is kept for many runs (such as the one a Machine caches) never grows.
+	def copy(self):
+		table = copy.copy(self)
+		table.states = list(self.states)
+		table.state_ids = dict(self.state_ids)
+		table.symbols = list(self.symbols)
+		table.symbol_ids = dict(self.symbol_ids)
+		return table
+
+	def state_id(self, state):
+		state_id = self.state_ids.get(state)
+		if state_id is None:
+			state_id = self.state_ids[state] = len(self.states)
+			self.states.append(state)
+		return state_id
+
+	def symbol_id(self, symbol):
+		symbol_id = self.symbol_ids.get(symbol)
+		if symbol_id is None:
+			symbol_id = self.symbol_ids[symbol] = len(self.symbols)
+			self.symbols.append(symbol)
+		return symbol_id
+
+	# A copy of tape with its symbols interned
+	def intern_tape(self, tape):
+		interned = Tape(page_size=tape.page_size)
+		interned.start, interned.end = tape.start, tape.end
+		symbol_ids = self.symbol_ids
+		symbol_id = self.symbol_id
+		for number, page in tape.pages.items():
+			interned.pages[number] = _page([symbol_ids[symbol] if symbol in symbol_ids else symbol_id(symbol)
+			                                for symbol in page])
+		interned.reserve(len(self.symbols))
+		return interned
+
+	# A copy of interned, a tape of interned symbols, with the symbols they stand for
+	def restore_tape(self, interned):
+		tape = Tape(page_size=interned.page_size)
+		tape.start, tape.end = interned.start, interned.end
+		symbols = self.symbols
+		for number, page in interned.pages.items():
+			tape.pages[number] = _page([symbols[symbol] for symbol in page])
+		return tape
+
+	# Run the machine on tape, which holds interned symbols, reading and writing through io, from
+	# state (as it is in the rules) with the head at index head. With a Budget, counts its steps on
+	# from steps, checking the Budget every so often, and with a Stats, records what the machine
+	# does as Machine.interpret does. Returns the number of steps taken.
+	def run(self, tape, io, budget=None, stats=None, state=INITIAL_STATE, head=0, steps=0):
+		read_symbol = io.read_symbol
+		write_symbol = io.write_symbol
+		next_states, next_symbols, rights = self.next_states, self.next_symbols, self.rights
+		n_symbols = self.n_symbols
+		states, symbols, symbol_ids = self.states, self.symbols, self.symbol_ids
+		initial, input_state, output_state = (self.state_ids[special] for special in (INITIAL_STATE, INPUT_STATE, OUTPUT_STATE))
+		current = self.state_id(state)
+		page_size = tape.page_size
+		number, offset = divmod(head, page_size)
+		page = tape.page(number)
+		check = budget.start(steps) if budget is not None else -1
+		resumed = steps
+		# How the head has moved, for stats (see compiler.py)
+		profiled = stats is not None
+		hits = {}
+		runs = [0] * RUN_BUCKETS
+		moves = {-1: 0, 0: 0, 1: 0}
+		heading = run = blocked = 0
+		farthest = head
+		try:
+			while True:
+				symbol = page[offset]
+				if symbol < n_symbols:
+					index = current * n_symbols + symbol
+					next_state = next_states[index]
+				else:
+					next_state = -1
+				if next_state >= 0:
+					right = rights[index]
+				elif current == input_state or current == output_state:
+					right = True
+				else:
+					return steps
+				if steps == check:
+					check = budget.check(steps, states[current], number * page_size + offset)
+				steps += 1
+
+				if profiled:
+					if next_state >= 0:
+						hits[index] = hits.get(index, 0) + 1
+					moving = 1 if right else -1
+					if moving != heading:
+						moves[heading] += run
+						runs[run.bit_length()] += 1
+						farthest = max(farthest, number * page_size + offset)
+						heading = moving
+						run = 0
+					run += 1
+
+				if next_state >= 0:
+					page[offset] = next_symbols[index]
+					current = next_state
+				elif current == input_state:
+					value = read_symbol()
+					# The symbol read may not fit in the page, which is then replaced by a wider one
+					tape[number * page_size + offset] = symbol_ids[value] if value in symbol_ids else self.symbol_id(value)
+					page = tape.page(number)
+					current = initial
+				elif symbol != BLANK:
+					write_symbol(symbols[symbol])
+				else:
+					current = initial
+
+				if right:
+					offset += 1
+					if offset == page_size:
+						number += 1
+						page = tape.page(number)
+						offset = 0
+				elif offset > 0:
+					offset -= 1
+				elif number > 0:
+					number -= 1
+					page = tape.page(number)
+					offset = page_size - 1
+				elif profiled:
+					blocked += 1
+		finally:
+			if profiled:
+				moves[heading] += run
+				runs[run.bit_length()] += 1
+				rule_keys = self.rule_keys
+				stats.add_run(steps - resumed, {rule_keys[index]: count for index, count in hits.items()}, runs, moves,
+				              max(farthest, number * page_size + offset), blocked)
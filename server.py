@@ -0,0 +1,336 @@
+# Serves chessoteric and Binary Turing Machine!? programs over a Unix domain socket or HTTP on
+# localhost, running them in a pool of warm worker processes and streaming their output back
+import argparse
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from http import HTTPStatus
+from io import BytesIO
+import BTM
+import Chessoteric
+from batch import GRACE_PERIOD, TIME_LIMIT, run_guarded
+from cache import ProgramCache, CACHE_DIRECTORY
+from client import PORT
+from Machine import ENGINES, Machine
+
+KINDS = ("chessoteric", "btm")
+# Default number of requests that may wait for a worker before more are turned away
+MAX_PENDING = 64
+# Number of loaded programs each worker keeps
+PROGRAM_CACHE_SIZE = 64
+# Number of output symbols sent back at a time
+STREAM_BUFFER_SIZE = 1 << 12
+# Largest request body accepted, in bytes
+MAX_REQUEST_SIZE = 64 << 20
+
+# Workers are started from a clean process rather than forked from the server, whose threads may
+# hold locks
+_context = multiprocessing.get_context("forkserver" if "forkserver" in multiprocessing.get_all_start_methods()
+                                       else "spawn")
+
+# A stream that sends what is written to it through the connection to the server, as
+# ("output", text or bytes). Sending blocks once the server stops reading, which holds the
+# machine up until a slow client catches up.
+class _PipeStream:
+	def __init__(self, conn):
+		self.conn = conn
+
+	def write(self, data):
+		self.conn.send(("output", bytes(data) if isinstance(data, bytearray) else data))
+
+	def flush(self):
+		pass
+
+# A Machine for the program of request, loaded from its source only if the worker has not loaded
+# it recently. Programs are kept as Machines whose tapes are never run on. Each run gets a copy
+# of the tape, and shares the rules and the functions compiled from them, so a program is only
+# compiled once by each worker.
+def _load_program(request, programs, cache):
+	source = request["program"].encode("utf-8")
+	key = hashlib.sha256(request["kind"].encode() + b"\n" + source).hexdigest()
+	loaded = programs.get(key)
+	if loaded is None:
+		if request["kind"] == "btm":
+			loaded = Machine()
+			BTM.load_bytes(loaded, source)
+			loaded.process_command("FLUSH")
+		else:
+			loaded = Chessoteric.load_source(source, cache)
+		programs[key] = loaded
+		if len(programs) > PROGRAM_CACHE_SIZE:
+			programs.popitem(last=False)
+	else:
+		programs.move_to_end(key)
+	mach = Machine()
+	mach.rules = loaded.rules
+	mach.compiled = loaded.compiled
+	mach.tape = loaded.tape.copy()
+	return mach
+
+def _open_input(request):
+	return BytesIO(request["input"].encode("latin-1" if request["binary"] else "utf-8"))
+
+# The loop of a worker process: run each request sent through conn, sending back its output as it
+# is written and then ("done", result), until the server closes the connection
+def _work(conn, cache_directory):
+	# The server stops its workers itself
+	signal.signal(signal.SIGINT, signal.SIG_IGN)
+	programs = OrderedDict()
+	cache = ProgramCache(cache_directory) if cache_directory is not None else None
+	stream = _PipeStream(conn)
+	while True:
+		try:
+			request = conn.recv()
+		except EOFError:
+			return
+		result = {"status": "ok", "steps": None, "error": None}
+		run_guarded(result, time.perf_counter(), partial(_load_program, request, programs, cache),
+		            partial(_open_input, request), stream, request["engine"], request["max_steps"],
+		            request["time_limit"], request["binary"], buffer_size=STREAM_BUFFER_SIZE)
+		conn.send(("done", result))
+
+class Worker:
+	def __init__(self, cache_directory=None):
+		self.conn, child = _context.Pipe()
+		self.process = _context.Process(target=_work, args=(child, cache_directory), daemon=True)
+		self.process.start()
+		child.close()
+
+	def stop(self):
+		self.process.kill()
+		self.process.join()
+		self.conn.close()
+
+# Result of a request whose worker never answered (see batch.py)
+def _lost(error):
+	return {"status": "lost", "steps": None, "error": error, "time": None}
+
+# Read an HTTP request, returning its method, path (without any query) and body
+async def _read_request(reader):
+	parts = (await reader.readline()).decode("latin-1").split()
+	if len(parts) != 3:
+		raise ValueError("Malformed request line")
+	method, target, version = parts
+	headers = {}
+	while True:
+		line = await reader.readline()
+		if line in (b"\r\n", b"\n", b""):
+			break
+		name, _, value = line.decode("latin-1").partition(":")
+		headers[name.strip().lower()] = value.strip()
+	length = int(headers.get("content-length", 0))
+	if length > MAX_REQUEST_SIZE:
+		raise ValueError(f"Request body is larger than {MAX_REQUEST_SIZE} bytes")
+	return method, target.partition("?")[0], await reader.readexactly(length)
+
+async def _respond(writer, status, body):
+	data = (json.dumps(body) + "\n").encode()
+	writer.write(f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\nContent-Type: application/json\r\n"
+	             f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode() + data)
+	await writer.drain()
+
+# Send body as one line of a response whose length is not known in advance. Waits until the
+# client has taken what was sent before, so that output never piles up in the server.
+async def _send_line(writer, body):
+	data = (json.dumps(body) + "\n").encode()
+	writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+	await writer.drain()
+
+# Runs the programs it is sent in a pool of workers, each of which runs one program at a time.
+# Requests wait for a worker in the order they came, and once max_pending are waiting, others are
+# turned away until there is room. Each request may ask for lower limits than the server's.
+class Server:
+	def __init__(self, workers=None, max_pending=MAX_PENDING, engine="compiled", max_steps=None,
+	             time_limit=TIME_LIMIT, cache_directory=None):
+		self.size = workers or os.cpu_count() or 1
+		self.max_pending = max_pending
+		self.engine = engine
+		self.max_steps = max_steps
+		self.time_limit = time_limit
+		self.cache_directory = cache_directory
+		self.workers = set()
+		self.idle = None
+		self.pending = 0
+		self.served = 0
+		# Each worker's answers are waited for on a thread of its own
+		self.executor = ThreadPoolExecutor(self.size)
+
+	# Start the workers and listen on the Unix domain socket at socket_path, or else on port of
+	# localhost. Returns the asyncio server.
+	async def start(self, socket_path=None, port=PORT):
+		self.idle = asyncio.Queue()
+		for i in range(self.size):
+			self.idle.put_nowait(self._start_worker())
+		if socket_path is not None:
+			return await asyncio.start_unix_server(self.handle, socket_path)
+		return await asyncio.start_server(self.handle, "127.0.0.1", port)
+
+	def _start_worker(self):
+		worker = Worker(self.cache_directory)
+		self.workers.add(worker)
+		return worker
+
+	# Stop worker, which may be in the middle of a program, and start another in its place
+	def _replace_worker(self, worker):
+		worker.stop()
+		self.workers.discard(worker)
+		return self._start_worker()
+
+	def close(self):
+		for worker in self.workers:
+			worker.stop()
+		self.workers.clear()
+		self.executor.shutdown(wait=False, cancel_futures=True)
+
+	def status(self):
+		return {"workers": self.size, "idle": self.idle.qsize(), "waiting": self.pending, "served": self.served}
+
+	async def handle(self, reader, writer):
+		try:
+			try:
+				method, path, body = await _read_request(reader)
+			except (ValueError, asyncio.IncompleteReadError, asyncio.LimitOverrunError) as e:
+				await _respond(writer, 400, {"error": str(e) or "Incomplete request"})
+				return
+			if path == "/status" and method == "GET":
+				await _respond(writer, 200, self.status())
+			elif path == "/run" and method == "POST":
+				try:
+					request = self._parse(body)
+				except ValueError as e:
+					await _respond(writer, 400, {"error": str(e)})
+					return
+				await self.run(request, writer)
+			else:
+				await _respond(writer, 404, {"error": f"No {method} {path}"})
+		except ConnectionError:
+			pass
+		finally:
+			writer.close()
+
+	# The request to run a program, with the server's limits and defaults filled in
+	def _parse(self, body):
+		try:
+			request = json.loads(body)
+		except ValueError:
+			raise ValueError("Request body is not JSON")
+		if not isinstance(request, dict) or not isinstance(request.get("program"), str):
+			raise ValueError("Request has no program")
+		parsed = {"program": request["program"], "kind": request.get("kind", "chessoteric"),
+		          "input": request.get("input", ""), "engine": request.get("engine", self.engine),
+		          "binary": bool(request.get("binary", False))}
+		if parsed["kind"] not in KINDS:
+			raise ValueError(f"Unknown kind of program: {parsed['kind']}")
+		if parsed["engine"] not in ENGINES:
+			raise ValueError(f"Unknown engine: {parsed['engine']}")
+		if not isinstance(parsed["input"], str):
+			raise ValueError("Input is not a string")
+		for name, kind in (("max_steps", int), ("time_limit", (int, float))):
+			limit = getattr(self, name)
+			value = request.get(name)
+			if value is not None:
+				if not isinstance(value, kind) or isinstance(value, bool) or value <= 0:
+					raise ValueError(f"Invalid {name}: {value}")
+				limit = value if limit is None else min(value, limit)
+			parsed[name] = limit
+		return parsed
+
+	# Run request on the next worker that is free, streaming its output and then its result back
+	async def run(self, request, writer):
+		if self.pending >= self.max_pending:
+			await _respond(writer, 503, {"error": "Too many requests are waiting for a worker"})
+			return
+		self.pending += 1
+		try:
+			worker = await self.idle.get()
+		finally:
+			self.pending -= 1
+		try:
+			writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n"
+			             b"Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n")
+			result = await self._stream(worker, request, writer)
+			if result["status"] == "lost":
+				worker = self._replace_worker(worker)
+		except BaseException:
+			# The client went away while its program was running, which only stopping the worker stops
+			worker = self._replace_worker(worker)
+			raise
+		finally:
+			self.served += 1
+			self.idle.put_nowait(worker)
+		await _send_line(writer, result)
+		writer.write(b"0\r\n\r\n")
+		await writer.drain()
+
+	async def _stream(self, worker, request, writer):
+		loop = asyncio.get_running_loop()
+		worker.conn.send(request)
+		deadline = None
+		if request["time_limit"] is not None:
+			deadline = loop.time() + request["time_limit"] + GRACE_PERIOD
+		while True:
+			timeout = None if deadline is None else max(deadline - loop.time(), 0)
+			try:
+				kind, value = await asyncio.wait_for(loop.run_in_executor(self.executor, worker.conn.recv), timeout)
+			except asyncio.TimeoutError:
+				return _lost("The worker running the program stopped answering")
+			except (EOFError, OSError):
+				return _lost("The worker running the program died")
+			if kind == "done":
+				return value
+			# Binary output is sent byte for byte as the characters 0-255
+			await _send_line(writer, {"output": value.decode("latin-1") if isinstance(value, bytes) else value})
+
+# Serve until interrupted or terminated, removing the socket (if any) afterwards
+async def serve(server, socket_path=None, port=PORT):
+	listener = await server.start(socket_path, port)
+	stopped = asyncio.Event()
+	loop = asyncio.get_running_loop()
+	for signal_number in (signal.SIGINT, signal.SIGTERM):
+		loop.add_signal_handler(signal_number, stopped.set)
+	print(f"Serving on {socket_path if socket_path is not None else f'http://127.0.0.1:{port}'} "
+	      f"with {server.size} workers", file=sys.stderr)
+	try:
+		async with listener:
+			await stopped.wait()
+	finally:
+		server.close()
+		if socket_path is not None:
+			try:
+				os.remove(socket_path)
+			except FileNotFoundError:
+				pass
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Serve chessoteric and Binary Turing Machine!? programs to client.py "
+	                                             "or any HTTP client")
+	parser.add_argument("--socket", metavar="PATH", help="listen on a Unix domain socket at PATH")
+	parser.add_argument("--port", type=int, default=PORT,
+	                    help="listen on this port of localhost, if there is no --socket (default: %(default)s)")
+	parser.add_argument("--workers", type=int, metavar="N", help="number of worker processes (one per CPU by default)")
+	parser.add_argument("--max-pending", type=int, default=MAX_PENDING, metavar="N",
+	                    help="turn requests away while N are waiting for a worker (default: %(default)s)")
+	parser.add_argument("--engine", choices=ENGINES, default="compiled",
+	                    help="engine for requests that do not name one")
+	parser.add_argument("--max-steps", type=int, metavar="N",
+	                    help="stop each program after N steps of its machine, or fewer if it asks")
+	parser.add_argument("--time-limit", type=float, default=TIME_LIMIT, metavar="SECONDS",
+	                    help=f"stop each program after SECONDS seconds, or fewer if it asks (default {TIME_LIMIT:g}, "
+	                         "0 for no limit)")
+	parser.add_argument("--no-cache", action="store_true",
+	                    help="always simulate the games instead of using the cache of loaded programs")
+	parser.add_argument("--cache-dir", default=CACHE_DIRECTORY, metavar="DIR",
+	                    help="directory of the cache of loaded programs")
+	args = parser.parse_args()
+
+	asyncio.run(serve(Server(args.workers, args.max_pending, args.engine, args.max_steps, args.time_limit or None,
+	                         None if args.no_cache else args.cache_dir), args.socket, args.port))
@@ -0,0 +1,151 @@
+# Statistics on where a chessoteric program spends its time, and on what its machine does
+import json
+import sys
+import time
+from contextlib import contextmanager
+
+# Number of the most applied rules listed in the summary
+TOP_RULES = 20
+# Number of buckets in the histogram of the lengths of the head's runs in one direction
+RUN_BUCKETS = 128
+
+# Label of a bucket of the histogram of run lengths, which holds the lengths with that many bits
+def _bucket_label(bits):
+	if bits <= 1:
+		return str(bits)
+	low, high = 1 << (bits - 1), (1 << bits) - 1
+	return f"{low}-{high}"
+
+# Collects timings of the phases of running a program (parsing the game, simulating its moves,
+# processing the commands they make, compiling and running the machine) and counts of what the
+# machine did: its steps, how often each rule was applied, how far along the tape the head went,
+# how the head moved, and how many bytes of input and output it read and wrote, as well as how
+# often positions in the game were found in the cache of positions (see positions.py). Pass a Stats to
+# the functions that run programs to fill it in. Without one, nothing is measured.
+class Stats:
+	def __init__(self):
+		self.phases = {}
+		self.calls = {}
+		self.steps = 0
+		self.rule_hits = {}
+		self.tape_extent = 0
+		# Cells the head moved in each direction, and times it tried to move left of the start
+		self.moves_right = 0
+		self.moves_left = 0
+		self.blocked = 0
+		# Numbers of runs of the head in one direction, by the number of bits in their length
+		self.runs = {}
+		self.bytes_read = 0
+		self.bytes_written = 0
+		self.position_hits = 0
+		self.position_misses = 0
+
+	def add_time(self, phase, seconds, calls=1):
+		self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+		self.calls[phase] = self.calls.get(phase, 0) + calls
+
+	# Time a block of code as part of phase
+	@contextmanager
+	def phase(self, phase):
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			self.add_time(phase, time.perf_counter() - start)
+
+	# Call function(*args) as part of phase, returning what it returns
+	def timed(self, phase, function, *args):
+		start = time.perf_counter()
+		try:
+			return function(*args)
+		finally:
+			self.add_time(phase, time.perf_counter() - start)
+
+	# Yield the items of iterator, timing how long each takes to arrive as part of phase
+	def timed_iterator(self, phase, iterator):
+		iterator = iter(iterator)
+		while True:
+			start = time.perf_counter()
+			try:
+				item = next(iterator)
+			except StopIteration:
+				self.add_time(phase, time.perf_counter() - start)
+				return
+			self.add_time(phase, time.perf_counter() - start)
+			yield item
+
+	# Add a run of the machine: its steps, the hits of each (state, symbol) rule, the histogram of
+	# its runs by bit length, the cells it moved in each direction, the farthest cell the head
+	# reached, and the times it was stopped by the start of the tape
+	def add_run(self, steps, rule_hits, runs, moves, farthest, blocked):
+		self.steps += steps
+		for rule, hits in rule_hits.items():
+			if hits:
+				self.rule_hits[rule] = self.rule_hits.get(rule, 0) + hits
+		# Runs of no length are where the head had not moved yet
+		for bits, count in enumerate(runs):
+			if bits > 0 and count:
+				self.runs[bits] = self.runs.get(bits, 0) + count
+		self.moves_right += moves[1]
+		self.moves_left += moves[-1]
+		self.tape_extent = max(self.tape_extent, farthest + 1)
+		self.blocked += blocked
+
+	def add_io(self, bytes_read, bytes_written):
+		self.bytes_read += bytes_read
+		self.bytes_written += bytes_written
+
+	def add_positions(self, hits, misses):
+		self.position_hits += hits
+		self.position_misses += misses
+
+	# The statistics as a dictionary that can be written as JSON
+	def to_dict(self):
+		return {
+			"phases": {phase: {"seconds": seconds, "calls": self.calls[phase]} for phase, seconds in self.phases.items()},
+			"steps": self.steps,
+			"rules": [[state, symbol, hits] for (state, symbol), hits in self.top_rules()],
+			"tape_extent": self.tape_extent,
+			"head": {"right": self.moves_right, "left": self.moves_left, "blocked": self.blocked,
+			         "runs": {_bucket_label(bits): self.runs[bits] for bits in sorted(self.runs)}},
+			"io": {"bytes_read": self.bytes_read, "bytes_written": self.bytes_written},
+			"positions": {"hits": self.position_hits, "misses": self.position_misses},
+		}
+
+	# The rules that were applied, most applied first, or only the first limit of them
+	def top_rules(self, limit=None):
+		rules = sorted(self.rule_hits.items(), key=lambda item: (-item[1], item[0]))
+		return rules if limit is None else rules[:limit]
+
+	# A summary of the statistics for people to read
+	def format(self, rules=None):
+		lines = ["Phases:"]
+		for phase, seconds in self.phases.items():
+			lines.append(f"  {phase:16} {seconds:12.6f} s  {self.calls[phase]:>10} calls")
+		lines.append(f"Steps: {self.steps}")
+		lines.append(f"Tape extent: {self.tape_extent} cells")
+		lines.append(f"Head moves: {self.moves_right} right, {self.moves_left} left, "
+		             f"{self.blocked} stopped at the start of the tape")
+		if self.runs:
+			lines.append("Head runs in one direction, by length:")
+			for bits in sorted(self.runs):
+				lines.append(f"  {_bucket_label(bits):>16} {self.runs[bits]:>12}")
+		lines.append(f"Input: {self.bytes_read} bytes read, output: {self.bytes_written} bytes written")
+		if self.position_hits or self.position_misses:
+			lines.append(f"Position cache: {self.position_hits} hits, {self.position_misses} misses")
+		if self.rule_hits:
+			lines.append(f"Rules applied, most first (of {len(self.rule_hits)}):")
+			for (state, symbol), hits in self.top_rules(TOP_RULES):
+				transition = f" -> {rules[(state, symbol)]}" if rules is not None and (state, symbol) in rules else ""
+				lines.append(f"  ({state}, {symbol}){transition}: {hits}")
+		return '\n'.join(lines)
+
+# Print the summary of stats to stderr if summary is set, and write them as JSON to the file at
+# json_path if it is given
+def write_stats(stats, summary=False, json_path=None):
+	if summary:
+		print(stats.format(), file=sys.stderr)
+	if json_path is not None:
+		with open(json_path, "w") as f:
+			json.dump(stats.to_dict(), f, indent=2)
+			f.write('\n')
@@ -0,0 +1,195 @@
+# Synthesizes a chessoteric game that loads the same rules and tape as a Binary Turing Machine!?
+# program
+# For use with the chessoteric programming language
+import argparse
+import sys
+from io import StringIO
+import BTM
+import Chessoteric
+from bitboard import *
+from chess_game import Position, move_san
+from movegen import king_square, legal_movers
+from pgn import read_words
+
+# An opening after which every black piece is on the 7th or 8th rank and every white piece but
+# the knight on g8 is below them, so that the knight on g8 is the first white piece after
+# black's lowest piece and the command is whatever stands on h8: 0 for black's rook, 1 for the
+# knight on g6 (once the rook has stepped aside to h7), and nothing when h8 is empty
+OPENING = ("h4", "g5", "hxg5", "h6", "gxh6", "Bg7", "h7", "Bf8", "hxg8=N", "Bg7",
+           "Nf3", "Bf8", "Nh4", "Bg7", "Ng6")
+# The moves, as (origin, destination), that write the commands after the opening: the knight
+# between g6 and h8 and the rook between h8 and h7, with white's knight between b1 and c3 and
+# black's bishop between f8 and g7 to pass a move
+WRITING_MOVES = tuple((origin, destination) for first, second in ((46, 63), (63, 55), (1, 18), (61, 54))
+                      for origin, destination in ((first, second), (second, first)))
+# Most half-moves searched ahead for the next position that writes a command
+SEARCH_DEPTH = 4
+
+# The writing moves that the side to move can make in position: those whose piece is its own and
+# whose destination is empty, and which are legal
+def writing_moves(position):
+	Board = position.Board
+	own = Board.colors[position.turn]
+	moves = []
+	for origin, destination in WRITING_MOVES:
+		if (own >> origin) & 1 and not (Board.occupied >> destination) & 1 and \
+		   (legal_movers(Board, Board[origin // 8][origin % 8].name, destination) >> origin) & 1:
+			moves.append((origin, destination))
+	return moves
+
+# Check if the side to move in position is in check
+def in_check(position):
+	Board = position.Board
+	return Board.is_attacked(king_square(Board, position.turn), 'w' if position.turn == 'b' else 'b')
+
+# The bits of the command the Machine is sent for Board: the colors of the pieces after the first
+# white piece that follows black's lowest piece (see Machine.process_bits)
+def command_bits(Board):
+	white, black = Board.colors['w'], Board.colors['b']
+	lowest = black & -black
+	above = white & -(lowest << 1)
+	anchor = above & -above
+	if not anchor:
+		return ""
+	return ''.join('1' if (white >> square) & 1 else '0' for square in squares(Board.occupied & -(anchor << 1)))
+
+# The values still to be written to the rules ('!') and to the tape ('?'), in binary
+class Streams:
+	def __init__(self, parts, tape):
+		self.values = {'!': [bin(value)[2:] for value in parts], '?': [bin(value)[2:] for value in tape]}
+		# The value being written to each stream and how many of its bits have been written
+		self.index = {'!': -1, '?': -1}
+		self.written = {'!': 0, '?': 0}
+
+	def finished(self):
+		return all(self.index[symbol] == len(values) - 1 and
+		           (not values or self.written[symbol] == len(values[-1]))
+		           for symbol, values in self.values.items())
+
+	# The number of bits that a command of bits would write, with the annotation that makes it do
+	# so, as (bits written, annotation). Writes no bits if bits are of no use.
+	def progress(self, bits):
+		best = (0, None)
+		for symbol, values in self.values.items():
+			index, written = self.index[symbol], self.written[symbol]
+			if index >= 0 and written < len(values[index]):
+				# Continue the value being written
+				if bits and values[index].startswith(bits, written):
+					best = max(best, (len(bits), symbol * 2))
+			elif index + 1 < len(values):
+				# Start the next value, which may have leading zeros
+				value = values[index + 1]
+				significant = bits.lstrip('0')
+				if value == '0':
+					if bits and not significant:
+						best = max(best, (1, symbol))
+				elif significant and value.startswith(significant):
+					best = max(best, (len(significant), symbol))
+		return best
+
+	def write(self, bits, annotation):
+		symbol = annotation[0]
+		if len(annotation) == 2:
+			self.written[symbol] += len(bits)
+		else:
+			self.index[symbol] += 1
+			self.written[symbol] = len(bits.lstrip('0')) or 1
+
+# Search breadth first for the fewest writing moves from position to a position whose command
+# writes bits to streams, writing the most bits among the nearest ones. Moves that give check and
+# positions reached along the way are not searched again. Returns the moves as (origin,
+# destination), with the bits and annotation of the command of the position they reach.
+def _next_command(position, streams):
+	seen = {(position.Board.zobrist, position.turn)}
+	frontier = [()]
+	for depth in range(SEARCH_DEPTH):
+		best = (0, None, None, None)
+		reached = []
+		for path in frontier:
+			for move in path:
+				position.make(*move)
+			for move in writing_moves(position):
+				position.make(*move)
+				key = (position.Board.zobrist, position.turn)
+				if key not in seen and not in_check(position):
+					seen.add(key)
+					reached.append(path + (move,))
+					bits = command_bits(position.Board)
+					written, annotation = streams.progress(bits)
+					if written > best[0]:
+						best = (written, annotation, bits, path + (move,))
+				position.unmake()
+			for move in path:
+				position.unmake()
+		if best[0]:
+			written, annotation, bits, path = best
+			return path, bits, annotation
+		frontier = reached
+	raise RuntimeError(f"No command found within {SEARCH_DEPTH} half-moves")
+
+# The moves of a game, as written with their annotations, that loads rules (a dict from
+# (state, symbol) to (next state, next symbol, direction), as in a Machine) and a tape (a list of
+# symbols) as a chessoteric program
+def synthesize(rules, tape):
+	parts = [value for (state, symbol), transition in rules.items() for value in (state, symbol) + tuple(transition)]
+	streams = Streams(parts, tape)
+	position = Position()
+	for name in OPENING:
+		try:
+			position.play(name)
+		except SyntaxError:
+			raise RuntimeError(f"Opening move is not legal: {name}")
+	names = list(OPENING)
+
+	while not streams.finished():
+		moves, bits, annotation = _next_command(position, streams)
+		# Writing moves neither capture nor give check
+		for origin, destination in moves:
+			names.append(move_san(position.Board, origin, destination))
+			position.make(origin, destination)
+		names[-1] += annotation
+		position.undo.clear()
+		streams.write(bits, annotation)
+	return names
+
+# The text of a game made of the moves, which ends in a draw
+def game_text(moves):
+	words = []
+	for i, move in enumerate(moves):
+		if i % 2 == 0:
+			words.append(f"{i // 2 + 1}.")
+		words.append(move)
+	words.append("1/2-1/2")
+	return ' '.join(words) + '\n'
+
+# The text of a game that loads the same rules and tape as the Machine mach. Unless told not to,
+# checks that the game does, raising a RuntimeError if it does not.
+def synthesize_machine(mach, verify=True):
+	rules = dict(mach.rules)
+	tape = mach.tape.tolist()
+	text = game_text(synthesize(rules, tape))
+	if verify:
+		loaded = Chessoteric.load_game(read_words(StringIO(text)))
+		if loaded.rules != rules or loaded.tape.tolist() != tape:
+			raise RuntimeError("Synthesized game does not load the same rules and tape")
+	return text
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Synthesizes a chessoteric program from a Binary Turing Machine!? program")
+	parser.add_argument("file", nargs="?", help="BTM program to translate (read from stdin if omitted)")
+	parser.add_argument("-o", "--output", metavar="FILE", help="write the game to FILE instead of stdout")
+	parser.add_argument("--no-verify", action="store_true",
+	                    help="do not check that the game loads the same rules and tape as the program")
+	args = parser.parse_args()
+
+	if args.file is not None:
+		machine = BTM.load_file(args.file)
+	else:
+		machine = BTM.load_code([line.rstrip("\n") for line in sys.stdin])
+	text = synthesize_machine(machine, not args.no_verify)
+	if args.output is not None:
+		with open(args.output, "w") as f:
+			f.write(text)
+	else:
+		sys.stdout.write(text)
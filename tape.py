@@ -0,0 +1,117 @@
+# Tape for the Turing Machine of the chessoteric programming language
+import sys
+from array import array
+
+BLANK = 0
+# Number of cells allocated at a time
+PAGE_SIZE = 4096
+# Array typecodes for pages, from smallest to largest. Pages holding symbols that are negative
+# or too large for any of them are stored as lists of Python ints instead.
+TYPECODES = ('B', 'H', 'I', 'Q')
+LIMITS = {typecode: 1 << (8 * array(typecode).itemsize) for typecode in TYPECODES}
+
+# Smallest typecode at least as large as typecode that can hold symbol, or None for a list
+def widen_typecode(typecode, symbol):
+	if typecode is None or symbol < 0:
+		return None
+	for candidate in TYPECODES[TYPECODES.index(typecode):]:
+		if symbol < LIMITS[candidate]:
+			return candidate
+	return None
+
+def _rank(typecode):
+	return len(TYPECODES) if typecode is None else TYPECODES.index(typecode)
+
+# A tape that is blank in both directions, stored in pages that are allocated when first used
+class Tape:
+	def __init__(self, symbols=(), page_size=PAGE_SIZE):
+		self.page_size = page_size
+		self.pages = {}
+		# Typecode of new pages
+		self.typecode = TYPECODES[0]
+		# Cells start up to end have been written to
+		self.start = 0
+		self.end = 0
+		for symbol in symbols:
+			self.append(symbol)
+
+	def _new_page(self):
+		if self.typecode is None:
+			return [BLANK] * self.page_size
+		return array(self.typecode, [BLANK]) * self.page_size
+
+	# Get page number, allocating it if it has not been used yet
+	def page(self, number):
+		page = self.pages.get(number)
+		if page is None:
+			page = self.pages[number] = self._new_page()
+		return page
+
+	def __getitem__(self, index):
+		page = self.pages.get(index // self.page_size)
+		if page is None:
+			return BLANK
+		return page[index % self.page_size]
+
+	def __setitem__(self, index, symbol):
+		number, offset = divmod(index, self.page_size)
+		page = self.page(number)
+		try:
+			page[offset] = symbol
+		except OverflowError:
+			typecode = widen_typecode(page.typecode, symbol)
+			page = self.pages[number] = list(page) if typecode is None else array(typecode, page)
+			page[offset] = symbol
+		if index >= self.end:
+			self.end = index + 1
+		if index < self.start:
+			self.start = index
+
+	def append(self, symbol):
+		self[self.end] = symbol
+
+	def __len__(self):
+		return self.end - self.start
+
+	# Make sure every page can hold any symbol from 0 up to symbol without widening
+	def reserve(self, symbol):
+		typecode = widen_typecode(self.typecode, symbol)
+		if typecode == self.typecode:
+			return
+		self.typecode = typecode
+		for number, page in self.pages.items():
+			if isinstance(page, array) and _rank(page.typecode) < _rank(typecode):
+				self.pages[number] = list(page) if typecode is None else array(typecode, page)
+
+	# A copy of the tape, sharing none of its pages
+	def copy(self):
+		tape = Tape(page_size=self.page_size)
+		tape.typecode = self.typecode
+		tape.start = self.start
+		tape.end = self.end
+		tape.pages = {number: page[:] for number, page in self.pages.items()}
+		return tape
+
+	# Index just past the last cell that is not blank (or start, if every cell is). Blank cells past
+	# it are left out whether or not they were written to, as the compiled engines write to pages
+	# directly without moving end, so that a tape reads the same after a run on any engine.
+	def last(self):
+		for number in sorted(self.pages, reverse=True):
+			page = self.pages[number]
+			for offset in range(self.page_size - 1, -1, -1):
+				if page[offset] != BLANK:
+					return max(number * self.page_size + offset + 1, self.start)
+		return self.start
+
+	# The symbols from the start of the tape to its last cell that is not blank
+	def tolist(self):
+		return [self[index] for index in range(self.start, self.last())]
+
+	# Number of bytes used by the pages of the tape
+	def memory_usage(self):
+		usage = sys.getsizeof(self.pages)
+		for page in self.pages.values():
+			usage += sys.getsizeof(page)
+			if not isinstance(page, array):
+				usage += sum(sys.getsizeof(symbol) for symbol in page if not -5 <= symbol <= 256)
+		return usage
@@ -0,0 +1,128 @@
+# Checks that every engine runs a Turing Machine the same way as the interpreter: the same output,
+# steps and tape, whether the machine halts, runs out of input or runs out of its budget
+import random
+from io import BytesIO, StringIO
+import pytest
+from Machine import BudgetExceeded, Budget, ENGINES, INITIAL_STATE, INPUT_STATE, OUTPUT_STATE, Machine
+from machine_io import MachineIO
+from tape import BLANK, PAGE_SIZE, Tape
+
+# Number of random machines, and the most steps each may take
+MACHINES = 150
+MAX_STEPS = 5000
+# Symbols of the random machines besides BLANK, with some that are not characters
+SYMBOLS = (1, 2, 3, 65, 72, 105, 0x110005)
+# Lines of input, with some that are not integers
+LINES = ("12", "-3", "ab", "", "0", "7x")
+
+# Rules, a tape and input for a machine that often reads, writes, loops and halts
+def random_machine(rng):
+	states = [INITIAL_STATE] + list(range(OUTPUT_STATE + 1, rng.randint(4, 12)))
+	symbols = sorted({BLANK} | set(rng.sample(SYMBOLS, rng.randint(1, 4))))
+	rules = {}
+	for state in states:
+		for symbol in symbols:
+			if rng.random() < 0.8:
+				next_state = rng.choice([INITIAL_STATE, INPUT_STATE, OUTPUT_STATE] + states * 2 + [state] * 4)
+				next_symbol = symbol if rng.random() < 0.5 else rng.choice(symbols)
+				rules[(state, symbol)] = (next_state, next_symbol, rng.randint(0, 3))
+	# Rules for the input and output states, which are never applied
+	if rng.random() < 0.3:
+		rules[(INPUT_STATE, BLANK)] = (states[-1], 5, 0)
+	if rng.random() < 0.3:
+		rules[(OUTPUT_STATE, BLANK)] = (states[-1], 5, 1)
+	tape = [rng.choice(symbols) for i in range(rng.randint(0, 30))]
+	if rng.random() < 0.5:
+		tape += [rng.choice(symbols)] * rng.randint(5, 200)
+	inputs = "\n".join(rng.choice(LINES) for i in range(rng.randint(0, 20)))
+	return rules, tape, inputs.encode()
+
+# Run mach with engine under a Budget of max_steps, returning how it stopped, its steps, its
+# output and its tape
+def run_outcome(mach, engine, inputs, max_steps=MAX_STEPS):
+	output = StringIO()
+	try:
+		steps = mach.run_machine(engine, MachineIO(BytesIO(inputs), output), Budget(max_steps))
+		status = "halted"
+	except BudgetExceeded as e:
+		status, steps = type(e).__name__, e.steps
+	except Exception as e:
+		status, steps = f"{type(e).__name__}: {e}", None
+	return status, steps, output.getvalue(), mach.tape.tolist()
+
+def run(engine, rules, tape, inputs, max_steps=MAX_STEPS, page_size=PAGE_SIZE):
+	mach = Machine()
+	mach.rules = dict(rules)
+	mach.tape = Tape(tape, page_size)
+	return run_outcome(mach, engine, inputs, max_steps)
+
+def assert_engines_agree(rules, tape, inputs, max_steps=MAX_STEPS, page_size=PAGE_SIZE):
+	expected = run("interpreted", rules, tape, inputs, max_steps, page_size)
+	for engine in ENGINES:
+		assert run(engine, rules, tape, inputs, max_steps, page_size) == expected, engine
+	return expected
+
+# Each machine is run to the end (or MAX_STEPS), and again with a budget that stops it halfway
+@pytest.mark.parametrize("seed", range(MACHINES))
+def test_random_machines(seed):
+	rules, tape, inputs = random_machine(random.Random(seed))
+	status, steps, output, final = assert_engines_agree(rules, tape, inputs)
+	if steps is not None and steps > 1:
+		stopped = assert_engines_agree(rules, tape, inputs, steps // 2)
+		assert stopped[:2] == ("StepLimitExceeded", steps // 2)
+
+# The random machines cover every way a run can end
+def test_random_machines_end_every_way():
+	statuses = set()
+	for seed in range(MACHINES):
+		status = run("interpreted", *random_machine(random.Random(seed)))[0]
+		statuses.add(status.partition(":")[0])
+	assert {"halted", "StepLimitExceeded", "EOFError"} <= statuses
+
+# A machine that scans right over repeats of a cycle of length symbols from 1 up, writing others
+# in their place, turns at the blank after them and scans back restoring them, then outputs them
+# all. Its tape starts with 9, on which the scan back ends before the output starts.
+def scanning_machine(length, repeats):
+	rules = {(INITIAL_STATE, 9): (10, 9, 0)}
+	for i in range(length):
+		rules[(10 + i, 1 + i)] = (10 + (i + 1) % length, 11 + i, 0)
+		rules[(20 + i, 11 + i)] = (20 + (i - 1) % length, 1 + i, 1)
+	rules[(10, BLANK)] = (20 + length - 1, BLANK, 1)
+	rules[(20 + length - 1, 9)] = (OUTPUT_STATE, 9, 0)
+	return rules, [9] + list(range(1, length + 1)) * repeats
+
+# Cycles applied as macro steps stop at the edges of pages and go on in the next one, including
+# when a repeat of the cycle straddles the edge, and when the budget runs out partway
+@pytest.mark.parametrize("length", (1, 2, 3))
+@pytest.mark.parametrize("page_size", (1, 2, 3, 5, 8, 64))
+def test_cycles_across_pages(length, page_size):
+	rules, tape = scanning_machine(length, 40)
+	status, steps, output, final = assert_engines_agree(rules, tape, b"", page_size=page_size)
+	assert status == "halted" and final == tape and output == "".join(map(chr, tape[1:]))
+	for max_steps in range(1, steps, 7):
+		assert assert_engines_agree(rules, tape, b"", max_steps, page_size)[:2] == ("StepLimitExceeded", max_steps)
+
+@pytest.mark.parametrize("page_size", (1, 3, 16))
+@pytest.mark.parametrize("seed", range(0, MACHINES, 5))
+def test_random_machines_small_pages(seed, page_size):
+	rules, tape, inputs = random_machine(random.Random(seed))
+	assert_engines_agree(rules, tape, inputs, page_size=page_size)
+
+# The table engine keeps the RuleTable of a Machine between runs, as the server does, and interns
+# the symbols of each run's tape and input that no rule mentions without adding them to it
+@pytest.mark.parametrize("seed", range(0, MACHINES, 5))
+def test_table_reused(seed):
+	rng = random.Random(seed)
+	rules, tape, inputs = random_machine(rng)
+	mach = Machine()
+	mach.rules = dict(rules)
+	table = mach.rule_table()
+	symbols, states = list(table.symbols), list(table.states)
+	for i in range(5):
+		run_tape = tape + [1000 + i, rng.choice(SYMBOLS)]
+		run_inputs = inputs + f"\n{2000 + i}\nxyz{i}".encode()
+		expected = run("interpreted", rules, run_tape, run_inputs)
+		mach.tape = Tape(run_tape)
+		assert run_outcome(mach, "table", run_inputs) == expected
+		assert mach.rule_table() is table
+		assert table.symbols == symbols and table.states == states
@@ -0,0 +1,73 @@
+# Checks the legal move generator against the known perft counts, and check, checkmate and
+# stalemate detection on positions given in FEN
+import pytest
+from chess_game import Position, position_status, read_fen
+from movegen import has_legal_move, legal_moves
+from perft import REFERENCE, divide, perft, perft_san
+
+# Depth each reference position is counted to, kept shallow so that the tests run quickly
+DEPTHS = {"start": 3, "kiwipete": 2, "endgame": 3, "promotion": 2, "check": 2}
+COUNTS = {name: (fen, counts) for name, fen, counts in REFERENCE}
+
+# Positions with whether the side to move is in check, and whether it has a legal move: in check
+# without one is checkmate, and out of check without one is stalemate
+STATUSES = (
+	# Fool's mate
+	("rnb1kbnr/pppp1ppp/8/4p3/6Pq/5P2/PPPPP2P/RNBQKBNR w KQkq - 1 3", True, False),
+	# Back rank mate
+	("3R2k1/5ppp/8/8/8/8/8/6K1 b - - 0 1", True, False),
+	# Smothered mate
+	("6rk/5Npp/8/8/8/8/8/6K1 b - - 0 1", True, False),
+	# Checks escaped by taking the checking piece, and by moving the king
+	("4k3/8/8/8/8/8/3r4/3K4 w - - 0 1", True, True),
+	("4k3/8/8/8/8/8/4Q3/4K3 b - - 0 1", True, True),
+	# A check by a pawn that only taking it en passant escapes
+	("2K5/8/1Q6/3k4/1pP2R2/3N4/8/8 b - c3 0 1", True, True),
+	# Stalemates, one with a piece pinned to its king
+	("7k/5Q2/6K1/8/8/8/8/8 b - - 0 1", False, False),
+	("k7/Pr6/8/1N6/4B3/8/8/K7 b - - 0 1", False, False),
+	("8/8/8/8/8/5k2/5p2/5K2 w - - 0 1", False, False),
+)
+
+def _snapshot(position):
+	Board = position.Board
+	return (Board.zobrist, dict(Board.bitboards), dict(Board.colors), Board.occupied, dict(Board.attacked),
+	        Board.castling, Board.en_passant, position.turn)
+
+@pytest.mark.parametrize("name", sorted(DEPTHS))
+def test_reference_counts(name):
+	fen, counts = COUNTS[name]
+	depth = DEPTHS[name]
+	assert perft(Position(*read_fen(fen)), depth) == counts[depth - 1]
+
+# Playing every move as it would be written in a game finds the same moves
+@pytest.mark.parametrize("name", ("kiwipete", "promotion", "check"))
+def test_reference_counts_san(name):
+	fen, counts = COUNTS[name]
+	assert perft_san(Position(*read_fen(fen)), 2) == counts[1]
+
+def test_divide():
+	fen, counts = COUNTS["kiwipete"]
+	moves = divide(Position(*read_fen(fen)), 2)
+	assert len(moves) == counts[0]
+	assert sum(count for move, count in moves) == counts[1]
+
+# Every move made is taken back, leaving the position as it was
+@pytest.mark.parametrize("name", sorted(DEPTHS))
+def test_unmake(name):
+	fen, counts = COUNTS[name]
+	position = Position(*read_fen(fen))
+	before = _snapshot(position)
+	perft(position, 3)
+	assert position.undo == []
+	assert _snapshot(position) == before
+
+@pytest.mark.parametrize("fen, checked, movable", STATUSES)
+def test_position_status(fen, checked, movable):
+	Board, pieces, turn = read_fen(fen)
+	# position_status is asked about the side to move, after the other side has moved
+	in_check, checkmate = position_status(Board, pieces, 'b' if turn == 'w' else 'w')
+	assert in_check == checked
+	assert checkmate == (checked and not movable)
+	assert has_legal_move(Board, turn) == movable
+	assert bool(legal_moves(Board, turn)) == movable